@@ -0,0 +1,48 @@
+"""
+Shared bootstrap for the diagnostic scripts.
+Run them as modules from the project root, e.g.: python -m _debug_tools.trace_save
+"""
+import os
+import sys
+import functools
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PROJECT_ROOT not in sys.path:
+    sys.path.append(PROJECT_ROOT)
+
+@functools.lru_cache(maxsize=1)
+def get_client():
+    """Supabase client shared by every debug tool in the process (None in local mode)."""
+    from modules.supabase_service import init_supabase
+    return init_supabase()
+
+class _Section:
+    """
+    Buffers a diagnostic section and emits it with a single sys.stdout.write on exit.
+    Usage: with _Section("[2] CARGANDO HISTORIAL...") as log: log("   ✅ ...")
+    Entering a nested section flushes the enclosing one first, so output order is preserved.
+    """
+    _open = []
+    
+    def __init__(self, title: str = None):
+        self.lines = [] if title is None else [title]
+    
+    def __call__(self, *parts):
+        self.lines.append(" ".join(str(p) for p in parts))
+    
+    def flush(self):
+        if self.lines:
+            sys.stdout.write("\n".join(self.lines) + "\n")
+            sys.stdout.flush()
+            self.lines = []
+    
+    def __enter__(self):
+        if _Section._open:
+            _Section._open[-1].flush()
+        _Section._open.append(self)
+        return self
+    
+    def __exit__(self, exc_type, exc, tb):
+        _Section._open.remove(self)
+        self.flush()
+        return False
@@ -1,27 +1,38 @@
-import sys
-sys.path.append('.')
-from modules.supabase_service import init_supabase
+from _debug_tools import get_client, _Section
+from modules.supabase_service import _decode_bytea
 
-client = init_supabase()
-if client:
-    res = client.table('inscripciones').select('name, data, columns').eq('name', 'LNC_Enero_2026').execute()
+SESSION_NAME = 'LNC_Enero_2026'
+
+with _Section() as log:
+    client = get_client()
+    if client:
+        # Server-side inspection (see inspect_session() in supabase_schema.sql):
+        # only ~1 KB of metadata is transferred instead of the whole payload.
+        res = client.rpc('inspect_session', {'session_name': SESSION_NAME}).execute()
     
-    if res.data:
-        row = res.data[0]
-        print(f"Session: {row['name']}")
-        print(f"Data type: {type(row['data'])}")
+        if res.data:
+            row = res.data[0]
+            log(f"Session: {row['name']}")
+        
+            if row.get('parquet_bytes'):
+                log(f"Data is PARQUET ({row['parquet_bytes']} bytes)")
+        
+            # Schema preview from the 'columns' metadata; first_keys is only a fallback
+            keys = row.get('columns') or row.get('first_keys')
+            if keys:
+                log(f"First item keys: {keys[:5]}")
         
-        data = row['data']
-        if isinstance(data, list):
-            print(f"Data is list with {len(data)} items")
-            if data:
-                print(f"First item keys: {list(data[0].keys())[:5]}")
-        elif isinstance(data, str):
-            print(f"Data is STRING (length {len(data)})")
-            print(f"First 200 chars: {data[:200]}")
+            dtype = row.get('dtype')
+            log(f"Data type: {dtype}")
+            if dtype == 'array':
+                log(f"Data is list with {row['n']} items")
+            elif dtype == 'string':
+                log(f"Data is STRING (length {row['n']} bytes)")
+                preview = memoryview(_decode_bytea(row['preview']) or b'')[:200]
+                log(f"First 200 bytes: {bytes(preview).decode('utf-8', errors='replace')}")
+            elif dtype is not None:
+                log(f"Data is {dtype}")
         else:
-            print(f"Data is {type(data)}")
+            log("Session not found")
     else:
-        print("Session not found")
-else:
-    print("Supabase client not initialized")
+        log("Supabase client not initialized")
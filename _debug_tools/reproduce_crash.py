@@ -1,47 +1,85 @@
 
-import sys
+from _debug_tools import _Section
+from modules.state import load_session_data, load_history, session_schema_path
 import os
-sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from modules.state import load_session_data, load_history
+import sys
 import traceback
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
 import pandas as pd
 
-print("--- REPRODUCE CRASH ---")
-history = load_history()
-if history:
-    # Sort to get latest
-    sorted_sessions = sorted(
-        history.items(), 
-        key=lambda x: x[1].get('timestamp', '') or '', 
-        reverse=True
-    )
-    latest = sorted_sessions[0][0]
-    print(f"Target Session: {latest}")
-    
+UNHASHABLE_TYPES = (list, dict, set)
+UNHASHABLE_NAMES = {t.__name__ for t in UNHASHABLE_TYPES}
+# python -m _debug_tools.reproduce_crash --fail-fast : stop at the first unhashable column
+FAIL_FAST = '--fail-fast' in sys.argv
+
+def _probe_col(df, col):
+    """Returns (col, mask of unhashable cells), or (col, None) if every cell is hashable."""
     try:
-        # Load data
-        df = load_session_data(latest)
-        print(f"Loaded Shape: {df.shape}")
+        # Cheap C-level pre-test: hashes every cell, raises on list/dict/set
+        pd.unique(df[col].to_numpy())
+        return col, None
+    except TypeError:
+        pass
+    mask = df[col].map(lambda v: isinstance(v, UNHASHABLE_TYPES)).to_numpy(dtype=bool)
+    return col, (mask if mask.any() else None)
+
+def _session_timestamp(item):
+    return item[1].get('timestamp', '') or ''
+
+with _Section("--- REPRODUCE CRASH ---") as log:
+    history = load_history()
+    if history:
+        # Latest session (single pass, no full sort)
+        latest = max(history.items(), key=_session_timestamp)[0]
+        log(f"Target Session: {latest}")
+        
+        # Fast path: the schema snapshot written next to the session (KBs, not MBs)
+        schema_file = session_schema_path(latest)
+        suspicious = True
+        if os.path.exists(schema_file):
+            schema = pd.read_parquet(schema_file)
+            is_object = schema['dtype'] == 'object'
+            if 'has_unhashable' in schema.columns:
+                # Flag computed over every row when the snapshot was written
+                flagged = schema[is_object & (schema['has_unhashable'] | schema['sample_type'].isin(UNHASHABLE_NAMES))]
+            else:
+                # Older snapshots only have the first sample: any object column may hide a list
+                flagged = schema[is_object]
+            log(f"Schema file: {len(schema)} columns, {len(flagged)} suspicious")
+            for _, r in flagged.iterrows():
+                log(f"⚠️ '{r['col']}' (object, first sample {r['sample_type']}: {r['sample_repr']})")
+            suspicious = not flagged.empty
         
-        # Check for unhashable columns
-        print("Checking hashability of columns...")
-        for col in df.columns:
-            # We suspect keys used for grouping/factorizing: Club, Pruebas, Entity...
+        if not suspicious:
+            log("Schema OK, skipping full load.")
+        else:
             try:
-                # factorize is what failed in the log
-                pd.factorize(df[col]) 
-            except TypeError as Te:
-                if "unhashable" in str(Te):
-                    print(f"❌ '{col}' IS UNHASHABLE (List?!). Sample: {df[col].iloc[0]}")
-                else:
-                    print(f"⚠️ '{col}' raised other TypeError: {Te}")
-            except Exception as e:
-                 print(f"⚠️ '{col}' raised {type(e).__name__}: {e}")
-                 
-        print("Done.")
+                # Load data
+                df = load_session_data(latest)
+                log(f"Loaded Shape: {df.shape}")
+            
+                # Check for unhashable columns
+                # Only object columns can hold list/dict/set cells; numeric/bool arrays are always hashable
+                log("Checking hashability of columns...")
+                suspect = df.select_dtypes(include=['object']).columns
+                with ThreadPoolExecutor(max_workers=os.cpu_count()) as ex:
+                    # ex.map yields in column order regardless of completion order
+                    for col, mask in ex.map(lambda c: _probe_col(df, c), suspect):
+                        if mask is None:
+                            continue
+                        bad_rows = np.flatnonzero(mask)[:5]
+                        sample = df[col].iloc[bad_rows[0]]
+                        log(f"❌ '{col}' IS UNHASHABLE ({type(sample).__name__}). Rows {bad_rows.tolist()}: {sample}")
+                        if FAIL_FAST:
+                            ex.shutdown(wait=False, cancel_futures=True)
+                            break
+                     
+                log("Done.")
 
-    except Exception as e:
-        print("CRITICAL CRASH during load:")
-        traceback.print_exc()
-else:
-    print("No history found.")
+            except Exception as e:
+                log("CRITICAL CRASH during load:")
+                log.flush()
+                traceback.print_exc()
+    else:
+        log("No history found.")
@@ -1,94 +1,134 @@
 """
 Diagnostic script to trace save/load flow and identify issues.
-Run from project root: python _debug_tools/trace_save.py
+Run from project root: python -m _debug_tools.trace_save
 """
-import sys, os
-sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-
+from _debug_tools import get_client, _Section
 from modules.state import (
     load_history, 
     load_session_data, 
     save_current_session, 
     is_cloud_mode,
-    init_db,
     DB_AVAILABLE
 )
+if DB_AVAILABLE:
+    from modules.supabase_service import (
+        _df_to_parquet_bytes, _parquet_bytes_to_df, _encode_bytea, _decode_bytea
+    )
+import heapq
+import pickle
 import pandas as pd
+import pyarrow as pa
 from datetime import datetime
 
-print("=" * 60)
-print("DIAGNÓSTICO DE PERSISTENCIA - FLUJO COMPLETO")
-print("=" * 60)
+def _session_timestamp(item):
+    return item[1].get('timestamp', '') or ''
+
+def _fast_roundtrip(df):
+    """Serialize df as an Arrow table with pickle protocol 5 (zero-copy buffers). Returns (df, nbytes)."""
+    payload = pickle.dumps(pa.Table.from_pandas(df, preserve_index=False), protocol=5)
+    return pickle.loads(payload).to_pandas(), len(payload)
+
+def _check_reloaded(log, df_reloaded):
+    if df_reloaded is not None and not df_reloaded.empty:
+        log(f"   ✅ Sesión recargada: {len(df_reloaded)} filas")
+        if "TEST_PLAYER" in str(df_reloaded['Jugador'].values):
+            log(f"   ✅ Datos COINCIDEN (TEST_PLAYER encontrado)")
+        else:
+            log(f"   ❌ Datos NO coinciden!")
+            log(f"      Esperado: TEST_PLAYER")
+            log(f"      Encontrado: {df_reloaded['Jugador'].values}")
+    else:
+        log(f"   ❌ ERROR: Sesión recargada está vacía o es None")
+
+with _Section() as log:
+    log("=" * 60)
+    log("DIAGNÓSTICO DE PERSISTENCIA - FLUJO COMPLETO")
+    log("=" * 60)
 
 # 1. Check Cloud Mode
-print("\n[1] VERIFICANDO MODO DE ALMACENAMIENTO...")
-if DB_AVAILABLE:
-    init_db()
-    cloud = is_cloud_mode()
-    print(f"   ✅ DB_AVAILABLE = True")
-    print(f"   ☁️ is_cloud_mode() = {cloud}")
-else:
-    print(f"   ❌ DB_AVAILABLE = False (operando en modo LOCAL)")
+with _Section("\n[1] VERIFICANDO MODO DE ALMACENAMIENTO...") as log:
+    cloud = False
+    if DB_AVAILABLE:
+        get_client()
+        cloud = is_cloud_mode()
+        log(f"   ✅ DB_AVAILABLE = True")
+        log(f"   ☁️ is_cloud_mode() = {cloud}")
+    else:
+        log(f"   ❌ DB_AVAILABLE = False (operando en modo LOCAL)")
 
 # 2. Load History
-print("\n[2] CARGANDO HISTORIAL...")
-history = load_history()
+with _Section("\n[2] CARGANDO HISTORIAL...") as log:
+    history = load_history()
+    if history:
+        log(f"   ✅ {len(history)} sesiones encontradas:")
+        # Top 5 most recent (heap of size 5 instead of sorting the whole history)
+        sorted_sessions = heapq.nlargest(5, history.items(), key=_session_timestamp)
+        for name, meta in sorted_sessions:
+            ts = meta.get('timestamp', '?')
+            count = meta.get('count', '?')
+            log(f"      - '{name}' | {ts} | {count} filas")
+    else:
+        log(f"   ⚠️ Historial vacío - no hay sesiones guardadas")
+
+df = None
 if history:
-    print(f"   ✅ {len(history)} sesiones encontradas:")
-    sorted_sessions = sorted(
-        history.items(), 
-        key=lambda x: x[1].get('timestamp', '') or '', 
-        reverse=True
-    )
-    for name, meta in sorted_sessions[:5]:
-        ts = meta.get('timestamp', '?')
-        count = meta.get('count', '?')
-        print(f"      - '{name}' | {ts} | {count} filas")
-    
     # 3. Load latest session
-    print("\n[3] CARGANDO SESIÓN MÁS RECIENTE...")
-    latest_name = sorted_sessions[0][0]
-    df = load_session_data(latest_name)
-    if df is not None and not df.empty:
-        print(f"   ✅ Sesión '{latest_name}' cargada: {len(df)} filas")
-        
-        # 4. Test SAVE
-        print("\n[4] PROBANDO GUARDADO...")
+    with _Section("\n[3] CARGANDO SESIÓN MÁS RECIENTE...") as log:
+        latest_name = sorted_sessions[0][0]
+        df = load_session_data(latest_name)
+        if df is not None and not df.empty:
+            log(f"   ✅ Sesión '{latest_name}' cargada: {len(df)} filas")
+        else:
+            log(f"   ❌ ERROR al cargar '{latest_name}'")
+
+if df is not None and not df.empty:
+    # 4. Test SAVE
+    with _Section("\n[4] PROBANDO GUARDADO...") as log:
         test_session_name = f"_diag_test_{datetime.now().strftime('%H%M%S')}"
         
         # Create a tiny test DF
         test_df = pd.DataFrame([{"Nº.ID": 99999, "Jugador": "TEST_PLAYER", "Pruebas": "TEST_TEAM"}])
         
-        success, msg = save_current_session(test_session_name, test_df)
-        print(f"   save_current_session('{test_session_name}', df)")
-        print(f"   Resultado: success={success}, msg='{msg}'")
+        # Serialization identity check (no network involved)
+        df_rt, rt_bytes = _fast_roundtrip(test_df)
+        log(f"   Round-trip Arrow/pickle5: {rt_bytes} bytes, identico={df_rt.equals(test_df)}")
         
-        # 5. Verify it was saved
-        print("\n[5] VERIFICANDO GUARDADO...")
-        history_after = load_history()
-        if test_session_name in history_after:
-            print(f"   ✅ La sesión '{test_session_name}' ESTÁ en el historial")
-            
-            # 6. Load it back
-            df_reloaded = load_session_data(test_session_name)
-            if df_reloaded is not None and not df_reloaded.empty:
-                print(f"   ✅ Sesión recargada: {len(df_reloaded)} filas")
-                if "TEST_PLAYER" in str(df_reloaded['Jugador'].values):
-                    print(f"   ✅ Datos COINCIDEN (TEST_PLAYER encontrado)")
-                else:
-                    print(f"   ❌ Datos NO coinciden!")
-                    print(f"      Esperado: TEST_PLAYER")
-                    print(f"      Encontrado: {df_reloaded['Jugador'].values}")
+        if cloud:
+            # 4+5+6 in a single round-trip: upsert and get the stored row back
+            # (save_and_return_history() in supabase_schema.sql)
+            res = get_client().rpc('save_and_return_history', {
+                'session_name': test_session_name,
+                'session_columns': list(test_df.columns),
+                'payload': _encode_bytea(_df_to_parquet_bytes(test_df)),
+            }).execute()
+            log(f"   rpc('save_and_return_history', '{test_session_name}')")
+        else:
+            success, msg = save_current_session(test_session_name, test_df)
+            log(f"   save_current_session('{test_session_name}', df)")
+            log(f"   Resultado: success={success}, msg='{msg}', bytes={rt_bytes}")
+    
+    # 5. Verify it was saved
+    with _Section("\n[5] VERIFICANDO GUARDADO...") as log:
+        if cloud:
+            if res.data:
+                log(f"   ✅ La sesión '{test_session_name}' ESTÁ en la tabla")
+                df_reloaded = _parquet_bytes_to_df(_decode_bytea(res.data[0].get('data_parquet')))
+                _check_reloaded(log, df_reloaded)
             else:
-                print(f"   ❌ ERROR: Sesión recargada está vacía o es None")
+                log(f"   ❌ La sesión '{test_session_name}' NO fue devuelta por la RPC!")
         else:
-            print(f"   ❌ La sesión '{test_session_name}' NO está en el historial!")
-            print(f"      Claves disponibles: {list(history_after.keys())}")
-    else:
-        print(f"   ❌ ERROR al cargar '{latest_name}'")
-else:
-    print(f"   ⚠️ Historial vacío - no hay sesiones guardadas")
+            # Fresh fetch ([2] and [3] share the `history` loaded once above)
+            history_after = load_history()
+            if test_session_name in history_after:
+                log(f"   ✅ La sesión '{test_session_name}' ESTÁ en el historial")
+                
+                # 6. Load it back
+                _check_reloaded(log, load_session_data(test_session_name))
+            else:
+                log(f"   ❌ La sesión '{test_session_name}' NO está en el historial!")
+                log(f"      Claves disponibles: {list(history_after.keys())}")
 
-print("\n" + "=" * 60)
-print("FIN DEL DIAGNÓSTICO")
-print("=" * 60)
+with _Section() as log:
+    log("\n" + "=" * 60)
+    log("FIN DEL DIAGNÓSTICO")
+    log("=" * 60)
@@ -1,10 +1,15 @@
 import streamlit as st
 import pandas as pd
+import numpy as np
 import io
 import os
-import json
+import orjson
+import pyarrow.parquet as pq
+import re
 import plotly.express as px
 from datetime import datetime
+from collections import defaultdict
+from functools import partial
 from st_aggrid import AgGrid, GridOptionsBuilder, GridUpdateMode, DataReturnMode
 import time
 import importlib
@@ -13,21 +18,27 @@ import license_validator
 import rules_manager
 
 # FORCE RELOAD to avoid stale code on network drive (since fileWatcher is disabled)
-importlib.reload(data_processing)
-importlib.reload(license_validator)
-importlib.reload(rules_manager)
+# Only when LNC_FORCE_RELOAD=1: otherwise every rerun re-executes the three modules.
+if os.environ.get('LNC_FORCE_RELOAD') == '1':
+    importlib.reload(data_processing)
+    importlib.reload(license_validator)
+    importlib.reload(rules_manager)
 
 from data_processing import (
     load_data, 
     process_dataframe, 
     generate_players_csv, 
     generate_team_players_csv,
-    calculate_team_compliance,
-    apply_comprehensive_check,
-    merge_dataframes_with_log
+    calculate_team_compliance_cached,
+    apply_comprehensive_check_cached,
+    audit_fingerprint,
+    merge_dataframes_with_log,
+    concat_rows,
+    decategorize_columns
 )
 from license_validator import validator, FESBA_LOGIN_URL
 from rules_manager import RulesManager
+from utils import arrow_table_to_df
 import logging
 from pathlib import Path
 
@@ -55,7 +66,17 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 # Archivo de persistencia local (Ruta Absoluta)
+# Legacy: historial monolítico, solo se lee una vez para migrarlo a HISTORY_DIR
 PERSISTENCE_FILE = os.path.join(BASE_DIR, "historial_inscripciones.json")
+# Historial fragmentado: un JSON por sesión + índice ligero {nombre: {file, timestamp}}
+HISTORY_DIR = os.path.join(LOG_DIR, "history")
+HISTORY_INDEX = os.path.join(HISTORY_DIR, "_index.json")
+
+# Columnas que el editor de revisión permite modificar (el resto van disabled)
+EDITABLE_COLS = ['Declaración_Jurada', 'Documento_Cesión', 'Notas_Revision']
+
+# Plantilla vacía del editor de añadidos manuales (se copia, no se reconstruye en cada rerun)
+_EMPTY_MANUAL = pd.DataFrame({"Nº.ID": [""], "Equipo": [""]})
 
 # Inicializar Gestor de Reglas
 rules_manager = RulesManager()
@@ -151,59 +172,187 @@ st.markdown("""
 """, unsafe_allow_html=True)
 
 # --- Funciones de Utilidad ---
-def load_history():
-    if os.path.exists(PERSISTENCE_FILE):
+class _LazySession(dict):
+    """
+    Metadatos de una sesión; history[name]['data'] lee su archivo (Parquet, o JSON
+    en sesiones antiguas) solo al primer acceso y lo devuelve como DataFrame.
+    """
+    def __init__(self, meta, path):
+        super().__init__(meta)
+        self._path = path
+
+    def __missing__(self, key):
+        if key != 'data':
+            raise KeyError(key)
         try:
-            with open(PERSISTENCE_FILE, 'r', encoding='utf-8') as f:
-                return json.load(f)
+            if self._path.endswith('.parquet'):
+                self['data'] = arrow_table_to_df(pq.read_table(self._path))
+            else:
+                self['data'] = pd.DataFrame(_read_json(self._path).get('data', []))
+        except Exception as e:
+            logger.error(f"Error leyendo sesión {self._path}: {e}")
+            self['data'] = pd.DataFrame()
+        return self['data']
+
+def _session_file_stem(file_name, history=None):
+    """Nombre de archivo seguro (sin extensión), sin pisar archivos de otras sesiones del índice."""
+    base = re.sub(r'[^\w\-. ]', '_', str(file_name))
+    used = {os.path.splitext(meta.get('file') or '')[0] for meta in (history or {}).values()}
+    candidate, n = base, 1
+    while candidate in used:
+        candidate, n = f"{base}_{n}", n + 1
+    return candidate
+
+def _json_default(obj):
+    """orjson solo llama aquí para los tipos que no serializa en C (Timestamp, Period, NA/NaT)."""
+    if obj is pd.NA or obj is pd.NaT:
+        return None
+    if isinstance(obj, (pd.Timestamp, pd.Period)):
+        return obj.strftime("%Y-%m-%d %H:%M:%S")
+    raise TypeError(f"Type is not JSON serializable: {type(obj).__name__}")
+
+def _write_json_atomic(path, obj):
+    """Escribe en un .tmp y lo renombra (os.replace es atómico en el mismo sistema de archivos)."""
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(orjson.dumps(obj, default=_json_default, option=orjson.OPT_INDENT_2 | orjson.OPT_SERIALIZE_NUMPY))
+    os.replace(tmp_path, path)
+
+def _write_parquet_atomic(path, df):
+    tmp_path = path + ".tmp"
+    df.to_parquet(tmp_path, engine='pyarrow', compression='zstd', index=False)
+    os.replace(tmp_path, path)
+
+def _read_json(path):
+    with open(path, 'rb') as f:
+        return orjson.loads(f.read())
+
+def _load_index():
+    if os.path.exists(HISTORY_INDEX):
+        try:
+            return _read_json(HISTORY_INDEX)
         except:
             return {}
     return {}
 
-# Custom JSON Encoder for DateTime
-class DateTimeEncoder(json.JSONEncoder):
-    def default(self, obj):
-        if isinstance(obj, (pd.Timestamp, datetime, pd.Period)):
-            return obj.strftime("%Y-%m-%d %H:%M:%S")
-        if isinstance(obj, pd.NA):
-            return None
-        return super().default(obj)
+def _migrate_legacy_history():
+    """Primera ejecución: reparte historial_inscripciones.json en un archivo por sesión."""
+    if os.path.exists(HISTORY_INDEX) or not os.path.exists(PERSISTENCE_FILE):
+        return
+    os.makedirs(HISTORY_DIR, exist_ok=True)
+    try:
+        legacy = _read_json(PERSISTENCE_FILE)
+    except:
+        legacy = {}
+    index = {}
+    for name, entry in legacy.items():
+        file = _session_file_stem(name) + ".json"
+        _write_json_atomic(os.path.join(HISTORY_DIR, file), entry)
+        index[name] = {"file": file, "timestamp": entry.get("timestamp", "")}
+    _write_json_atomic(HISTORY_INDEX, index)
+    logger.info(f"Historial migrado a {HISTORY_DIR} ({len(index)} sesiones)")
+
+def load_history():
+    """{nombre: metadatos}. Solo lee el índice; los datos de cada sesión se cargan bajo demanda."""
+    _migrate_legacy_history()
+    return {
+        name: _LazySession(meta, os.path.join(HISTORY_DIR, meta.get("file") or _session_file_stem(name) + ".json"))
+        for name, meta in _load_index().items()
+    }
+
+def _get_history_cached():
+    """load_history() memoized in session_state, keyed on the index's mtime (reruns skip the JSON parse)."""
+    mtime = os.path.getmtime(HISTORY_INDEX) if os.path.exists(HISTORY_INDEX) else None
+    if mtime is not None and st.session_state.get('_hist_mtime') == mtime:
+        return st.session_state['_hist_cache']
+    history = load_history()
+    st.session_state['_hist_cache'] = history
+    st.session_state['_hist_mtime'] = mtime
+    return history
 
 def save_history(history_dict):
+    """Guarda solo el índice (los datos de cada sesión viven en su propio archivo)."""
+    st.session_state.pop('_hist_mtime', None)
     try:
-        with open(PERSISTENCE_FILE, 'w', encoding='utf-8') as f:
-            json.dump(history_dict, f, indent=4, ensure_ascii=False, cls=DateTimeEncoder)
+        os.makedirs(HISTORY_DIR, exist_ok=True)
+        index = {
+            name: {k: v for k, v in meta.items() if k != 'data'}
+            for name, meta in history_dict.items()
+        }
+        _write_json_atomic(HISTORY_INDEX, index)
         return True
     except Exception as e:
         st.error(f"Error guardando historial: {e}")
         return False
 
 def save_current_session(file_name, df):
+    st.session_state.pop('_metrics_fp', None)
+    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
     history = load_history()
-    df_save = df.copy()
-    for col in df_save.select_dtypes(include=['datetime64[ns]']).columns:
-        df_save[col] = df_save[col].dt.strftime('%Y-%m-%d')
-    data_records = df_save.to_dict(orient='records')
-    history[file_name] = {
-        "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-        "data": data_records
-    }
+    old_file = history[file_name].get('file') if file_name in history else None
+    stem = os.path.splitext(old_file)[0] if old_file else _session_file_stem(file_name, history)
+    try:
+        os.makedirs(HISTORY_DIR, exist_ok=True)
+        try:
+            # Columnar + zstd: sin dict por fila, tipos (fechas incluidas) preservados
+            file = stem + ".parquet"
+            _write_parquet_atomic(os.path.join(HISTORY_DIR, file), df)
+        except Exception as e:
+            # Columnas de tipo mixto (p.ej. IDs int/str) no caben en Parquet: registros JSON
+            logger.warning(f"Parquet no disponible para '{file_name}', usando JSON: {e}")
+            df_save = df.copy()
+            for col in df_save.select_dtypes(include=['datetime64[ns]']).columns:
+                df_save[col] = df_save[col].dt.strftime('%Y-%m-%d')
+            file = stem + ".json"
+            _write_json_atomic(os.path.join(HISTORY_DIR, file), {"timestamp": timestamp, "data": df_save.to_dict(orient='records')})
+    except Exception as e:
+        st.error(f"Error guardando historial: {e}")
+        return
+    if old_file and old_file != file and os.path.exists(os.path.join(HISTORY_DIR, old_file)):
+        os.remove(os.path.join(HISTORY_DIR, old_file))
+    history[file_name] = {"file": file, "timestamp": timestamp}
     save_history(history)
 
 def delete_session(file_name):
     history = load_history()
     if file_name in history:
-        del history[file_name]
+        file = history.pop(file_name).get('file')
+        session_path = os.path.join(HISTORY_DIR, file) if file else None
+        if session_path and os.path.exists(session_path):
+            os.remove(session_path)
         save_history(history)
         return True
     return False
 
+def rename_session(old_name, new_name):
+    """Renombra una sesión con os.rename de su archivo + el índice (sin re-serializar los datos)."""
+    if new_name == old_name:
+        return True
+    history = load_history()
+    if old_name not in history or new_name in history:
+        return False
+    meta = history.pop(old_name)
+    file = meta.get('file')
+    if file:
+        new_file = _session_file_stem(new_name, history) + os.path.splitext(file)[1]
+        try:
+            os.rename(os.path.join(HISTORY_DIR, file), os.path.join(HISTORY_DIR, new_file))
+            file = new_file
+        except OSError as e:
+            logger.warning(f"No se pudo renombrar {file}: {e}")
+    history[new_name] = {"file": file, "timestamp": meta.get('timestamp', '')}
+    return save_history(history)
+
 def to_excel(df):
     output = io.BytesIO()
-    with pd.ExcelWriter(output, engine='openpyxl') as writer:
+    # xlsxwriter: bastante más rápido y ligero que openpyxl para exportaciones grandes.
+    # (Sin constant_memory: pandas escribe por columnas y ese modo descarta las filas ya volcadas)
+    with pd.ExcelWriter(output, engine='xlsxwriter') as writer:
         df_export = df.copy()
         if 'Errores_Datos' in df_export.columns:
-             df_export['Errores_Datos'] = df_export['Errores_Datos'].apply(lambda x: ", ".join(x) if isinstance(x, list) else x)
+            errs = df_export['Errores_Datos']
+            is_list = errs.map(type).eq(list)
+            df_export['Errores_Datos'] = errs.where(~is_list, errs[is_list].str.join(", "))
         df_export.to_excel(writer, index=False, sheet_name='Revision')
     processed_data = output.getvalue()
     return processed_data
@@ -215,7 +364,7 @@ with st.sidebar:
     
     uploaded_file = st.file_uploader("Cargar Archivo Excel", type=["xlsx"], help="Sube una inscripción inicial o un archivo adicional para añadir jugadores.")
     
-    history = load_history()
+    history = _get_history_cached()
     # DEBUG
     # st.write(f"Ruta Historial: {PERSISTENCE_FILE}")
     # st.write(f"Archivos encontrados: {len(history)}")
@@ -246,19 +395,16 @@ with st.sidebar:
                         st.error("Ya existe un archivo con ese nombre.")
                     else:
                         # Renombrar en historial
-                        history[new_name] = history.pop(selected_file)
-                        if save_history(history):
+                        if rename_session(selected_file, new_name):
                             st.session_state['current_file_key'] = new_name
-                            st.success("Renombrado correctamente.")
-                            time.sleep(0.5)
+                            st.toast("Renombrado correctamente.", icon="✅")
                             st.rerun()
                         else:
                             st.error("Error al guardar cambios.")
 
         if col_s1.button("Cargar"):
             st.session_state['current_file_key'] = selected_file
-            raw_data = history[selected_file]['data']
-            st.session_state['data'] = pd.DataFrame(raw_data)
+            st.session_state['data'] = history[selected_file]['data'].copy()
             st.rerun()
         if col_s2.button("🗑️"):
             delete_session(selected_file)
@@ -293,7 +439,7 @@ with st.sidebar:
         
         # Formulario dinámico (Data Editor)
         if 'manual_add_data' not in st.session_state:
-            st.session_state['manual_add_data'] = pd.DataFrame([{"Nº.ID": "", "Equipo": ""}])
+            st.session_state['manual_add_data'] = _EMPTY_MANUAL.copy()
             
         manual_df = st.data_editor(
             st.session_state['manual_add_data'],
@@ -316,92 +462,60 @@ with st.sidebar:
                     st.session_state['license_validator'] = validator
                 val_instance = st.session_state['license_validator']
                 
-                count_added = 0
-                new_rows = []
+                manual = pd.DataFrame({
+                    "raw_id": manual_df["Nº.ID"].fillna("").astype(str).str.strip(),
+                    "team": manual_df["Equipo"].fillna("").astype(str).str.strip(),
+                })
+                manual = manual[(manual["raw_id"] != "") & (manual["team"] != "")]
                 
-                for _, row in manual_df.iterrows():
-                    raw_id = str(row.get("Nº.ID", "")).strip()
-                    team = str(row.get("Equipo", "")).strip()
-                    
-                    if not raw_id or not team: continue
-                    
-                    # Verificar si ya existe
-                    if not current_df[current_df['Nº.ID'].astype(str) == raw_id].empty:
-                        st.warning(f"El jugador con ID {raw_id} ya existe en la lista. Saltando.")
-                        continue
-                        
-                    # Buscar en DB Local
-                    try:
-                        pid = int(raw_id)
-                        info = val_instance.licenses_db.get(pid)
-                    except:
-                        info = None
-                        
-                    if info:
-                        # Extraer datos
-                        nombre_completo = info.get('name', 'Desconocido')
-                        # Intentar separar nombre/apellidos (aproximado)
-                        parts = nombre_completo.split()
-                        if len(parts) >= 3:
-                            nombre = parts[0]
-                            apellido1 = parts[1]
-                            apellido2 = " ".join(parts[2:])
-                        elif len(parts) == 2:
-                            nombre = parts[0]
-                            apellido1 = parts[1]
-                            apellido2 = ""
-                        else:
-                            nombre = nombre_completo
-                            apellido1 = ""
-                            apellido2 = ""
-                            
-                        # Género y Fecha
-                        sexo = info.get('gender', '')
-                        dob = info.get('dob', '')
-                        club_origen = info.get('club', '')
-                        pais = "SPAIN" # Asumir Spain si está en DB nacional
-                    else:
-                        # No encontrado
-                        nombre = f"Manual-{raw_id}"
-                        apellido1 = "?"
-                        apellido2 = "?"
-                        sexo = "?" # Requerirá edición manual
-                        dob = "?"
-                        club_origen = "?"
-                        pais = "?"
-                        st.warning(f"ID {raw_id} no encontrado en BBDD. Se añade con datos vacíos para revisión.")
-
-                    # Crear fila
-                    new_row = {
-                        "Nº.ID": raw_id,
-                        "Club": club_origen,
-                        "Nombre": apellido1, # Excel suele poner apellido en 'Nombre' y nombre en 'Nombre.1'
-                        "2ºNombre": apellido2,
-                        "Nombre.1": nombre,
-                        "F.Nac": dob,
-                        "Género": sexo,
-                        "País": pais,
-                        "Pruebas": team,
-                        "Es_Cedido": False, # Recalculará process_dataframe
-                        "No_Seleccionable": False,
-                        "Datos_Validos": True,
-                        "Errores_Datos": [],
-                        "Estado": "Nuevo Manual",
-                        "Documentacion_OK": False,
-                        "Declaración_Jurada": False,
-                        "Documento_Cesión": False,
-                        "Notas_Revision": "Añadido Manualmente",
-                        "Errores_Normativos": "",
-                        "Validacion_FESBA": ""
-                    }
-                    new_rows.append(new_row)
-                    count_added += 1
+                # Verificar si ya existen (un único isin en vez de un filtro por fila)
+                dup_mask = manual["raw_id"].isin(current_df['Nº.ID'].astype(str))
+                for raw_id in manual.loc[dup_mask, "raw_id"]:
+                    st.warning(f"El jugador con ID {raw_id} ya existe en la lista. Saltando.")
+                manual = manual[~dup_mask]
+                
+                # Buscar en DB Local (un solo map sobre licenses_db)
+                pid = pd.to_numeric(manual["raw_id"], errors="coerce")
+                info = pid.where(pid % 1 == 0).map(val_instance.licenses_db).astype(object)
+                found = info.notna()
+                for raw_id in manual.loc[~found, "raw_id"]:
+                    st.warning(f"ID {raw_id} no encontrado en BBDD. Se añade con datos vacíos para revisión.")
+                
+                def db_field(key, default):
+                    # No encontrados -> "?" (Requerirá edición manual)
+                    return info.str.get(key).fillna(default).where(found, "?")
+                
+                # Intentar separar nombre/apellidos (aproximado): nombre, apellido1, resto
+                nombre_completo = info.str.get('name').fillna('Desconocido')
+                parts = nombre_completo.str.split(n=2, expand=True).reindex(columns=range(3)).fillna("")
+                
+                df_new_manual = pd.DataFrame({
+                    "Nº.ID": manual["raw_id"],
+                    "Club": db_field('club', ''),
+                    "Nombre": parts[1].where(found, "?"), # Excel suele poner apellido en 'Nombre' y nombre en 'Nombre.1'
+                    "2ºNombre": parts[2].where(found, "?"),
+                    "Nombre.1": parts[0].where(found, "Manual-" + manual["raw_id"]),
+                    "F.Nac": db_field('dob', ''),
+                    "Género": db_field('gender', ''),
+                    "País": pd.Series("SPAIN", index=manual.index).where(found, "?"), # Asumir Spain si está en DB nacional
+                    "Pruebas": manual["team"],
+                    "Es_Cedido": False, # Recalculará process_dataframe
+                    "No_Seleccionable": False,
+                    "Datos_Validos": True,
+                    "Errores_Datos": [[] for _ in range(len(manual))],
+                    "Estado": "Nuevo Manual",
+                    "Documentacion_OK": False,
+                    "Declaración_Jurada": False,
+                    "Documento_Cesión": False,
+                    "Notas_Revision": "Añadido Manualmente",
+                    "Errores_Normativos": "",
+                    "Validacion_FESBA": ""
+                }, index=manual.index)
+                count_added = len(df_new_manual)
                 
-                if new_rows:
-                    # Convertir a DF y procesar
-                    df_new_manual = pd.DataFrame(new_rows)
+                if count_added > 0:
                     # Fusionar
-                    current_df = pd.concat([current_df, df_new_manual], ignore_index=True)
+                    current_df = concat_rows(current_df, df_new_manual)
                     # Re-procesar para calcular campos calculados (Es_Cedido, etc)
                     current_eq = rules_manager.load_equivalences()
                     # IMPORTANTE: process_dataframe espera columnas específicas, 
@@ -409,12 +523,12 @@ with st.sidebar:
                     # Mejor opción: Recalcular lógica sobre todo el DF
                     fuzzy_th = st.session_state.get('fuzzy_threshold', 0.80)
                     current_df = process_dataframe(current_df, equivalences=current_eq, fuzzy_threshold=fuzzy_th)
-                if count_added > 0:
+                    
                     st.success(f"Añadidos {count_added} jugadores.")
                     # Guardar
                     current_key = st.session_state.get('current_file_key', 'manual')
                     save_current_session(current_key, current_df)
-                    st.session_state['manual_add_data'] = pd.DataFrame([{"Nº.ID": "", "Equipo": ""}])
+                    st.session_state['manual_add_data'] = _EMPTY_MANUAL.copy()
                     time.sleep(1)
                     st.rerun()
                 else:
@@ -442,7 +556,7 @@ with st.sidebar:
                         # Procesar el nuevo DF
                         df_new_processed = process_dataframe(df_new, equivalences=current_eq, fuzzy_threshold=fuzzy_th)
                         
-                        # Fusión
+                        # Fusión (una sola vez: un único resumen y mismas reglas para IDs repetidos)
                         current_df, merge_logs = merge_dataframes_with_log(current_df, df_new_processed)
                         
                         # Actualizar Estado
@@ -452,8 +566,7 @@ with st.sidebar:
                         
                         # Guardar logs
                         st.session_state['merge_logs'] = merge_logs
-                        st.success("Importación completada.")
-                        time.sleep(0.5)
+                        st.toast("Importación completada.", icon="✅")
                         st.rerun()
 
         # MOSTRAR LOGS DE FUSIÓN SI EXISTEN (Aquí es el mejor sitio)
@@ -537,26 +650,51 @@ if 'data' in st.session_state and st.session_state['data'] is not None:
     if new_teams:
         rules_manager.save_team_categories(team_categories)
 
+    # Índice inverso categoría -> equipos presentes (para el filtro por categoría)
+    all_teams_set = frozenset(all_teams)
+    category_to_teams = defaultdict(list)
+    for t, c in team_categories.items():
+        if t in all_teams_set:
+            category_to_teams[c].append(t)
+
     # Calcular Cumplimiento (Auditoría Dinámica)
-    compliance_df = calculate_team_compliance(df, rules_config, team_categories)
+    # Versiones cacheadas: en reruns por filtros no se repite la auditoría
+    audit_fp = audit_fingerprint(df)
+    compliance_df = calculate_team_compliance_cached(df, rules_config, team_categories, fingerprint=audit_fp)
 
     # Aplicar Chequeo Individual Exhaustivo (Para poblar columna 'Errores_Normativos')
     # Esto asegura que el sombreado/error aparezca
-    df = apply_comprehensive_check(df, rules_config, team_categories)
+    df = apply_comprehensive_check_cached(df, rules_config, team_categories, fingerprint=audit_fp)
+    # Filas con incidencias: una sola comparación por rerun, reutilizada en métricas, filtros e Incidencias
+    has_error = df['Errores_Normativos'].to_numpy() != ""
 
     st.caption(f"Editando: **{current_name}**")
 
     # --- DASHBOARD DE MÉTRICAS ---
     m1, m2, m3, m4, m5 = st.columns(5)
+    # Solo se recalculan si cambian los datos o las reglas (no al tocar un filtro).
+    # '_metrics_src' se compara por identidad; save_current_session invalida la caché.
+    metrics_fp = (len(df), orjson.dumps([rules_config, team_categories], option=orjson.OPT_SORT_KEYS))
+    if st.session_state.get('_metrics_src') is not st.session_state['data'] or st.session_state.get('_metrics_fp') != metrics_fp:
+        st.session_state['_metrics'] = {
+            "nunique_teams": df['Pruebas'].nunique(),
+            "cedidos_sum": int(float(df['Es_Cedido'].sum())),
+            # Errores Normativos Totales (Cualquier fila con texto en Errores_Normativos)
+            "normative_errors": int(has_error.sum()),
+            "data_errors": int((~df['Datos_Validos']).sum()),
+        }
+        st.session_state['_metrics_src'] = st.session_state['data']
+        st.session_state['_metrics_fp'] = metrics_fp
+    metrics = st.session_state['_metrics']
+    
     m1.metric("Total Inscritos", len(df), "Jugadores")
-    m2.metric("Equipos", df['Pruebas'].nunique(), "Clubes")
-    m3.metric("Cedidos", int(float(df['Es_Cedido'].sum())), "Alertas", delta_color="off")
+    m2.metric("Equipos", metrics['nunique_teams'], "Clubes")
+    m3.metric("Cedidos", metrics['cedidos_sum'], "Alertas", delta_color="off")
     
-    # Errores Normativos Totales (Cualquier fila con texto en Errores_Normativos)
-    normative_errors = int((df['Errores_Normativos'] != "").sum())
+    normative_errors = metrics['normative_errors']
     m4.metric("Incidencias Normativas", normative_errors, "Jugadores Afectados", delta_color="inverse" if normative_errors > 0 else "normal")
     
-    data_errors = int((~df['Datos_Validos']).sum())
+    data_errors = metrics['data_errors']
     m5.metric("Errores Datos", data_errors, "Datos Faltantes", delta_color="inverse" if data_errors > 0 else "normal")
     st.divider()
 
@@ -581,7 +719,7 @@ if 'data' in st.session_state and st.session_state['data'] is not None:
             sel_cat = c_f1.selectbox("Filtrar por Categoría:", cats_avail)
             
             if sel_cat != "Todas":
-                teams_in_cat = [t for t, c in team_categories.items() if c == sel_cat and t in all_teams]
+                teams_in_cat = category_to_teams.get(sel_cat, [])
             else:
                 teams_in_cat = all_teams
             sel_team = c_f2.selectbox("Filtrar por Equipo:", ["Todos"] + teams_in_cat)
@@ -616,33 +754,36 @@ if 'data' in st.session_state and st.session_state['data'] is not None:
                         """, unsafe_allow_html=True)
 
             # MÁSCARA DE FILTRADO
-            mask = pd.Series([True] * len(df))
+            # Se acumulan los predicados y se combinan de una sola vez
+            preds = []
             if sel_team != "Todos":
-                mask = mask & (df['Pruebas'] == sel_team)
+                preds.append(df['Pruebas'] == sel_team)
             elif sel_cat != "Todas":
-                mask = mask & (df['Pruebas'].isin(teams_in_cat))
+                preds.append(df['Pruebas'].isin(teams_in_cat))
                 
             if sel_lic_status == "⛔ Con Incidencias":
-                mask = mask & (df['Errores_Normativos'] != "")
+                preds.append(has_error)
             elif 'Validacion_FESBA' in df.columns and sel_lic_status != "Todos":
                 if sel_lic_status == "✅ Licencia OK":
-                    mask = mask & (df['Validacion_FESBA'].str.contains("✅", na=False))
+                    preds.append(df['Validacion_FESBA'].str.startswith("✅", na=False))
                 elif sel_lic_status == "❌ Licencia Incorrecta":
-                    mask = mask & (df['Validacion_FESBA'].str.contains("❌", na=False))
+                    preds.append(df['Validacion_FESBA'].str.startswith("❌", na=False))
                 elif sel_lic_status == "Pendiente de Revisión":
-                    mask = mask & (df['Validacion_FESBA'].isna())
+                    preds.append(df['Validacion_FESBA'].isna())
 
             # Aplicar Filtro Cedidos
             if sel_cedido == "Sí":
-                mask = mask & (df['Es_Cedido'] == True)
+                preds.append(df['Es_Cedido'] == True)
             elif sel_cedido == "No":
-                mask = mask & (df['Es_Cedido'] == False)
+                preds.append(df['Es_Cedido'] == False)
 
             # Aplicar Filtro No Seleccionables
             if sel_no_sel == "Sí":
-                mask = mask & (df['No_Seleccionable'] == True)
+                preds.append(df['No_Seleccionable'] == True)
             elif sel_no_sel == "No":
-                mask = mask & (df['No_Seleccionable'] == False)
+                preds.append(df['No_Seleccionable'] == False)
+
+            mask = np.logical_and.reduce([np.asarray(p, dtype=bool) for p in preds]) if preds else np.ones(len(df), dtype=bool)
 
             # DATA EDITOR
             cols_to_show = ['Jugador', 'Pruebas', 'Errores_Normativos', 'Validacion_FESBA', 'Es_Cedido', 'Declaración_Jurada', 'Documento_Cesión', 'Notas_Revision']
@@ -652,7 +793,7 @@ if 'data' in st.session_state and st.session_state['data'] is not None:
             # Mover Errores_Normativos al principio para visibilidad
             
             edited_df = st.data_editor(
-                df.loc[mask, cols_to_show],
+                decategorize_columns(df.loc[mask, cols_to_show]),
                 column_config={
                     "Jugador": st.column_config.TextColumn("Jugador", disabled=True),
                     "Pruebas": st.column_config.TextColumn("Equipo", disabled=True),
@@ -680,7 +821,7 @@ if 'data' in st.session_state and st.session_state['data'] is not None:
             # Botón Re-Validación Completa
             if st.button("🔄 Actualizar Estado", help="Recalcula errores si has cambiado documentación"):
                 # 1. Actualizar DF con los cambios del editor (checkboxes, notas, etc.)
-                df.update(edited_df)
+                df.loc[edited_df.index, EDITABLE_COLS] = edited_df[EDITABLE_COLS].to_numpy()
                 
                 # 2. Volver a procesar (recalcula Es_Cedido, etc. si fuera necesario, y sobre todo lógica interna)
                 current_eq = rules_manager.load_equivalences()
@@ -693,22 +834,18 @@ if 'data' in st.session_state and st.session_state['data'] is not None:
                 rules_config = rules_manager.load_rules()
                 team_categories = rules_manager.load_team_categories()
                 
-                # Primero calculamos cumplimiento por equipo (para métricas)
-                calculate_team_compliance(df, rules_config, team_categories) 
-                
                 # Luego aplicamos el chequeo detallado que actualiza la columna 'Errores_Normativos' del DF
-                df = apply_comprehensive_check(df, rules_config, team_categories)
+                df = apply_comprehensive_check_cached(df, rules_config, team_categories)
                 
                 # 4. Guardar estado
                 st.session_state['data'] = df
                 save_current_session(current_name, df)
                 
-                st.success("Estado actualizado correctamente.")
-                time.sleep(0.5)
+                st.toast("Estado actualizado correctamente.", icon="✅")
                 st.rerun()
 
             if st.button("💾 Guardar Notas", type="primary", use_container_width=True):
-                df.update(edited_df)
+                df.loc[edited_df.index, EDITABLE_COLS] = edited_df[EDITABLE_COLS].to_numpy()
                 st.session_state['data'] = df
                 save_current_session(current_name, df)
                 st.success("Guardado.")
@@ -749,7 +886,7 @@ if 'data' in st.session_state and st.session_state['data'] is not None:
         with c_conf1:
             st.subheader("1. Asignación de Equipos")
             st.info("Asocia cada equipo del Excel a una categoría de competición.")
-            cat_df = pd.DataFrame(list(team_categories.items()), columns=['Equipo', 'Categoría'])
+            cat_df = pd.DataFrame({'Equipo': list(team_categories), 'Categoría': list(team_categories.values())})
             edited_cat_df = st.data_editor(
                 cat_df,
                 column_config={
@@ -762,16 +899,15 @@ if 'data' in st.session_state and st.session_state['data'] is not None:
             )
             if st.button("Guardar Asignaciones"):
                 new_cats = dict(zip(edited_cat_df['Equipo'], edited_cat_df['Categoría']))
-                rules_manager.save_team_categories(new_cats)
-                
-                # Recargar y recalcular todo automáticamente
-                team_categories = rules_manager.load_team_categories()
+                # Sin cambios no se escribe (ni se invalida la caché de configuración)
+                if new_cats != team_categories:
+                    rules_manager.save_team_categories(new_cats)
                 
-                # Compliance check usa categorías, así que se actualiza solo con st.rerun()
+                # El rerun recarga las categorías (la caché se limpió al guardar):
+                # compliance check usa categorías, así que se actualiza solo con st.rerun()
                 # Pero apply_comprehensive_check también se llama en main loop
                 
-                st.success("Asignaciones guardadas y aplicadas.")
-                time.sleep(0.5)
+                st.toast("Asignaciones guardadas y aplicadas.", icon="✅")
                 st.rerun()
 
         # B) GESTIÓN DE EQUIVALENCIAS (FILIALES)
@@ -780,11 +916,10 @@ if 'data' in st.session_state and st.session_state['data'] is not None:
             st.info("Define qué clubes son filiales para no contarlos como cedidos.")
             
             # Convertir dict a DF plano para editar: Club Madre | Filial
-            eq_rows = []
-            for madre, filiales in equivalences.items():
-                for f in filiales:
-                    eq_rows.append({"Club Principal": madre, "Club Filial": f})
-            eq_df = pd.DataFrame(eq_rows)
+            eq_df = pd.DataFrame(
+                [(madre, f) for madre, filiales in equivalences.items() for f in filiales],
+                columns=["Club Principal", "Club Filial"]
+            )
             
             edited_eq_df = st.data_editor(
                 eq_df,
@@ -796,13 +931,9 @@ if 'data' in st.session_state and st.session_state['data'] is not None:
             
             if st.button("Guardar Equivalencias"):
                 # Reconstruir diccionario
-                new_eq_dict = {}
-                for idx, row in edited_eq_df.iterrows():
-                    madre = row['Club Principal']
-                    filial = row['Club Filial']
-                    if madre and filial:
-                        if madre not in new_eq_dict: new_eq_dict[madre] = []
-                        new_eq_dict[madre].append(filial)
+                valid_eq = edited_eq_df.dropna(subset=['Club Principal', 'Club Filial'])
+                valid_eq = valid_eq[(valid_eq['Club Principal'] != '') & (valid_eq['Club Filial'] != '')]
+                new_eq_dict = valid_eq.groupby('Club Principal', sort=False)['Club Filial'].agg(list).to_dict()
                 rules_manager.save_equivalences(new_eq_dict)
                 
                 # Recalcular Es_Cedido inmediatamente
@@ -810,19 +941,13 @@ if 'data' in st.session_state and st.session_state['data'] is not None:
                 df = process_dataframe(df, equivalences=new_eq_dict, fuzzy_threshold=fuzzy_th)
                 
                 # Recalcular Auditoría para reflejar cambios en conteo de cedidos
-                compliance_df = calculate_team_compliance(df, rules_config, team_categories)
-                df = apply_comprehensive_check(df, rules_config, team_categories)
+                df = apply_comprehensive_check_cached(df, rules_config, team_categories)
                 
                 # Guardar
                 st.session_state['data'] = df
                 save_current_session(current_name, df)
                 
-                st.success("Equivalencias actualizadas y aplicadas.")
-                time.sleep(0.5)
-                st.rerun()
-
-                st.success("Equivalencias actualizadas y aplicadas.")
-                time.sleep(0.5)
+                st.toast("Equivalencias actualizadas y aplicadas.", icon="✅")
                 st.rerun()
 
         st.divider()
@@ -832,9 +957,12 @@ if 'data' in st.session_state and st.session_state['data'] is not None:
         st.info("Ajusta la sensibilidad para detectar si el Club y el Equipo son el mismo, aunque el nombre varíe ligeramente.")
         
         current_fuzzy = st.session_state.get('fuzzy_threshold', 0.80)
-        new_fuzzy = st.slider("Umbral de Similitud (0.0 = Todo es igual, 1.0 = Exacto)", 0.0, 1.0, current_fuzzy, 0.05)
+        # En un form: el reprocesado completo solo se lanza al pulsar "Aplicar", no en cada cambio del slider
+        with st.form("fuzzy_form", border=False):
+            new_fuzzy = st.slider("Umbral de Similitud (0.0 = Todo es igual, 1.0 = Exacto)", 0.0, 1.0, current_fuzzy, 0.05)
+            fuzzy_submitted = st.form_submit_button("Aplicar")
         
-        if new_fuzzy != current_fuzzy:
+        if fuzzy_submitted and new_fuzzy != current_fuzzy:
             st.session_state['fuzzy_threshold'] = new_fuzzy
             # Recalcular
             if 'data' in st.session_state and st.session_state['data'] is not None:
@@ -844,8 +972,7 @@ if 'data' in st.session_state and st.session_state['data'] is not None:
                 df = process_dataframe(df, equivalences=current_eq, fuzzy_threshold=new_fuzzy)
                 
                 # Recalcular Auditoría
-                compliance_df = calculate_team_compliance(df, rules_config, team_categories)
-                df = apply_comprehensive_check(df, rules_config, team_categories)
+                df = apply_comprehensive_check_cached(df, rules_config, team_categories)
                 
                 st.session_state['data'] = df
                 save_current_session(current_name, df)
@@ -901,22 +1028,24 @@ if 'data' in st.session_state and st.session_state['data'] is not None:
                         rules_config[sel_rule_cat]['ratio_table'] = edited_ratio_df.to_dict(orient='records')
                         
                         rules_manager.save_rules(rules_config)
-                        st.success(f"Reglas actualizadas para {sel_rule_cat}")
-                        time.sleep(1)
+                        st.toast(f"Reglas actualizadas para {sel_rule_cat}", icon="✅")
                         st.rerun()
 
     # 3. INCIDENCIAS (Cambio de Nombre)
     with tab_incidencias:
         st.subheader("⚠️ Listado de Incidencias Normativas")
         
-        incidencias_df = df[df['Errores_Normativos'] != ""]
+        # Solo las columnas que se muestran: evita copiar (y serializar) todo el DF
+        if len(has_error) != len(df): # df reasignado en este rerun (p.ej. borrado sin guardar)
+            has_error = df['Errores_Normativos'].to_numpy() != ""
+        incidencias_df = df.loc[has_error, ['Pruebas', 'Jugador', 'Errores_Normativos']]
         
         if incidencias_df.empty:
              st.success("✅ **¡Felicidades! No se detectan infracciones normativas.**")
         else:
              st.error(f"❌ **Se han detectado {len(incidencias_df)} irregularidades.**")
              st.dataframe(
-                 incidencias_df[['Pruebas', 'Jugador', 'Errores_Normativos']], 
+                 incidencias_df, 
                  use_container_width=True,
                  hide_index=True
              )
@@ -926,11 +1055,11 @@ if 'data' in st.session_state and st.session_state['data'] is not None:
         st.subheader("Generación de Ficheros Oficiales")
         c_dl1, c_dl2, c_dl3 = st.columns(3)
         with c_dl1:
-            st.download_button("Descargar Informe Excel", data=to_excel(df), file_name=f"Informe_{current_name}.xlsx", mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet", use_container_width=True)
+            st.download_button("Descargar Informe Excel", data=partial(to_excel, df), file_name=f"Informe_{current_name}.xlsx", mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet", use_container_width=True)
         with c_dl2:
-            st.download_button("CSV Jugadores", data=generate_players_csv(df), file_name="import_players.csv", mime="text/csv", use_container_width=True, disabled=bool(data_errors > 0))
+            st.download_button("CSV Jugadores", data=partial(generate_players_csv, df), file_name="import_players.csv", mime="text/csv", use_container_width=True, disabled=bool(data_errors > 0))
         with c_dl3:
-            st.download_button("CSV Alineaciones", data=generate_team_players_csv(df), file_name="import_team_players.csv", mime="text/csv", use_container_width=True, disabled=bool(data_errors > 0))
+            st.download_button("CSV Alineaciones", data=partial(generate_team_players_csv, df), file_name="import_team_players.csv", mime="text/csv", use_container_width=True, disabled=bool(data_errors > 0))
 
 else:
     st.markdown("""
@@ -1,6 +1,8 @@
 import pandas as pd
+import numpy as np
 import io
 import re
+import hashlib
 import json
 import os
 import streamlit as st
@@ -8,23 +10,148 @@ from datetime import datetime
 
 # NOTA: Las equivalencias ahora se pasan dinámicamente, no se cargan aquí globalmente.
 
-@st.cache_data(ttl=3600, show_spinner=False)
+# Por encima de este tamaño, load_data lee la hoja en streaming (openpyxl read_only)
+STREAMING_THRESHOLD_BYTES = 5 * 1024 * 1024
+
+# Patrones precompilados (se usan por celda / por nombre de club)
+_PUNCT_RE = re.compile(r'[^\w\s]')
+_ID_NAME_RE = re.compile(r'n[º°\?║\.]*.id', re.IGNORECASE)
+_TRAILING_DOT_ZERO_RE = re.compile(r'\.0$')
+_TRUE_TOKENS = frozenset({'TRUE', '1', 'YES', 'SI'})
+# Marcador HN-p del CSV de jugadores (sobre Validacion_FESBA en mayúsculas)
+_NATIONAL_LICENSE_RE = re.compile(r'NACIONAL|HN|HOMOLOGADA')
+_LICENSE_PENDING_RE = re.compile(r'NO ENCONTRADO|❌|NO NAC|AUTONÓMICA|PROVINCIAL')
+
+def _file_size(file):
+    if hasattr(file, 'size'):
+        return file.size
+    if hasattr(file, 'getbuffer'):
+        return file.getbuffer().nbytes
+    if isinstance(file, (str, os.PathLike)) and os.path.exists(file):
+        return os.path.getsize(file)
+    return 0
+
+def _read_excel_streaming(file, header_row_idx):
+    """
+    Equivalent of pd.read_excel(file, header=header_row_idx) for big workbooks:
+    iterates the first sheet with openpyxl read_only (values only) and builds the
+    DataFrame with a single from_records, skipping pandas' row-wise parser.
+    """
+    import openpyxl
+    
+    if hasattr(file, 'seek'): file.seek(0)
+    wb = openpyxl.load_workbook(file, read_only=True, data_only=True)
+    try:
+        rows = wb.worksheets[0].iter_rows(min_row=header_row_idx + 1, values_only=True)
+        header = next(rows, ())
+        
+        # Same naming as pandas: empty header -> 'Unnamed: i', duplicates -> 'X.1', 'X.2'...
+        names, seen = [], {}
+        for i, h in enumerate(header):
+            name = f"Unnamed: {i}" if h is None else h
+            if name in seen:
+                seen[name] += 1
+                name = f"{name}.{seen[name]}"
+            else:
+                seen[name] = 0
+            names.append(name)
+        
+        n = len(names)
+        records = [
+            row[:n] + (None,) * (n - len(row))
+            for row in rows
+            if any(v is not None for v in row)  # Blank lines are skipped, as in read_excel
+        ]
+    finally:
+        wb.close()
+    return pd.DataFrame.from_records(records, columns=names)
+
+def _read_excel_head(file, n_rows):
+    """
+    First n_rows of the first sheet as lists of values (header=None positions, blank
+    rows included), read with openpyxl read_only so the rest of the sheet is not parsed.
+    """
+    import openpyxl
+    
+    if hasattr(file, 'seek'): file.seek(0)
+    wb = openpyxl.load_workbook(file, read_only=True, data_only=True)
+    try:
+        return [list(row) for row in wb.worksheets[0].iter_rows(max_row=n_rows, values_only=True)]
+    finally:
+        wb.close()
+
+def smart_fix_encoding(text):
+    """
+    Fixes text that looks like UTF-8 decoded as Latin-1 (Mojibake).
+    Example: 'AlfajarÃn' -> 'Alfajarín'
+    """
+    if pd.isna(text): 
+        return text
+    text_str = str(text)
+    
+    # Optimization: Only try invalid sequences containing 'Ã' (common in UTF-8 mojibake)
+    if 'Ã' in text_str:
+        try:
+            # Attempt to reversible fix
+            fixed = text_str.encode('latin-1').decode('utf-8')
+            return fixed
+        except (UnicodeDecodeError, UnicodeEncodeError):
+            # Not actually encoded that way, return original
+            return text_str
+    return text_str
+
+def _fix_mojibake(col_data):
+    """
+    smart_fix_encoding sobre una columna. La máscara (.str, sin Python por celda) deja
+    solo las celdas con 'Ã' y las no-texto (que smart_fix_encoding pasa a str); el
+    re-encode sigue siendo por celda para conservar el 'si falla, se deja como estaba'
+    (con .str.encode/.str.decode y errors='ignore' se perderían caracteres).
+    """
+    if col_data.dtype != object:
+        return col_data.apply(smart_fix_encoding)
+    needs_fix = (
+        col_data.str.contains('Ã', regex=False, na=False)
+        | (col_data.notna() & col_data.str.len().isna())
+    )
+    if not needs_fix.any():
+        return col_data
+    col_data = col_data.copy()
+    col_data[needs_fix] = col_data[needs_fix].apply(smart_fix_encoding)
+    return col_data
+
 def load_data(file):
+    """
+    Carga el Excel de inscripciones. La caché va por el SHA-256 del contenido: volver a
+    subir el mismo fichero (otro UploadedFile, otra posición de lectura) no lo re-parsea.
+    """
+    if not hasattr(file, 'read'):
+        return _load_data_uncached(file)
+    if hasattr(file, 'seek'): file.seek(0)
+    file_bytes = file.read()
+    if hasattr(file, 'seek'): file.seek(0)
+    return _load_data_cached(hashlib.sha256(file_bytes).hexdigest(), file_bytes)
+
+@st.cache_data(ttl=3600, show_spinner=False)
+def _load_data_cached(sha, _file_bytes):
+    # _file_bytes no se hashea (guion bajo): la clave es el SHA-256
+    return _load_data_uncached(io.BytesIO(_file_bytes))
+
+def _load_data_uncached(file):
     try:
         # 1. DYNAMIC HEADER DETECTION
         if hasattr(file, 'seek'): file.seek(0)
         
         # Read first few rows to find header
-        # Using header=None to look for keywords
-        temp_df = pd.read_excel(file, header=None, nrows=20)
+        # (only those rows: openpyxl read_only stops after them instead of parsing the whole sheet)
+        header_rows = _read_excel_head(file, 20)
         header_row_idx = 0
         found_header = False
         
         # Keywords to identify header row
         keywords = ['nombre', 'club', 'equipo', 'licencia', 'n.']
         
-        for idx, row in temp_df.iterrows():
-            row_str = row.astype(str).str.lower().tolist()
+        for idx, row in enumerate(header_rows):
+            row_str = [str(v).lower() for v in row]
             matches = sum(1 for k in keywords if any(k in s for s in row_str))
             # If we match at least 2 distinct keywords (e.g. Nombre AND Club)
             if matches >= 2:
@@ -35,11 +162,13 @@ def load_data(file):
         # Reload with correct header
         if hasattr(file, 'seek'): file.seek(0)
         
-        if found_header:
-            df = pd.read_excel(file, header=header_row_idx)
+        if not found_header:
+            header_row_idx = 3 # Fallback
+        
+        if _file_size(file) > STREAMING_THRESHOLD_BYTES:
+            df = _read_excel_streaming(file, header_row_idx)
         else:
-            # Fallback
-            df = pd.read_excel(file, header=3) 
+            df = pd.read_excel(file, header=header_row_idx)
 
         # 0. BACKUP DETECTION / SYSTEM RESTORE
         # Si el archivo tiene las columnas internas del sistema (backup completo),
@@ -53,18 +182,14 @@ def load_data(file):
             # FORCE TYPES FOR BACKUP RESTORE
             # 1. Clean IDs
             if 'Nº.ID' in df.columns:
-                 df['Nº.ID'] = df['Nº.ID'].astype(str).str.strip().str.replace(r'\.0$', '', regex=True)
+                 df['Nº.ID'] = df['Nº.ID'].astype(str).str.strip().str.replace(_TRAILING_DOT_ZERO_RE, '', regex=True)
             
             # 2. Ensure Booleans are actual bools (Excel saves them as TRUE/FALSE strings usually)
             bool_cols = ['Declaración_Jurada', 'Documento_Cesión', 'Es_Excluido', 'Es_Cedido', 'No_Seleccionable', 'Datos_Validos', 'Licencia_Subsanada']
             for c in bool_cols:
                 if c in df.columns:
                     # Convertir valores mixtos a booleano real
-                    def strict_bool(x):
-                        s = str(x).upper().strip()
-                        return s in ['TRUE', '1', 'YES', 'SI']
-                    
-                    df[c] = df[c].apply(strict_bool)
+                    df[c] = df[c].astype(str).str.upper().str.strip().isin(_TRUE_TOKENS)
             
             # Devolvemos el DF tal cual, confiando en su estructura
             return df
@@ -121,9 +246,8 @@ def load_data(file):
 
         # 2b. FORCE ID TO STRING (Support Alphanumeric)
         if 'Nº.ID' in df.columns:
-            df['Nº.ID'] = df['Nº.ID'].astype(str).str.strip()
-            # Remove potential .0 from float conversion of integers
-            df['Nº.ID'] = df['Nº.ID'].apply(lambda x: x.replace('.0', '') if x.endswith('.0') else x)
+            # Remove potential .0 from float conversion of integers (igual que en el backup)
+            df['Nº.ID'] = df['Nº.ID'].astype(str).str.strip().str.replace(_TRAILING_DOT_ZERO_RE, '', regex=True)
 
         # 3. TRANSFER DETECTION (Multi-Club)
         if 'Estado_Transferencia' not in df.columns:
@@ -134,37 +258,19 @@ def load_data(file):
             df.loc[mask_transfer, 'Estado_Transferencia'] = '⚠️ MULTI-CLUB / TRANSFER'
         
         # 4. SMART ENCODING FIX (Detect mojibake from bad imports)
-        def smart_fix_encoding(text):
-            """
-            Fixes text that looks like UTF-8 decoded as Latin-1 (Mojibake).
-            Example: 'AlfajarÃn' -> 'Alfajarín'
-            """
-            if pd.isna(text): 
-                return text
-            text_str = str(text)
-            
-            # Optimization: Only try invalid sequences containing 'Ã' (common in UTF-8 mojibake)
-            if 'Ã' in text_str:
-                try:
-                    # Attempt to reversible fix
-                    fixed = text_str.encode('latin-1').decode('utf-8')
-                    return fixed
-                except (UnicodeDecodeError, UnicodeEncodeError):
-                    # Not actually encoded that way, return original
-                    return text_str
-            return text_str
-
         # Apply to crucial text columns
         text_cols = ['Club', 'Pruebas', 'Nombre', 'Nombre.1', 'País', 'Equipo']
         for col in text_cols:
             if col in df.columns:
-                df[col] = df[col].apply(smart_fix_encoding)
+                df[col] = _fix_mojibake(df[col])
             
         return df
     except Exception as e:
         print(f"Error loading data: {e}")
         return None
 
+ID_SAMPLE_ROWS = 1000
+
 def identify_best_id_column(df):
     """
     Analyzes columns to find the most likely 'License ID'.
@@ -177,9 +283,6 @@ def identify_best_id_column(df):
     best_col = None
     best_score = -1
     
-    import re
-    id_pattern = re.compile(r'n[º°\?║\.]*.id', re.IGNORECASE)
-    
     for col in df.columns:
         name = str(col).strip()
         lower_name = name.lower()
@@ -187,20 +290,20 @@ def identify_best_id_column(df):
         
         # 1. NAME CHECK
         is_candidate = False
-        if name == 'N.' or id_pattern.search(name) or 'licencia' in lower_name or 'id' in lower_name:
+        if name == 'N.' or _ID_NAME_RE.search(name) or 'licencia' in lower_name or 'id' in lower_name:
             is_candidate = True
             
         if not is_candidate:
             continue
             
         # 2. CONTENT CHECK
-        # Sample non-null values
-        series = df[col].dropna()
+        # Sample non-null values (las estadísticas salen de los primeros ID_SAMPLE_ROWS)
+        series = df[col].dropna().head(ID_SAMPLE_ROWS)
         if len(series) == 0:
             continue
             
         try:
-            nums = pd.to_numeric(series, errors='coerce').dropna()
+            nums = pd.to_numeric(series, errors='coerce').dropna().to_numpy()
             if len(nums) == 0: continue
             
             mean_val = nums.mean()
@@ -209,10 +312,8 @@ def identify_best_id_column(df):
             # CHECK SEQUENTIAL (Row Counter)
             is_sequential = False
             if len(nums) > 10:
-                sample = nums.iloc[:10].tolist()
-                diffs = [sample[i+1]-sample[i] for i in range(len(sample)-1)]
                 # If mostly 1s and starts low
-                if all(d == 1 for d in diffs) and min_val <= 1:
+                if (np.diff(nums[:10]) == 1).all() and min_val <= 1:
                     is_sequential = True
             
             if is_sequential: 
@@ -245,12 +346,27 @@ def clean_string(s):
 
 import difflib
 import unicodedata
+from functools import lru_cache
+
+# RapidFuzz (C++) es mucho más rápido que difflib, pero las puntuaciones son parecidas, no
+# idénticas: fuzz.ratio es la distancia Indel normalizada (subsecuencia común más larga) y
+# SequenceMatcher.ratio suma bloques coincidentes voraces (con autojunk). fuzz.ratio nunca es
+# menor, así que los umbrales (0.80 cedidos, 0.85 ClubID, 0.9 transferencias) solo aceptan de
+# más algunas variantes con erratas; entre nombres reales de equipos/clubes no cambia ninguno.
+# Viene con python-Levenshtein; si no está disponible se usa difflib.
+try:
+    from rapidfuzz import fuzz, process
+    RAPIDFUZZ_AVAILABLE = True
+except ImportError:
+    RAPIDFUZZ_AVAILABLE = False
 
 def remove_accents(input_str):
     if not isinstance(input_str, str): return str(input_str)
     nfkd_form = unicodedata.normalize('NFKD', input_str)
     return "".join([c for c in nfkd_form if not unicodedata.combining(c)])
 
+# Los mismos nombres de club/equipo se normalizan miles de veces (fuzzy, categorías, ClubIDs)
+@lru_cache(maxsize=8192, typed=True)
 def normalize_name(s):
     if pd.isna(s): return ""
     s = remove_accents(str(s).lower())
@@ -264,10 +380,17 @@ def normalize_name(s):
     for r in replacements:
         s = s.replace(r, "")
     # Remove punctuation and extra spaces
-    s = re.sub(r'[^\w\s]', ' ', s) 
+    s = _PUNCT_RE.sub(' ', s) 
     return " ".join(s.split())
 
+# Misma pareja (p.ej. equipo de la importación vs equipo actual) en muchas filas. Sin
+# reordenar los argumentos: con difflib el ratio no es simétrico.
+@lru_cache(maxsize=4096, typed=True)
 def calculate_similarity(a, b):
+    # Mismo texto salvo mayúsculas: la normalización coincide, basta con un lado
+    if isinstance(a, str) and isinstance(b, str) and a.lower() == b.lower():
+        return 1.0 if normalize_name(a) else 0.0
+
     norm_a = normalize_name(a)
     norm_b = normalize_name(b)
     
@@ -278,58 +401,151 @@ def calculate_similarity(a, b):
     if norm_a in norm_b or norm_b in norm_a:
         return 1.0
         
-    return difflib.SequenceMatcher(None, norm_a, norm_b).ratio()
+    return _ratio(norm_a, norm_b)
 
-def is_cedido(row, equivalences, fuzzy_threshold=0.80):
-    club = clean_string(row.get('Club'))
-    equipo = clean_string(row.get('Pruebas'))
+def _ratio(norm_a, norm_b):
+    if RAPIDFUZZ_AVAILABLE:
+        return fuzz.ratio(norm_a, norm_b) / 100.0
+    return difflib.SequenceMatcher(None, norm_a, norm_b).ratio()
 
-    if not club or not equipo:
-        return False 
+def is_similar(a, b, threshold):
+    """
+    Equivale a calculate_similarity(a, b) >= threshold, pero sin calcular el ratio
+    cuando no hace falta: umbral <= 0 (todo coincide), umbral >= 1 (solo normalizados
+    contenidos uno en otro) y, sin RapidFuzz, cotas superiores baratas de difflib antes de ratio().
+    """
+    if threshold <= 0.0:
+        return True
+    if threshold > 1.0:
+        return False
+    return _is_similar_normalized(normalize_name(a), normalize_name(b), threshold)
 
-    # 1. Exact Match (Fast)
-    if club.upper() == equipo.upper():
+def _is_similar_normalized(norm_a, norm_b, threshold):
+    """is_similar sobre nombres ya pasados por normalize_name."""
+    if threshold <= 0.0:
+        return True
+    if threshold > 1.0:
+        return False
+    if not norm_a or not norm_b:
         return False
+    if norm_a in norm_b or norm_b in norm_a:
+        return True
+    if threshold >= 1.0:
+        return False # ratio() == 1.0 implica cadenas iguales, ya cubierto arriba
+
+    if RAPIDFUZZ_AVAILABLE:
+        return fuzz.ratio(norm_a, norm_b) / 100.0 >= threshold
+    matcher = difflib.SequenceMatcher(None, norm_a, norm_b)
+    return (
+        matcher.real_quick_ratio() >= threshold
+        and matcher.quick_ratio() >= threshold
+        and matcher.ratio() >= threshold
+    )
+
+def _equivalence_index(equivalences):
+    """{CLUB PRINCIPAL: {FILIALES}} en mayúsculas; como en el bucle original, gana la primera clave."""
+    index = {}
+    for key_club, valid_teams in (equivalences or {}).items():
+        index.setdefault(key_club.upper(), {t.upper() for t in valid_teams})
+    return index
+
+def _similar_many(norm_pairs, threshold):
+    """
+    _is_similar_normalized para muchas parejas. Con RapidFuzz los ratios pendientes
+    se calculan en un solo lote (process.cpdist) repartido entre todos los núcleos.
+    """
+    if not RAPIDFUZZ_AVAILABLE or not (0.0 < threshold < 1.0):
+        return [_is_similar_normalized(a, b, threshold) for a, b in norm_pairs]
+
+    result = [False] * len(norm_pairs)
+    pending = []
+    for i, (a, b) in enumerate(norm_pairs):
+        if not a or not b:
+            continue
+        if a in b or b in a:
+            result[i] = True
+        else:
+            pending.append(i)
+    if pending:
+        scores = process.cpdist(
+            [norm_pairs[i][0] for i in pending], [norm_pairs[i][1] for i in pending],
+            scorer=fuzz.ratio, dtype=np.float64, workers=-1
+        )
+        for i, ok in zip(pending, (scores / 100.0 >= threshold).tolist()):
+            result[i] = ok
+    return result
+
+def _cedido_flags(pairs, eq_index, fuzzy_threshold):
+    """Es_Cedido para una lista de parejas (Club, Pruebas); el fuzzy match se evalúa en lote."""
+    flags = [False] * len(pairs)
+    candidates = []
+    for i, (club, equipo) in enumerate(pairs):
+        club = clean_string(club)
+        equipo = clean_string(equipo)
+        # 1. Sin datos o Exact Match (Fast) -> no cedido
+        if club and equipo and club.upper() != equipo.upper():
+            candidates.append((i, club, equipo))
 
     # 2. Fuzzy Match
-    similarity = calculate_similarity(club, equipo)
-    if similarity >= fuzzy_threshold:
-        return False
+    similar = _similar_many(
+        [(normalize_name(club), normalize_name(equipo)) for _, club, equipo in candidates], fuzzy_threshold
+    )
+    for (i, club, equipo), is_similar_name in zip(candidates, similar):
+        if is_similar_name:
+            continue
+        # 3. Equivalencias (filiales)
+        valid_teams = eq_index.get(club.upper())
+        flags[i] = not (valid_teams and equipo.upper() in valid_teams)
+    return flags
 
-    found_equivalence = False
-    club_upper = club.upper()
-    
-    # Usar el diccionario de equivalencias inyectado
-    if equivalences:
-        for key_club, valid_teams in equivalences.items():
-            if key_club.upper() == club_upper:
-                valid_teams_upper = [t.upper() for t in valid_teams]
-                if equipo.upper() in valid_teams_upper:
-                    found_equivalence = True
-                break
-            
-    if found_equivalence:
-        return False
-        
-    return True
+def _is_cedido_pair(club, equipo, eq_index, fuzzy_threshold):
+    return _cedido_flags([(club, equipo)], eq_index, fuzzy_threshold)[0]
 
-def is_no_seleccionable(row):
-    pais = clean_string(row.get('País'))
-    if pais.upper() != 'SPAIN':
-        return True
-    return False
+def is_cedido(row, equivalences, fuzzy_threshold=0.80):
+    return _is_cedido_pair(row.get('Club'), row.get('Pruebas'), _equivalence_index(equivalences), fuzzy_threshold)
 
-def check_data_health(row):
-    errors = []
-    member_id = row.get('Nº.ID')
-    if pd.isna(member_id) or str(member_id).strip() == "":
-        errors.append("Falta ID")
+def _frame_key(df):
+    """Clave de caché barata para DataFrames pequeños en columnas (hash_funcs de st.cache_data)."""
+    return (len(df), tuple(df.columns), int(pd.util.hash_pandas_object(df, index=True).sum()))
+
+def compute_es_cedido(df, equivalences, fuzzy_threshold=0.80):
+    """
+    is_cedido para todo el DF, evaluado una sola vez por pareja (Club, Pruebas) distinta:
+    un equipo tiene decenas de jugadores del mismo club, así que el fuzzy match
+    (difflib) se repite muchísimo menos que con df.apply(axis=1).
+    """
+    clubs = df['Club'].tolist() if 'Club' in df.columns else [None] * len(df)
+    teams = df['Pruebas'].tolist() if 'Pruebas' in df.columns else [None] * len(df)
     
-    nombre = row.get('Nombre')
-    if pd.isna(nombre) or str(nombre).strip() == "":
-        errors.append("Falta Nombre")
-        
-    return errors
+    pairs = list(zip(clubs, teams))
+    unique_pairs = list(dict.fromkeys(pairs))
+    memo = dict(zip(unique_pairs, _cedido_flags(unique_pairs, _equivalence_index(equivalences), fuzzy_threshold)))
+    return pd.Series([memo[pair] for pair in pairs], index=df.index, dtype=bool)
+
+@st.cache_data(show_spinner=False, max_entries=8, hash_funcs={pd.DataFrame: _frame_key})
+def _cached_es_cedido(pairs, equivalences, fuzzy_threshold):
+    # Solo depende de Club/Pruebas: editar otras columnas (checkboxes, notas) no repite el fuzzy match
+    return compute_es_cedido(pairs, equivalences, fuzzy_threshold)
+
+def no_seleccionable_mask(df):
+    """No seleccionable = País distinto de SPAIN (sin país también cuenta)."""
+    if 'País' not in df.columns:
+        return np.ones(len(df), dtype=bool)
+    return ~df['País'].astype(str).str.strip().str.upper().eq('SPAIN').to_numpy()
+
+def _missing_text(df, col):
+    """Vacío = columna inexistente, nulo o solo espacios."""
+    if col not in df.columns:
+        return np.ones(len(df), dtype=bool)
+    values = df[col]
+    return (values.isna() | values.astype(str).str.strip().eq('')).to_numpy()
+
+def _data_errors(missing_id, missing_name):
+    """Lista de errores de datos por fila a partir de las máscaras de ID y Nombre vacíos."""
+    return [
+        (["Falta ID"] if no_id else []) + (["Falta Nombre"] if no_name else [])
+        for no_id, no_name in zip(missing_id.tolist(), missing_name.tolist())
+    ]
 
 def format_date_for_export(date_val):
     if pd.isna(date_val):
@@ -339,26 +555,95 @@ def format_date_for_export(date_val):
     except:
         return str(date_val)
 
+def format_dates_for_export(dates):
+    """format_date_for_export para una columna entera: un solo to_datetime (format='mixed')."""
+    parsed = pd.to_datetime(dates, errors='coerce', format='mixed')
+    out = parsed.dt.strftime('%d/%m/%Y').astype(object)
+    unparsed = parsed.isna()
+    out[unparsed] = dates[unparsed].astype(str)
+    out[dates.isna()] = ""
+    return out
+
 def format_gender(gender_val):
     g = str(gender_val).upper().strip()
     if g.startswith('F') or g.startswith('M'):
         return g[0]
     return ""
 
+# Columnas de texto con pocos valores distintos: se guardan como Categorical
+# para que filtros (==, isin), unique y groupby trabajen sobre códigos enteros.
+CATEGORICAL_COLS = ['Pruebas', 'Club', 'País', 'Género']
+
+# Género normalizado: la normativa solo distingue 'M' y 'F' (== compara códigos int8).
+# Cualquier otro valor queda como nulo.
+GENDER_DTYPE = pd.CategoricalDtype(['M', 'F', ''])
+
+def categorize_columns(df, cols=CATEGORICAL_COLS):
+    """Convierte (in place) las columnas indicadas a dtype category."""
+    for c in cols:
+        if c in df.columns and not isinstance(df[c].dtype, pd.CategoricalDtype):
+            df[c] = df[c].astype('category')
+    return df
+
+def decategorize_columns(df):
+    """Copia con las columnas Categorical como object (para editores y escrituras libres)."""
+    cat_cols = [c for c in df.columns if isinstance(df[c].dtype, pd.CategoricalDtype)]
+    if not cat_cols:
+        return df
+    return df.astype({c: object for c in cat_cols})
+
+def concat_rows(df_base, df_new):
+    """
+    pd.concat([df_base, df_new], ignore_index=True) sin degradar a object las columnas
+    Categorical (se amplían sus categorías) ni las booleanas del DF base.
+    """
+    df_new = df_new.copy()
+    for c in df_new.columns.intersection(df_base.columns):
+        dt = df_base[c].dtype
+        if isinstance(dt, pd.CategoricalDtype):
+            extra = pd.Index(df_new[c].dropna().unique()).difference(dt.categories)
+            if len(extra):
+                df_base[c] = df_base[c].cat.add_categories(extra)
+            df_new[c] = pd.Categorical(df_new[c], categories=df_base[c].cat.categories)
+        elif dt == bool and df_new[c].dtype != bool \
+                and pd.api.types.infer_dtype(df_new[c], skipna=False) == 'boolean':
+            df_new[c] = df_new[c].astype(bool)
+    return pd.concat([df_base, df_new], ignore_index=True)
+
+def set_cell(df, idx, col, value):
+    """
+    df.at[idx, col] = value, admitiendo valores nuevos en columnas Categorical
+    (pandas lanza TypeError si la categoría no existe).
+    """
+    if isinstance(df[col].dtype, pd.CategoricalDtype) and not pd.isna(value) \
+            and value not in df[col].cat.categories:
+        df[col] = df[col].cat.add_categories([value])
+    df.at[idx, col] = value
+
 @st.cache_data(show_spinner="Procesando datos...", ttl=600)
 def process_dataframe(df, equivalences=None, fuzzy_threshold=0.80):
     if df is None: return None
-    df = df.copy()
+    # Copia superficial: solo se reasignan columnas enteras (nunca se escribe dentro de
+    # las del llamante), y st.cache_data ya entrega una copia propia del resultado.
+    df = df.copy(deep=False)
     
     # Normalización básica
+    # ID como texto (admite IDs alfanuméricos, que to_numeric convertía en 0) con dtype
+    # string[pyarrow]: las comparaciones usan los kernels de Arrow. Sin ID -> "".
     if 'Nº.ID' in df.columns:
-        df['Nº.ID'] = pd.to_numeric(df['Nº.ID'], errors='coerce').fillna(0).astype(int)
+        df['Nº.ID'] = (
+            df['Nº.ID'].astype('string[pyarrow]').fillna('')
+            .str.strip().str.replace(_TRAILING_DOT_ZERO_RE, '', regex=True)
+        )
         
     # Campos calculados
-    df['Es_Cedido'] = df.apply(lambda row: is_cedido(row, equivalences, fuzzy_threshold), axis=1)
-    df['No_Seleccionable'] = df.apply(is_no_seleccionable, axis=1)
-    df['Errores_Datos'] = df.apply(check_data_health, axis=1)
-    df['Datos_Validos'] = df['Errores_Datos'].apply(lambda x: len(x) == 0)
+    pairs = df[[c for c in ('Club', 'Pruebas') if c in df.columns]]
+    df['Es_Cedido'] = _cached_es_cedido(pairs, equivalences, fuzzy_threshold).to_numpy()
+    df['No_Seleccionable'] = no_seleccionable_mask(df)
+    missing_id = _missing_text(df, 'Nº.ID')
+    missing_name = _missing_text(df, 'Nombre')
+    df['Errores_Datos'] = pd.Series(_data_errors(missing_id, missing_name), index=df.index, dtype=object)
+    df['Datos_Validos'] = ~(missing_id | missing_name)
     
     # Inicializar columnas de revisión si no existen
     if 'Declaración_Jurada' not in df.columns:
@@ -374,18 +659,14 @@ def process_dataframe(df, equivalences=None, fuzzy_threshold=0.80):
     if 'Licencia_Subsanada' not in df.columns:
         df['Licencia_Subsanada'] = False
         
-    # Lógica de Estado
-    def determine_status(row):
-        status = []
-        if row['Es_Cedido']: status.append("Cedido")
-        if row['No_Seleccionable']: status.append("Extranjero")
-        if row['Es_Excluido']: status.append("EXCLUIDO")
-        if not row['Datos_Validos']: status.append("Datos Incompletos")
-        
-        if not status: return "OK"
-        return " | ".join(status)
-
-    df['Estado'] = df.apply(determine_status, axis=1)
+    # Lógica de Estado (mismas etiquetas y orden que la versión por filas, unidas con ' | ')
+    status = np.full(len(df), "", dtype=object)
+    _append_error(status, df['Es_Cedido'].astype(bool).to_numpy(), "Cedido")
+    _append_error(status, df['No_Seleccionable'].astype(bool).to_numpy(), "Extranjero")
+    _append_error(status, df['Es_Excluido'].astype(bool).to_numpy(), "EXCLUIDO")
+    _append_error(status, ~df['Datos_Validos'].astype(bool).to_numpy(), "Datos Incompletos")
+    status[status == ""] = "OK"
+    df['Estado'] = status
     
     # Ensure required columns exist before creating Jugador
     if 'Nombre.1' not in df.columns:
@@ -393,214 +674,289 @@ def process_dataframe(df, equivalences=None, fuzzy_threshold=0.80):
     if 'Nombre' not in df.columns:
         df['Nombre'] = ''
     
+    # Nombres como string[pyarrow]: los .str se resuelven en los kernels de Arrow.
+    # Club/Pruebas/País/Género ya se guardan como category (categorize_columns).
+    for col in ('Nombre', 'Nombre.1'):
+        df[col] = df[col].astype('string[pyarrow]')
+
     # Generar columna combinada Jugador
     df['Jugador'] = df['Nombre.1'].fillna('') + ' ' + df['Nombre'].fillna('')
     df['Jugador'] = df['Jugador'].str.strip()
     
     # Normalizar Género
-    df['Género_Norm'] = df['Género'].astype(str).str.upper().str.strip()
-    
-    return df
+    df['Género_Norm'] = df['Género'].astype(str).str.upper().str.strip().astype(GENDER_DTYPE)
+
+    return categorize_columns(df)
+
+def _ratio_lookup(table):
+    """
+    Precalcula la tabla de ratios como array: lut[min(total, len(lut) - 1)] es el máximo
+    de cedidos para ese total (coincidencia exacta, el último tramo por encima de la tabla, si no 0).
+    """
+    if not table:
+        return np.zeros(1, dtype=np.int64)
+    sorted_table = sorted(table, key=lambda x: x['total'])
+    lut = np.zeros(int(sorted_table[-1]['total']) + 2, dtype=np.int64)
+    for rule in reversed(sorted_table): # Con totales repetidos gana el primero, como en el recorrido lineal
+        lut[int(rule['total'])] = rule['max_cedidos']
+    lut[-1] = sorted_table[-1]['max_cedidos']
+    return lut
+
+def _ratio_limit(total, lut):
+    """Máximo de cedidos permitido para un total de jugadores/as según la tabla precalculada."""
+    return int(lut[min(int(total), len(lut) - 1)])
+
+def _is_adult(dob_val, current_year):
+    try:
+        dob = pd.to_datetime(dob_val)
+        age = current_year - dob.year
+        return age >= 18
+    except:
+        return True # Ante la duda, es adulto (error safe)
+
+def _parse_license_start(start_str):
+    # Formato esperado DD/MM/YYYY
+    if not start_str or start_str.lower() in ['nan', 'none', '', '?']:
+        return None
+    try:
+        return datetime.strptime(start_str, "%d/%m/%Y")
+    except:
+        return None
+
+def _append_error(errors, mask, msg, sep=" | "):
+    """Añade msg (str o array por fila) a las filas de mask, separando con sep (' | ' por defecto)."""
+    if not mask.any():
+        return
+    if isinstance(msg, np.ndarray):
+        msg = msg[mask]
+    prev = errors[mask]
+    errors[mask] = np.where(prev != "", prev + sep + msg, msg)
 
 def apply_comprehensive_check(df, rules_config, team_categories):
     """
     Aplica reglas de validación a nivel de equipo e individual y puebla la columna 'Errores_Normativos'.
+
+    Las reglas se resuelven una vez por equipo y se proyectan a las filas con máscaras
+    vectorizadas; el orden de los mensajes por jugador es el mismo que en la versión por filas.
     """
-    df['Errores_Normativos'] = "" # Resetear errores previos
-    
-    # Iterar por equipos para aplicar reglas de conjunto
-    for team_name, group in df.groupby('Pruebas'):
-        category = _get_category_robust(team_name, team_categories)
+    n = len(df)
+    errors = np.full(n, "", dtype=object) # Resetear errores previos
+
+    # Código de equipo por fila (-1 = sin 'Pruebas'). Los arrays por equipo llevan un
+    # elemento extra al final para que el código -1 caiga en un valor neutro.
+    codes, teams = pd.factorize(df['Pruebas'])
+    n_teams = len(teams)
+    if n_teams == 0:
+        df['Errores_Normativos'] = errors
+        return df
+
+    # 0. Filtrar Excluidos para cálculos de equipo
+    # Los excluidos NO cuentan para totales, ni ratios, ni nada.
+    es_excluido = df['Es_Excluido'].fillna(False).astype(bool).to_numpy()
+    not_excluded = (df['Es_Excluido'] == False).to_numpy()
+    active = ~es_excluido & (codes >= 0)
+    genero = df['Género_Norm']
+    es_cedido = df['Es_Cedido'].fillna(False).astype(bool).to_numpy()
+    is_m = (genero == 'M').to_numpy()
+    is_f = (genero == 'F').to_numpy()
+
+    active_codes = codes[active]
+    n_total = np.bincount(active_codes, minlength=n_teams)
+    n_hombres = np.bincount(active_codes, weights=is_m[active], minlength=n_teams).astype(int)
+    n_mujeres = np.bincount(active_codes, weights=is_f[active], minlength=n_teams).astype(int)
+    cedidos_h = np.bincount(active_codes, weights=(is_m & es_cedido)[active], minlength=n_teams).astype(int)
+    cedidos_m = np.bincount(active_codes, weights=(is_f & es_cedido)[active], minlength=n_teams).astype(int)
+
+    # Reglas por equipo
+    team_error_str = np.full(n_teams + 1, "", dtype=object)
+    req_decl = np.zeros(n_teams + 1, dtype=bool)
+    req_loan = np.zeros(n_teams + 1, dtype=bool)
+    forbid_non_sel = np.zeros(n_teams + 1, dtype=bool)
+    minors_only = np.zeros(n_teams + 1, dtype=bool)
+    deadline = np.full(n_teams + 1, np.datetime64('NaT'), dtype='datetime64[ns]')
+
+    team_cats = resolve_team_categories(tuple(teams), team_categories)
+    ratio_luts = {} # Tabla de ratios precalculada por categoría
+    for t, team_name in enumerate(teams):
+        category = team_cats[team_name]
         rules = rules_config.get(category, {})
-        
+
         team_errors = []
-        
-        # 0. Filtrar Excluidos para cálculos de equipo
-        # Los excluidos NO cuentan para totales, ni ratios, ni nada.
-        es_excluido = group['Es_Excluido'].fillna(False).astype(bool)
-        active_group = group[~es_excluido]
 
         if not rules:
             if category == "Sin Asignar":
                 team_errors.append("Equipo sin categoría asignada")
         else:
             # 1. Validación de Totales (Afecta a todo el equipo)
-            n_total = len(active_group)
-            n_hombres = len(active_group[active_group['Género_Norm'] == 'M'])
-            n_mujeres = len(active_group[active_group['Género_Norm'] == 'F'])
-            
-            es_cedido_active = active_group['Es_Cedido'].fillna(False).astype(bool)
-            cedidos_h = len(active_group[(active_group['Género_Norm'] == 'M') & es_cedido_active])
-            cedidos_m = len(active_group[(active_group['Género_Norm'] == 'F') & es_cedido_active])
-
             min_total = rules.get('min_total', 0)
             max_total = rules.get('max_total', 999)
-            
-            if n_total < min_total: team_errors.append(f"Mínimo total no cumplido ({n_total}/{min_total})")
-            if n_total > max_total: team_errors.append(f"Máximo total excedido ({n_total}/{max_total})")
-            
+
+            if n_total[t] < min_total: team_errors.append(f"Mínimo total no cumplido ({n_total[t]}/{min_total})")
+            if n_total[t] > max_total: team_errors.append(f"Máximo total excedido ({n_total[t]}/{max_total})")
+
             min_gender = rules.get('min_gender', 0)
-            if n_hombres < min_gender: team_errors.append(f"Mínimo Hombres no cumplido ({n_hombres}/{min_gender})")
-            if n_mujeres < min_gender: team_errors.append(f"Mínimo Mujeres no cumplido ({n_mujeres}/{min_gender})")
+            if n_hombres[t] < min_gender: team_errors.append(f"Mínimo Hombres no cumplido ({n_hombres[t]}/{min_gender})")
+            if n_mujeres[t] < min_gender: team_errors.append(f"Mínimo Mujeres no cumplido ({n_mujeres[t]}/{min_gender})")
 
             # 2. Validación Ratios Cedidos (Afecta a todo el equipo)
             # Primero verificar si se permiten cedidos en esta categoría
-            allow_loaned = rules.get('allow_loaned_players', True)
-            
-            if not allow_loaned:
-                 if cedidos_h > 0 or cedidos_m > 0:
-                     team_errors.append("⛔ NO SE PERMITEN CEDIDOS en esta categoría")
+            if not rules.get('allow_loaned_players', True):
+                if cedidos_h[t] > 0 or cedidos_m[t] > 0:
+                    team_errors.append("⛔ NO SE PERMITEN CEDIDOS en esta categoría")
             else:
-                ratio_table = rules.get('ratio_table', [])
-                
-                def check_ratio_limit(total, cedidos, table):
-                    limit = 0
-                    sorted_table = sorted(table, key=lambda x: x['total'])
-                    found = False
-                    for rule in sorted_table:
-                        if total == rule['total']:
-                            limit = rule['max_cedidos']
-                            found = True
-                            break
-                        elif rule == sorted_table[-1] and total > rule['total']:
-                            limit = rule['max_cedidos']
-                            found = True
-                    
-                    if not found and sorted_table and total < sorted_table[0]['total']:
-                         limit = 0 # Menos que el mínimo de la tabla -> 0 cedidos
-
-                    return cedidos <= limit, limit
-
-                ok_h, max_h = check_ratio_limit(n_hombres, cedidos_h, ratio_table)
-                ok_m, max_m = check_ratio_limit(n_mujeres, cedidos_m, ratio_table)
-                
-                if not ok_h: team_errors.append(f"Exceso Cedidos H ({cedidos_h}/{max_h})")
-                if not ok_m: team_errors.append(f"Exceso Cedidos M ({cedidos_m}/{max_m})")
+                if category not in ratio_luts:
+                    ratio_luts[category] = _ratio_lookup(rules.get('ratio_table', []))
+                lut = ratio_luts[category]
+                max_h = _ratio_limit(n_hombres[t], lut)
+                max_m = _ratio_limit(n_mujeres[t], lut)
 
-            # 3. Validación Documentación INDIVIDUAL (Afecta solo al jugador)
-            # Se aplica actualizando el dataframe original directamente en los índices correspondientes
-            
-            # A) Declaración Jurada
-            if rules.get('require_declaration', False):
-                # Jugadores del grupo que NO tienen dec. jurada Y NO son de España
-                # (Solo se requiere para extranjeros)
-                missing_decl_mask = (
-                    (df['Pruebas'] == team_name) & 
-                    (df['Declaración_Jurada'] == False) & 
-                    (df['País'].astype(str).str.upper() != 'SPAIN') &
-                    (df['País'].astype(str).str.upper() != 'ESPAÑA') &
-                    (df['Es_Excluido'] == False)
-                )
-                df.loc[missing_decl_mask, 'Errores_Normativos'] = df.loc[missing_decl_mask, 'Errores_Normativos'].apply(lambda x: f"{x} | ⚠️ Falta Dec. Jurada" if x else "⚠️ Falta Dec. Jurada")
-
-            # B) Documento Cesión
-            if rules.get('require_loan_doc', False):
-                # Jugadores CEDIDOS del grupo que NO tienen doc. cesión
-                missing_loan_mask = (df['Pruebas'] == team_name) & (df['Es_Cedido'] == True) & (df['Documento_Cesión'] == False) & (df['Es_Excluido'] == False)
-                df.loc[missing_loan_mask, 'Errores_Normativos'] = df.loc[missing_loan_mask, 'Errores_Normativos'].apply(lambda x: f"{x} | ⚠️ Falta Doc. Cesión" if x else "⚠️ Falta Doc. Cesión")
-
-            # C) No Seleccionables (NUEVO)
-            allow_non_sel = rules.get('allow_non_selectable', True)
-            minors_only = rules.get('non_selectable_minors_only', False)
-
-            if not allow_non_sel:
-                # Marcar error a todos los no seleccionables del equipo
-                non_sel_mask = (df['Pruebas'] == team_name) & (df['No_Seleccionable'] == True) & (df['Es_Excluido'] == False)
-                df.loc[non_sel_mask, 'Errores_Normativos'] = df.loc[non_sel_mask, 'Errores_Normativos'].apply(lambda x: f"{x} | ⚠️ No Seleccionable NO permitido" if x else "⚠️ No Seleccionable NO permitido")
-            
-            elif minors_only:
-                # Permitidos pero SOLO MENORES
-                # Calcular edad. Asumimos F.Nac es datetime o string parseable.
-                # Necesitamos año actual o fecha referencia. Usaremos 1 Enero del año actual o similar.
-                # Mejor: Calcular edad a 31/12 del año actual (standard BWF/FESBA?)
-                # Simplificación: Menor de 18 años.
-                
-                current_year = datetime.now().year
-                
-                def is_adult(dob_val):
-                    try:
-                        dob = pd.to_datetime(dob_val)
-                        age = current_year - dob.year
-                        return age >= 18
-                    except:
-                        return True # Ante la duda, es adulto (error safe)
-
-                # Identificar No Seleccionables que son Adultos
-                # Iteramos sobre el grupo activo para chequear edad
-                for idx, row in active_group.iterrows():
-                    if row['No_Seleccionable']:
-                        if is_adult(row['F.Nac']):
-                            # Marcar error en DF principal
-                            current_err = df.at[idx, 'Errores_Normativos']
-                            new_err = "⛔ No Seleccionable Mayor de Edad"
-                            df.at[idx, 'Errores_Normativos'] = f"{current_err} | {new_err}" if current_err else new_err
-
-                    # D) Validación FESBA Check
-                    if 'Validacion_FESBA' in row:
-                        val_status = str(row['Validacion_FESBA']).upper()
-                        current_err = str(df.at[idx, 'Errores_Normativos']) if pd.notna(df.at[idx, 'Errores_Normativos']) else ""
-                        
-                        fesba_err = None
-                        if "NO ENCONTRADO" in val_status or "FICHA NO ENCONTRADA" in val_status:
-                             fesba_err = "HN-p" # Homologación Nacional pendiente
-                        elif '❌' in val_status:
-                             fesba_err = "⛔ Incidencia FESBA"
-                        
-                        if fesba_err:
-                             # Avoid duplicates
-                             if fesba_err not in current_err:
-                                 new_val = f"{current_err} | {fesba_err}" if current_err else fesba_err
-                                 df.at[idx, 'Errores_Normativos'] = new_val
+                if cedidos_h[t] > max_h: team_errors.append(f"Exceso Cedidos H ({cedidos_h[t]}/{max_h})")
+                if cedidos_m[t] > max_m: team_errors.append(f"Exceso Cedidos M ({cedidos_m[t]}/{max_m})")
+
+            # 3. Documentación INDIVIDUAL: se marca qué reglas aplican al equipo
+            req_decl[t] = bool(rules.get('require_declaration', False))
+            req_loan[t] = bool(rules.get('require_loan_doc', False))
+            if not rules.get('allow_non_selectable', True):
+                forbid_non_sel[t] = True
+            elif rules.get('non_selectable_minors_only', False):
+                minors_only[t] = True
 
             # E) Plazo de Inscripción (Licencia Nacional)
             reg_deadline_str = rules.get('registration_deadline')
-            check_dates = bool(reg_deadline_str and 'Fecha_Inicio_Licencia' in df.columns)
-            
-            if check_dates:
+            if reg_deadline_str and 'Fecha_Inicio_Licencia' in df.columns:
                 try:
-                    deadline_dt = datetime.strptime(reg_deadline_str, "%Y-%m-%d")
-                    # Validar solo filas de este grupo (equipo) que no estén excluidas
-                    # Y que si existe columna Subsanada, sea False
-                    check_mask = (df['Pruebas'] == team_name) & (df['Es_Excluido'] == False)
-                    if 'Licencia_Subsanada' in df.columns:
-                        check_mask = check_mask & (df['Licencia_Subsanada'] == False)
-                    
-                    target_indices = df[check_mask].index
-                    
-                    for idx in target_indices:
-                        val_fesba = str(df.at[idx, 'Validacion_FESBA']) if 'Validacion_FESBA' in df.columns else ""
-                        # Solo afecta a licencias Nacionales/Homologadas
-                        if "Nacional" in val_fesba or "HN" in val_fesba or "Homologada" in val_fesba:
-                            start_str = str(df.at[idx, 'Fecha_Inicio_Licencia'])
-                            # Formato esperado DD/MM/YYYY
-                            if start_str and start_str.lower() not in ['nan', 'none', '', '?']:
-                                try:
-                                    lic_dt = datetime.strptime(start_str, "%d/%m/%Y")
-                                    if lic_dt > deadline_dt:
-                                        err = f"⛔ Fuera de Plazo ({start_str})"
-                                        curr = df.at[idx, 'Errores_Normativos']
-                                        df.at[idx, 'Errores_Normativos'] = f"{curr} | {err}" if curr else err
-                                except:
-                                    pass
+                    deadline[t] = np.datetime64(datetime.strptime(reg_deadline_str, "%Y-%m-%d"), 'ns')
                 except:
                     pass
 
-        # Aplicar errores de EQUIPO a TODOS los miembros (NO EXCLUIDOS)
         if team_errors:
-            error_str = " | ".join([f"⛔ EQUIPO: {e}" for e in team_errors])
-            # Solo aplicar a las filas de este equipo QUE NO ESTÉN EXCLUIDAS
-            group_indices = df[(df['Pruebas'] == team_name) & (df['Es_Excluido'] == False)].index
-            df.loc[group_indices, 'Errores_Normativos'] = df.loc[group_indices, 'Errores_Normativos'].apply(lambda x: f"{x} | {error_str}" if x else error_str)
+            team_error_str[t] = " | ".join([f"⛔ EQUIPO: {e}" for e in team_errors])
+
+    # 3. Validación Documentación INDIVIDUAL (Afecta solo al jugador), en el orden original
+    # A) Declaración Jurada: solo se requiere para extranjeros
+    row_mask = req_decl[codes]
+    if row_mask.any():
+        pais = df['País'].astype(str).str.upper()
+        missing_decl_mask = (
+            row_mask &
+            (df['Declaración_Jurada'] == False).to_numpy() &
+            (pais != 'SPAIN').to_numpy() &
+            (pais != 'ESPAÑA').to_numpy() &
+            not_excluded
+        )
+        _append_error(errors, missing_decl_mask, "⚠️ Falta Dec. Jurada")
+
+    # B) Documento Cesión: jugadores CEDIDOS sin doc. cesión
+    row_mask = req_loan[codes]
+    if row_mask.any():
+        missing_loan_mask = row_mask & (df['Es_Cedido'] == True).to_numpy() & (df['Documento_Cesión'] == False).to_numpy() & not_excluded
+        _append_error(errors, missing_loan_mask, "⚠️ Falta Doc. Cesión")
+
+    # C) No Seleccionables
+    row_mask = forbid_non_sel[codes]
+    if row_mask.any():
+        non_sel_mask = row_mask & (df['No_Seleccionable'] == True).to_numpy() & not_excluded
+        _append_error(errors, non_sel_mask, "⚠️ No Seleccionable NO permitido")
 
-    # Validaciones Individuales Globales (No dependen de reglas de categoría por ahora)
-    # No Seleccionable: Ya no se considera error normativo per se, solo si falta documentación.
-    # mask_extranjero = df['No_Seleccionable'] == True
-    # df.loc[mask_extranjero, 'Errores_Normativos'] = df.loc[mask_extranjero, 'Errores_Normativos'].apply(lambda x: f"{x} | ⚠️ JUGADOR: No Seleccionable" if x else "⚠️ JUGADOR: No Seleccionable")
+    row_mask = minors_only[codes] & ~es_excluido
+    if row_mask.any():
+        # Permitidos pero SOLO MENORES (menor de 18 años en el año actual)
+        current_year = datetime.now().year
+        non_sel_mask = row_mask & df['No_Seleccionable'].astype(bool).to_numpy()
+        adult = np.zeros(n, dtype=bool)
+        if non_sel_mask.any():
+            adult[non_sel_mask] = [_is_adult(v, current_year) for v in df['F.Nac'].to_numpy()[non_sel_mask]]
+        _append_error(errors, adult, "⛔ No Seleccionable Mayor de Edad")
 
+        # D) Validación FESBA Check
+        if 'Validacion_FESBA' in df.columns:
+            val_status = df['Validacion_FESBA'].astype(str).str.upper()
+            not_found = val_status.str.contains("NO ENCONTRADO|FICHA NO ENCONTRADA", regex=True).to_numpy()
+            incidencia = val_status.str.contains('❌', regex=False).to_numpy()
+            _append_error(errors, row_mask & not_found, "HN-p") # Homologación Nacional pendiente
+            _append_error(errors, row_mask & ~not_found & incidencia, "⛔ Incidencia FESBA")
+
+    # E) Plazo de Inscripción (Licencia Nacional)
+    row_deadline = deadline[codes]
+    row_mask = ~np.isnat(row_deadline) & not_excluded
+    if row_mask.any():
+        # Y que si existe columna Subsanada, sea False
+        if 'Licencia_Subsanada' in df.columns:
+            row_mask &= (df['Licencia_Subsanada'] == False).to_numpy()
+        # Solo afecta a licencias Nacionales/Homologadas
+        if 'Validacion_FESBA' in df.columns:
+            row_mask &= df['Validacion_FESBA'].astype(str).str.contains("Nacional|HN|Homologada", regex=True).to_numpy()
+        else:
+            row_mask[:] = False
+        if row_mask.any():
+            start_str = df['Fecha_Inicio_Licencia'].astype(str).to_numpy()
+            parsed = {s: _parse_license_start(s) for s in set(start_str[row_mask])}
+            lic_dt = pd.to_datetime(pd.Series(start_str).map(parsed)).to_numpy()
+            late_mask = row_mask & (lic_dt > row_deadline)
+            _append_error(errors, late_mask, "⛔ Fuera de Plazo (" + start_str.astype(object) + ")")
+
+    # Aplicar errores de EQUIPO a TODOS los miembros (NO EXCLUIDOS)
+    row_team_errors = team_error_str[codes]
+    _append_error(errors, not_excluded & (row_team_errors != ""), row_team_errors)
+
+    df['Errores_Normativos'] = errors
     return df
 
+# --- CACHÉ DE LA AUDITORÍA ---
+# En cada rerun (p.ej. al tocar un filtro) se volvían a ejecutar calculate_team_compliance
+# y apply_comprehensive_check sin que cambiasen ni los datos ni las reglas. Se cachean
+# con una clave sobre las columnas que realmente leen (no todo el DF: 'Errores_Datos'
+# contiene listas, que no se pueden hashear).
+AUDIT_INPUT_COLS = [
+    'Pruebas', 'Es_Excluido', 'Género_Norm', 'Es_Cedido', 'Declaración_Jurada',
+    'Documento_Cesión', 'País', 'No_Seleccionable', 'F.Nac', 'Validacion_FESBA',
+    'Fecha_Inicio_Licencia', 'Licencia_Subsanada'
+]
+
+def _audit_inputs(df):
+    return df[[c for c in AUDIT_INPUT_COLS if c in df.columns]]
+
+def audit_fingerprint(df):
+    """
+    Huella de las columnas de auditoría. Se calcula una vez por rerun y se pasa a
+    calculate_team_compliance_cached y apply_comprehensive_check_cached, que si no
+    hashearían cada una el mismo DF.
+    """
+    return _frame_key(_audit_inputs(df))
+
+# El argumento _inputs (con guion bajo) no se hashea: la clave es la huella
+@st.cache_data(show_spinner=False, max_entries=8)
+def _cached_normative_errors(fingerprint, _inputs, rules_config, team_categories):
+    return apply_comprehensive_check(_inputs.copy(), rules_config, team_categories)['Errores_Normativos']
+
+@st.cache_data(show_spinner=False, max_entries=8)
+def _cached_team_compliance(fingerprint, _inputs, rules_config, team_categories):
+    return calculate_team_compliance(_inputs, rules_config, team_categories)
+
+def apply_comprehensive_check_cached(df, rules_config, team_categories, fingerprint=None):
+    """Como apply_comprehensive_check (rellena 'Errores_Normativos' in place), reutilizando el resultado si nada ha cambiado."""
+    inputs = _audit_inputs(df)
+    if fingerprint is None:
+        fingerprint = _frame_key(inputs)
+    df['Errores_Normativos'] = _cached_normative_errors(fingerprint, inputs, rules_config, team_categories).to_numpy()
+    return df
+
+def calculate_team_compliance_cached(df, rules_config, team_categories, fingerprint=None):
+    """Como calculate_team_compliance, reutilizando el resultado si nada ha cambiado."""
+    inputs = _audit_inputs(df)
+    if fingerprint is None:
+        fingerprint = _frame_key(inputs)
+    return _cached_team_compliance(fingerprint, inputs, rules_config, team_categories)
+
 # Helper para búsqueda robusta de categorías
-def _get_category_robust(team_name, team_categories):
+def _category_norm_index(team_categories):
+    """Índice {nombre normalizado: categoría}; ante colisiones gana la primera entrada."""
+    norm_index = {}
+    for cat_team, cat_val in team_categories.items():
+        norm_index.setdefault(normalize_name(cat_team).lower(), cat_val)
+    return norm_index
+
+def _get_category_robust(team_name, team_categories, norm_index=None):
     team_name = str(team_name)
     # 1. Exact Match
     if team_name in team_categories:
@@ -611,12 +967,19 @@ def _get_category_robust(team_name, team_categories):
         return team_categories[team_name.strip()]
         
     # 3. Normalized Match (Ignoring case and accents)
-    norm_target = normalize_name(team_name).lower()
-    for cat_team, cat_val in team_categories.items():
-        if normalize_name(cat_team).lower() == norm_target:
-            return cat_val
-            
-    return "Sin Asignar"
+    if norm_index is None:
+        norm_index = _category_norm_index(team_categories)
+    return norm_index.get(normalize_name(team_name).lower(), "Sin Asignar")
+
+@st.cache_data(show_spinner=False, max_entries=8)
+def resolve_team_categories(teams, team_categories):
+    """
+    Devuelve {equipo: categoría} para todos los equipos de una vez.
+    El índice normalizado de team_categories se construye una sola vez (y no por equipo),
+    y el resultado se comparte entre calculate_team_compliance y apply_comprehensive_check.
+    """
+    norm_index = _category_norm_index(team_categories)
+    return {team: _get_category_robust(team, team_categories, norm_index) for team in teams}
 
 # --- LÓGICA DE AUDITORÍA DINÁMICA (V2.0) ---
 def calculate_team_compliance(df, rules_config, team_categories):
@@ -626,44 +989,73 @@ def calculate_team_compliance(df, rules_config, team_categories):
     """
     teams_data = []
     
-    for team_name, group in df.groupby('Pruebas'):
+    # Conteos por equipo de una sola pasada (bincount sobre el código de equipo), en vez
+    # de filtrar cada grupo varias veces. sort=True: mismo orden que groupby('Pruebas').
+    codes, teams = pd.factorize(df['Pruebas'], sort=True)
+    n_teams = len(teams)
+    valid = codes >= 0
+    
+    def count(mask):
+        return np.bincount(codes[valid & mask], minlength=n_teams)
+    
+    # Ensure Es_Excluido exists (backward compatibility)
+    if 'Es_Excluido' in df.columns:
+        es_excluido = df['Es_Excluido'].fillna(False).astype(bool).to_numpy()
+    else:
+        es_excluido = np.zeros(len(df), dtype=bool)
+    active = ~es_excluido
+    genero = df['Género_Norm']
+    is_m = (genero == 'M').to_numpy()
+    is_f = (genero == 'F').to_numpy()
+    es_cedido = df['Es_Cedido'].fillna(False).astype(bool).to_numpy()
+    
+    all_total = count(np.ones(len(df), dtype=bool))
+    all_h, all_m = count(is_m), count(is_f)
+    all_ced_h, all_ced_m = count(is_m & es_cedido), count(is_f & es_cedido)
+    act_total = count(active)
+    act_h, act_m = count(active & is_m), count(active & is_f)
+    act_ced_h, act_ced_m = count(active & is_m & es_cedido), count(active & is_f & es_cedido)
+    
+    # Documentación (sobre todo el equipo, incluidos excluidos): solo se calcula si alguna regla la exige
+    missing_decl_counts = missing_loan_counts = None
+    if any(r.get('require_declaration', False) for r in rules_config.values()):
+        if 'País' in df.columns:
+            extranjero = (df['País'].astype(str).str.lower().str.strip() != 'spain').to_numpy()
+            missing_decl_counts = count(extranjero & ~df['Declaración_Jurada'].astype(bool).to_numpy())
+        else:
+            missing_decl_counts = np.zeros(n_teams, dtype=int)  # Sin columna País, no podemos verificar
+    if any(r.get('require_loan_doc', False) for r in rules_config.values()):
+        doc_cesion = df['Documento_Cesión'].fillna(False).astype(bool).to_numpy()
+        missing_loan_counts = count(es_cedido & ~doc_cesion)
+    
+    team_cats = resolve_team_categories(tuple(teams), team_categories)
+    ratio_luts = {} # Tabla de ratios precalculada por categoría
+    for t, team_name in enumerate(teams):
         # 1. Identificar Reglas
-        category = _get_category_robust(team_name, team_categories)
+        category = team_cats[team_name]
         rules = rules_config.get(category, {})
-        rules = rules_config.get(category, {})
-        
-        # Ensure Es_Excluido exists (backward compatibility)
-        if 'Es_Excluido' not in group.columns:
-            group = group.copy()
-            group['Es_Excluido'] = False
         
         # Si no hay reglas para la categoría (ej: Sin Asignar), saltar validación estricta
         if not rules:
             teams_data.append({
                 "Equipo": team_name,
                 "Categoría": category,
-                "Total J.": len(group),
-                "Hombres": len(group[group['Género_Norm'] == 'M']),
-                "Mujeres": len(group[group['Género_Norm'] == 'F']),
-                "Cedidos H": f"{len(group[(group['Género_Norm'] == 'M') & (group['Es_Cedido'])])} (?)",
-                "Cedidos M": f"{len(group[(group['Género_Norm'] == 'F') & (group['Es_Cedido'])])} (?)",
+                "Total J.": all_total[t],
+                "Hombres": all_h[t],
+                "Mujeres": all_m[t],
+                "Cedidos H": f"{all_ced_h[t]} (?)",
+                "Cedidos M": f"{all_ced_m[t]} (?)",
                 "Estado General": "⚠️ Config. Pendiente",
                 "Detalles": "Categoría no asignada o sin reglas definidas. Ve a Configuración."
             })
             continue
 
-        # 2. Calcular Totales (Ignorando Excluidos)
-        # Ensure Es_Excluido is boolean
-        es_excluido = group['Es_Excluido'].fillna(False).astype(bool)
-        active_group = group[~es_excluido]
-        
-        n_total = len(active_group)
-        n_hombres = len(active_group[active_group['Género_Norm'] == 'M'])
-        n_mujeres = len(active_group[active_group['Género_Norm'] == 'F'])
-        
-        es_cedido_grp = active_group['Es_Cedido'].fillna(False).astype(bool)
-        cedidos_h = len(active_group[(active_group['Género_Norm'] == 'M') & es_cedido_grp])
-        cedidos_m = len(active_group[(active_group['Género_Norm'] == 'F') & es_cedido_grp])
+        # 2. Totales (Ignorando Excluidos)
+        n_total = act_total[t]
+        n_hombres = act_h[t]
+        n_mujeres = act_m[t]
+        cedidos_h = act_ced_h[t]
+        cedidos_m = act_ced_m[t]
         
         propios_h = n_hombres - cedidos_h
         propios_m = n_mujeres - cedidos_m
@@ -683,61 +1075,23 @@ def calculate_team_compliance(df, rules_config, team_categories):
         if n_mujeres < min_gender: issues.append(f"Min {min_gender} Mujeres")
         
         # C) Ratio Cedidos (Tabla Dinámica)
-        ratio_table = rules.get('ratio_table', [])
+        if category not in ratio_luts:
+            ratio_luts[category] = _ratio_lookup(rules.get('ratio_table', []))
+        max_h = _ratio_limit(n_hombres, ratio_luts[category])
+        max_m = _ratio_limit(n_mujeres, ratio_luts[category])
         
-        def check_ratio_dynamic(total_g, cedidos_g, table):
-            # Buscar la regla en la tabla que corresponda al total
-            # La tabla suele ser [{"total": 4, "max_cedidos": 1}, ...]
-            # Si no encuentra exacto, buscar el más cercano inferior o superior según lógica.
-            # Asumiremos "rango" o exact match. En la tabla 9.1, "10 o más" implica lógica >=.
-            
-            allowed = 0
-            found_rule = False
-            
-            # Ordenar tabla por total ascendente para evaluar >=
-            sorted_table = sorted(table, key=lambda x: x['total'])
-            
-            for rule in sorted_table:
-                if total_g == rule['total']:
-                    allowed = rule['max_cedidos']
-                    found_rule = True
-                    break
-                elif rule == sorted_table[-1] and total_g > rule['total']:
-                     # Caso "10 o más" -> aplica la última regla
-                     allowed = rule['max_cedidos']
-                     found_rule = True
-            
-            # Si tiene menos jugadores que el mínimo de la tabla (ej < 4), 
-            # asumimos 0 cedidos permitidos o permitimos 0.
-            if not found_rule:
-                if sorted_table and total_g < sorted_table[0]['total']:
-                    allowed = 0 # Muy pocos jugadores para tener cedidos
-                else:
-                    allowed = 0 # Fallback
-            
-            return cedidos_g <= allowed, allowed
-
-        ratio_h_ok, max_h = check_ratio_dynamic(n_hombres, cedidos_h, ratio_table)
-        ratio_m_ok, max_m = check_ratio_dynamic(n_mujeres, cedidos_m, ratio_table)
-        
-        if not ratio_h_ok: issues.append(f"Exceso Cedidos H ({cedidos_h}/{max_h})")
-        if not ratio_m_ok: issues.append(f"Exceso Cedidos M ({cedidos_m}/{max_m})")
+        if cedidos_h > max_h: issues.append(f"Exceso Cedidos H ({cedidos_h}/{max_h})")
+        if cedidos_m > max_m: issues.append(f"Exceso Cedidos M ({cedidos_m}/{max_m})")
 
         # D) Documentación (Si las reglas lo exigen)
         # Por ahora es un check visual, no bloqueante 'NO APTO' estricto salvo configuración.
         if rules.get('require_declaration', False):
             # Solo contar jugadores extranjeros (no españoles) que faltan Dec. Jurada
-            if 'País' in group.columns:
-                extranjeros = group[group['País'].astype(str).str.lower().str.strip() != 'spain']
-                missing_decl = len(extranjeros[~extranjeros['Declaración_Jurada']])
-            else:
-                missing_decl = 0  # Sin columna País, no podemos verificar
+            missing_decl = missing_decl_counts[t]
             if missing_decl > 0: issues.append(f"Faltan {missing_decl} Dec. Juradas (extranjeros)")
             
         if rules.get('require_loan_doc', False):
-            es_cedido_bool = group['Es_Cedido'].fillna(False).astype(bool)
-            doc_cesion_bool = group['Documento_Cesión'].fillna(False).astype(bool)
-            missing_loan = len(group[es_cedido_bool & ~doc_cesion_bool])
+            missing_loan = missing_loan_counts[t]
             if missing_loan > 0: issues.append(f"Faltan {missing_loan} Doc. Cesión")
 
         # Estado General
@@ -757,29 +1111,70 @@ def calculate_team_compliance(df, rules_config, team_categories):
         
     return pd.DataFrame(teams_data)
 
+def _file_version(path):
+    """mtime del fichero (None si no existe): clave de las cachés de configuración."""
+    try:
+        return os.path.getmtime(path)
+    except OSError:
+        return None
+
+@lru_cache(maxsize=8)
+def _read_json_config(path, version):
+    if version is None:
+        return {}
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except:
+        return {}
+
 def load_club_ids_mapping():
-    """Load ClubName -> ClubNumber mapping from config."""
+    """Load ClubName -> ClubNumber mapping from config (cacheado hasta que cambie el fichero)."""
     config_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'config', 'club_ids.json')
-    if os.path.exists(config_path):
-        try:
-            with open(config_path, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        except:
-            return {}
-    return {}
+    return _read_json_config(config_path, _file_version(config_path)).copy()
 
 def load_team_clubid_overrides():
-    """Load manual Team -> ClubID overrides."""
+    """Load manual Team -> ClubID overrides (cacheado hasta que cambie el fichero)."""
     override_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'config', 'team_clubid_override.json')
-    if os.path.exists(override_path):
-        try:
-            with open(override_path, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        except:
-            return {}
-    return {}
+    return _read_json_config(override_path, _file_version(override_path)).copy()
+
+TEAMS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'Teams y clubs Liga Nacional de Clubes edición 2025-2026.XLSX')
+
+@lru_cache(maxsize=2)
+def _read_teams_mapping(path, version):
+    """{EQUIPO: {'team_id', 'club_id', 'club_name'}} del Excel de Teams y clubs. Solo lectura."""
+    teams_mapping = {}
+    if version is None:
+        return teams_mapping
+    try:
+        teams_df = pd.read_excel(path)
+        for _, row in teams_df.iterrows():
+            team_name = str(row.get('Team', '')).strip()
+            if team_name and team_name.lower() not in ['nan', 'none', '']:
+                teams_mapping[team_name.upper()] = {
+                    'team_id': str(row.get('Team-ID', '')).strip(),
+                    'club_id': str(row.get('Club-ID', '')).strip(),
+                    'club_name': str(row.get('Club', '')).strip()
+                }
+    except Exception as e:
+        print(f"Warning: Could not load teams mapping: {e}")
+    return teams_mapping
+
+def load_teams_mapping():
+    return _read_teams_mapping(TEAMS_FILE, _file_version(TEAMS_FILE))
 
-def get_clubid_for_team(team_name, club_ids_mapping):
+def club_id_index(club_ids_mapping):
+    """
+    Índices para get_clubid_for_team, construidos una vez por exportación:
+    {NOMBRE EN MAYÚSCULAS: id} (gana la primera entrada) y los nombres normalizados con su id, en orden.
+    """
+    upper_index = {}
+    for club_name, club_id in club_ids_mapping.items():
+        upper_index.setdefault(club_name.upper(), club_id)
+    norm_names = [normalize_name(club_name) for club_name in club_ids_mapping]
+    return upper_index, norm_names, list(club_ids_mapping.values())
+
+def get_clubid_for_team(team_name, club_ids_mapping, index=None, threshold=0.85):
     """
     Get ClubNumber for a team name using fuzzy matching.
     The clubid is determined by the TEAM (Pruebas) where the player competes,
@@ -794,26 +1189,160 @@ def get_clubid_for_team(team_name, club_ids_mapping):
     if team_str in club_ids_mapping:
         return club_ids_mapping[team_str]
     
+    if index is None:
+        index = club_id_index(club_ids_mapping)
+    upper_index, norm_names, club_ids = index
+
     # 2. Case-insensitive match
-    for club_name, club_id in club_ids_mapping.items():
-        if club_name.upper() == team_str.upper():
-            return club_id
+    if team_str.upper() in upper_index:
+        return upper_index[team_str.upper()]
     
-    # 3. Normalized/fuzzy match
+    # 3. Normalized/fuzzy match: primera entrada (en orden) que contenga o se parezca al equipo.
+    # Con RapidFuzz los ratios contra todos los clubes salen de una sola llamada en C.
     norm_team = normalize_name(team_str)
-    for club_name, club_id in club_ids_mapping.items():
-        norm_club = normalize_name(club_name)
+    ratios = None
+    if RAPIDFUZZ_AVAILABLE and norm_team and norm_names:
+        ratios = process.cdist([norm_team], norm_names, scorer=fuzz.ratio, dtype=np.float64)[0] / 100.0
+    for i, norm_club in enumerate(norm_names):
         # Substring check
         if norm_team in norm_club or norm_club in norm_team:
-            return club_id
-        # Similarity check
-        if calculate_similarity(team_str, club_name) >= 0.85:
-            return club_id
+            return club_ids[i]
+        # Similarity check (calculate_similarity sobre los nombres ya normalizados)
+        if norm_team and norm_club:
+            ratio = ratios[i] if ratios is not None else _ratio(norm_team, norm_club)
+            if ratio >= threshold:
+                return club_ids[i]
     
     return ""  # Not found
 
+# Género para Tournament Planner; lo que no esté aquí se exporta con su primera letra
+_GENDER_TP_MAP = {
+    'M': 'M', 'MASCULINO': 'M', 'MALE': 'M', 'H': 'M', 'HOMBRE': 'M',
+    'F': 'F', 'FEMENINO': 'F', 'FEMALE': 'F', 'MUJER': 'F',
+}
+
+# Comprehensive mapping of country names to IOC codes (usado en la exportación de jugadores)
+_IOC_MAPPING = {
+    # Spanish variants
+    'SPAIN': 'ESP', 'ESPAÑA': 'ESP', 'ESPANA': 'ESP',
+    # Common countries
+    'FRANCE': 'FRA', 'FRANCIA': 'FRA',
+    'GERMANY': 'GER', 'ALEMANIA': 'GER', 'DEUTSCHLAND': 'GER',
+    'ITALY': 'ITA', 'ITALIA': 'ITA',
+    'PORTUGAL': 'POR',
+    'UNITED KINGDOM': 'GBR', 'UK': 'GBR', 'GREAT BRITAIN': 'GBR', 'REINO UNIDO': 'GBR', 'ENGLAND': 'GBR',
+    'UNITED STATES': 'USA', 'USA': 'USA', 'ESTADOS UNIDOS': 'USA', 'EE.UU.': 'USA',
+    'NETHERLANDS': 'NED', 'HOLANDA': 'NED', 'PAISES BAJOS': 'NED', 'PAÍSES BAJOS': 'NED',
+    'BELGIUM': 'BEL', 'BELGICA': 'BEL', 'BÉLGICA': 'BEL',
+    'SWITZERLAND': 'SUI', 'SUIZA': 'SUI',
+    'AUSTRIA': 'AUT',
+    'POLAND': 'POL', 'POLONIA': 'POL',
+    'RUSSIA': 'RUS', 'RUSIA': 'RUS',
+    'CHINA': 'CHN',
+    'JAPAN': 'JPN', 'JAPON': 'JPN', 'JAPÓN': 'JPN',
+    'SOUTH KOREA': 'KOR', 'KOREA': 'KOR', 'COREA': 'KOR', 'COREA DEL SUR': 'KOR',
+    'INDIA': 'IND',
+    'BRAZIL': 'BRA', 'BRASIL': 'BRA',
+    'ARGENTINA': 'ARG',
+    'MEXICO': 'MEX', 'MÉXICO': 'MEX',
+    'COLOMBIA': 'COL',
+    'CHILE': 'CHI',
+    'PERU': 'PER', 'PERÚ': 'PER',
+    'VENEZUELA': 'VEN',
+    'ECUADOR': 'ECU',
+    'CUBA': 'CUB',
+    'DOMINICAN REPUBLIC': 'DOM', 'REPUBLICA DOMINICANA': 'DOM', 'REPÚBLICA DOMINICANA': 'DOM',
+    'CANADA': 'CAN', 'CANADÁ': 'CAN',
+    'AUSTRALIA': 'AUS',
+    'NEW ZEALAND': 'NZL', 'NUEVA ZELANDA': 'NZL',
+    'SWEDEN': 'SWE', 'SUECIA': 'SWE',
+    'NORWAY': 'NOR', 'NORUEGA': 'NOR',
+    'DENMARK': 'DEN', 'DINAMARCA': 'DEN',
+    'FINLAND': 'FIN', 'FINLANDIA': 'FIN',
+    'IRELAND': 'IRL', 'IRLANDA': 'IRL',
+    'CZECH REPUBLIC': 'CZE', 'CHEQUIA': 'CZE', 'REPUBLICA CHECA': 'CZE',
+    'ROMANIA': 'ROU', 'RUMANIA': 'ROU', 'RUMANÍA': 'ROU',
+    'HUNGARY': 'HUN', 'HUNGRIA': 'HUN', 'HUNGRÍA': 'HUN',
+    'UKRAINE': 'UKR', 'UCRANIA': 'UKR',
+    'GREECE': 'GRE', 'GRECIA': 'GRE',
+    'TURKEY': 'TUR', 'TURQUIA': 'TUR', 'TURQUÍA': 'TUR',
+    'MOROCCO': 'MAR', 'MARRUECOS': 'MAR',
+    'EGYPT': 'EGY', 'EGIPTO': 'EGY',
+    'SOUTH AFRICA': 'RSA', 'SUDAFRICA': 'RSA', 'SUDÁFRICA': 'RSA',
+    'NIGERIA': 'NGR',
+    'INDONESIA': 'INA',
+    'MALAYSIA': 'MAS', 'MALASIA': 'MAS',
+    'THAILAND': 'THA', 'TAILANDIA': 'THA',
+    'VIETNAM': 'VIE',
+    'PHILIPPINES': 'PHI', 'FILIPINAS': 'PHI',
+    'SINGAPORE': 'SGP', 'SINGAPUR': 'SGP',
+    'TAIWAN': 'TPE',
+    'HONG KONG': 'HKG',
+    'PAKISTAN': 'PAK', 'PAKISTÁN': 'PAK',
+    'BANGLADESH': 'BAN',
+    'SRI LANKA': 'SRI',
+    'NEPAL': 'NEP',
+    'IRAN': 'IRI', 'IRÁN': 'IRI',
+    'IRAQ': 'IRQ',
+    'ISRAEL': 'ISR',
+    'LEBANON': 'LBN', 'LIBANO': 'LBN', 'LÍBANO': 'LBN',
+    'SAUDI ARABIA': 'KSA', 'ARABIA SAUDITA': 'KSA', 'ARABIA SAUDÍ': 'KSA',
+    'UNITED ARAB EMIRATES': 'UAE', 'EAU': 'UAE', 'EMIRATOS ARABES': 'UAE',
+    'BULGARIA': 'BUL',
+    'CROATIA': 'CRO', 'CROACIA': 'CRO',
+    'SERBIA': 'SRB',
+    'SLOVENIA': 'SLO', 'ESLOVENIA': 'SLO',
+    'SLOVAKIA': 'SVK', 'ESLOVAQUIA': 'SVK',
+    'LITHUANIA': 'LTU', 'LITUANIA': 'LTU',
+    'LATVIA': 'LAT', 'LETONIA': 'LAT',
+    'ESTONIA': 'EST',
+    'ANDORRA': 'AND',
+    'LUXEMBOURG': 'LUX', 'LUXEMBURGO': 'LUX',
+    'ICELAND': 'ISL', 'ISLANDIA': 'ISL',
+    'CYPRUS': 'CYP', 'CHIPRE': 'CYP',
+    'MALTA': 'MLT',
+    'MONACO': 'MON', 'MÓNACO': 'MON',
+    'LIECHTENSTEIN': 'LIE',
+    'BOLIVIA': 'BOL',
+    'PARAGUAY': 'PAR',
+    'URUGUAY': 'URU',
+    'COSTA RICA': 'CRC',
+    'PANAMA': 'PAN', 'PANAMÁ': 'PAN',
+    'GUATEMALA': 'GUA',
+    'HONDURAS': 'HON',
+    'EL SALVADOR': 'ESA',
+    'NICARAGUA': 'NCA',
+    'PUERTO RICO': 'PUR',
+}
+
+def _map_per_value(values, func):
+    """values.apply(func) evaluando func una sola vez por valor distinto (y una vez para los nulos)."""
+    codes, uniques = pd.factorize(values)
+    results = np.empty(len(uniques) + 1, dtype=object)
+    for i, value in enumerate(uniques):
+        results[i] = func(value)
+    results[-1] = func(np.nan) # código -1 = nulo
+    return pd.Series(results[codes], index=values.index)
+
+# Columnas que leen los exportadores (las opcionales se ignoran si no existen)
+PLAYERS_EXPORT_COLS = ['Nº.ID', 'Pruebas', 'Nombre', 'Nombre.1', 'F.Nac', 'Género', 'País',
+                       'Es_Cedido', 'Declaración_Jurada', 'Validacion_FESBA']
+TEAM_PLAYERS_EXPORT_COLS = ['Nº.ID', 'Pruebas']
+TP_EXPORT_COLS = ['Nº.ID', 'Pruebas', 'Nombre', 'Nombre.1', '2ºNombre', 'F.Nac', 'Género', 'País',
+                  'Es_Cedido', 'Club', 'Telefono', 'Móvil', 'Email', 'Correo',
+                  'Nivel_Singles', 'Nivel_Dobles']
+
+
+def _export_rows(df, columns):
+    """Filas válidas (o todas si no hay Datos_Validos) proyectadas a las columnas que se exportan."""
+    cols = [c for c in columns if c in df.columns]
+    if 'Datos_Validos' in df.columns:
+        return df.loc[df['Datos_Validos'], cols]
+    return df[cols]
+
+
 def generate_players_csv(df):
-    valid_df = df[df['Datos_Validos']].copy()
+    valid_df = _export_rows(df, PLAYERS_EXPORT_COLS)
     
     # FILTERS REVERTED per user request ("ponerlo igual").
     # Exporting raw valid data without excluding specific normative errors.
@@ -821,6 +1350,10 @@ def generate_players_csv(df):
     # Load club IDs mapping (auto) and manual overrides
     club_ids_mapping = load_club_ids_mapping()
     team_overrides = load_team_clubid_overrides()
+    overrides_ci = {}
+    for override_team, override_id in team_overrides.items():
+        overrides_ci.setdefault(override_team.upper(), override_id) # Como en el recorrido: gana la primera
+    club_index = club_id_index(club_ids_mapping)
     
     def get_final_clubid(team_name):
         """Get ClubID: first check manual override, then auto-detect."""
@@ -833,57 +1366,57 @@ def generate_players_csv(df):
             return team_overrides[team_str]
         
         # 2. Case-insensitive override check
-        for override_team, override_id in team_overrides.items():
-            if override_team.upper() == team_str.upper():
-                return override_id
+        if team_str.upper() in overrides_ci:
+            return overrides_ci[team_str.upper()]
         
         # 3. Fall back to auto-detection
-        return get_clubid_for_team(team_str, club_ids_mapping)
+        return get_clubid_for_team(team_str, club_ids_mapping, club_index)
     
-    def build_lastname_with_markers(row):
+    def build_lastname_with_markers(valid_df):
         """
-        Build lastname with status markers:
+        Build lastname with status markers (por columnas, no fila a fila):
         - (C) = Cedido (loaned player)
         - (DJ-p) = Declaración Jurada pendiente
         - (HN-p) = Homologación Nacional pendiente (no active national license)
         """
-        lastname = str(row.get('Nombre', '')).strip()
-        if pd.isna(lastname) or lastname.lower() == 'nan':
-            lastname = ""
+        n = len(valid_df)
+        def col_text(col):
+            if col in valid_df.columns:
+                return valid_df[col].astype(str)
+            return pd.Series("", index=valid_df.index)
+
+        lastname = col_text('Nombre').str.strip()
+        lastname = lastname.where(lastname.str.lower() != 'nan', "").to_numpy(dtype=object)
         
-        markers = []
+        markers = np.full(n, "", dtype=object)
         
         # Check if Cedido
-        es_cedido = row.get('Es_Cedido', False)
-        if es_cedido == True:
-            markers.append("C")
+        if 'Es_Cedido' in valid_df.columns:
+            _append_error(markers, (valid_df['Es_Cedido'] == True).to_numpy(), "C", sep=", ")
         
         # Check if missing Declaración Jurada (only for non-Spanish players)
-        pais = str(row.get('País', '')).upper().strip()
-        decl_jurada = row.get('Declaración_Jurada', False)
-        if pais != 'SPAIN' and pais != 'ESPAÑA' and not decl_jurada:
-            markers.append("DJ-p")
+        pais = col_text('País').str.upper().str.strip()
+        if 'Declaración_Jurada' in valid_df.columns:
+            decl_jurada = valid_df['Declaración_Jurada'].astype(bool).to_numpy()
+        else:
+            decl_jurada = np.zeros(n, dtype=bool)
+        _append_error(markers, ((pais != 'SPAIN') & (pais != 'ESPAÑA')).to_numpy() & ~decl_jurada, "DJ-p", sep=", ")
         
         # Check if missing Homologación Nacional (national license)
         # This is determined by Validacion_FESBA column
-        validacion = str(row.get('Validacion_FESBA', '')).upper()
-        has_national_license = False
-        if '✅' in validacion and ('NACIONAL' in validacion or 'HN' in validacion or 'HOMOLOGADA' in validacion):
-            has_national_license = True
-        
-        if not has_national_license:
-            # Also check if it says "NO ENCONTRADO" or has error
-            if 'NO ENCONTRADO' in validacion or '❌' in validacion or not validacion.strip():
-                markers.append("HN-p")
-            elif 'NO NAC' in validacion or 'AUTONÓMICA' in validacion or 'PROVINCIAL' in validacion:
-                # Has license but not national
-                markers.append("HN-p")
+        validacion = col_text('Validacion_FESBA').str.upper()
+        has_national_license = (
+            validacion.str.contains('✅', regex=False)
+            & validacion.str.contains(_NATIONAL_LICENSE_RE, regex=True)
+        )
+        # Sin licencia nacional: "NO ENCONTRADO", error o vacío, o licencia no nacional
+        pending = validacion.str.contains(_LICENSE_PENDING_RE, regex=True) | (validacion.str.strip() == "")
+        _append_error(markers, (~has_national_license & pending).to_numpy(), "HN-p", sep=", ")
         
         # Build final lastname
-        if markers:
-            lastname = f"{lastname} ({', '.join(markers)})"
-        
-        return lastname
+        with_markers = markers != ""
+        lastname[with_markers] = lastname[with_markers] + " (" + markers[with_markers] + ")"
+        return pd.Series(lastname, index=valid_df.index)
     
     def normalize_text_for_export(text):
         """Clean text for CSV export - just strip whitespace, data is already correct."""
@@ -892,140 +1425,31 @@ def generate_players_csv(df):
         return str(text).strip()
     
     export_df = pd.DataFrame()
-    export_df['memberid'] = valid_df['Nº.ID'].astype(str).str.replace(r'\.0$', '', regex=True)
+    export_df['memberid'] = valid_df['Nº.ID'].astype(str).str.replace(_TRAILING_DOT_ZERO_RE, '', regex=True)
     
     # ClubID is determined by the TEAM (Pruebas) where the player competes
     # This applies to BOTH own players AND loaned players
-    export_df['clubid'] = valid_df['Pruebas'].apply(get_final_clubid)
+    export_df['clubid'] = _map_per_value(valid_df['Pruebas'], get_final_clubid)
     
     # Build lastname with status markers and normalize
-    export_df['lastname'] = valid_df.apply(build_lastname_with_markers, axis=1).apply(normalize_text_for_export)
+    export_df['lastname'] = build_lastname_with_markers(valid_df).apply(normalize_text_for_export)
     export_df['firstname'] = valid_df['Nombre.1'].apply(normalize_text_for_export)
-    export_df['dob'] = valid_df['F.Nac'].apply(format_date_for_export)
+    export_df['dob'] = format_dates_for_export(valid_df['F.Nac'])
     export_df['gender'] = valid_df['Género'].apply(format_gender)
     
-    # Convert country names to IOC codes
-    def country_to_ioc_code(country):
-        """Convert country name to IOC/ISO 3-letter code."""
-        if pd.isna(country):
-            return ""
-        country_str = str(country).strip().upper()
-        
-        # Comprehensive mapping of country names to IOC codes
-        ioc_mapping = {
-            # Spanish variants
-            'SPAIN': 'ESP', 'ESPAÑA': 'ESP', 'ESPANA': 'ESP',
-            # Common countries
-            'FRANCE': 'FRA', 'FRANCIA': 'FRA',
-            'GERMANY': 'GER', 'ALEMANIA': 'GER', 'DEUTSCHLAND': 'GER',
-            'ITALY': 'ITA', 'ITALIA': 'ITA',
-            'PORTUGAL': 'POR',
-            'UNITED KINGDOM': 'GBR', 'UK': 'GBR', 'GREAT BRITAIN': 'GBR', 'REINO UNIDO': 'GBR', 'ENGLAND': 'GBR',
-            'UNITED STATES': 'USA', 'USA': 'USA', 'ESTADOS UNIDOS': 'USA', 'EE.UU.': 'USA',
-            'NETHERLANDS': 'NED', 'HOLANDA': 'NED', 'PAISES BAJOS': 'NED', 'PAÍSES BAJOS': 'NED',
-            'BELGIUM': 'BEL', 'BELGICA': 'BEL', 'BÉLGICA': 'BEL',
-            'SWITZERLAND': 'SUI', 'SUIZA': 'SUI',
-            'AUSTRIA': 'AUT',
-            'POLAND': 'POL', 'POLONIA': 'POL',
-            'RUSSIA': 'RUS', 'RUSIA': 'RUS',
-            'CHINA': 'CHN',
-            'JAPAN': 'JPN', 'JAPON': 'JPN', 'JAPÓN': 'JPN',
-            'SOUTH KOREA': 'KOR', 'KOREA': 'KOR', 'COREA': 'KOR', 'COREA DEL SUR': 'KOR',
-            'INDIA': 'IND',
-            'BRAZIL': 'BRA', 'BRASIL': 'BRA',
-            'ARGENTINA': 'ARG',
-            'MEXICO': 'MEX', 'MÉXICO': 'MEX',
-            'COLOMBIA': 'COL',
-            'CHILE': 'CHI',
-            'PERU': 'PER', 'PERÚ': 'PER',
-            'VENEZUELA': 'VEN',
-            'ECUADOR': 'ECU',
-            'CUBA': 'CUB',
-            'DOMINICAN REPUBLIC': 'DOM', 'REPUBLICA DOMINICANA': 'DOM', 'REPÚBLICA DOMINICANA': 'DOM',
-            'CANADA': 'CAN', 'CANADÁ': 'CAN',
-            'AUSTRALIA': 'AUS',
-            'NEW ZEALAND': 'NZL', 'NUEVA ZELANDA': 'NZL',
-            'SWEDEN': 'SWE', 'SUECIA': 'SWE',
-            'NORWAY': 'NOR', 'NORUEGA': 'NOR',
-            'DENMARK': 'DEN', 'DINAMARCA': 'DEN',
-            'FINLAND': 'FIN', 'FINLANDIA': 'FIN',
-            'IRELAND': 'IRL', 'IRLANDA': 'IRL',
-            'CZECH REPUBLIC': 'CZE', 'CHEQUIA': 'CZE', 'REPUBLICA CHECA': 'CZE',
-            'ROMANIA': 'ROU', 'RUMANIA': 'ROU', 'RUMANÍA': 'ROU',
-            'HUNGARY': 'HUN', 'HUNGRIA': 'HUN', 'HUNGRÍA': 'HUN',
-            'UKRAINE': 'UKR', 'UCRANIA': 'UKR',
-            'GREECE': 'GRE', 'GRECIA': 'GRE',
-            'TURKEY': 'TUR', 'TURQUIA': 'TUR', 'TURQUÍA': 'TUR',
-            'MOROCCO': 'MAR', 'MARRUECOS': 'MAR',
-            'EGYPT': 'EGY', 'EGIPTO': 'EGY',
-            'SOUTH AFRICA': 'RSA', 'SUDAFRICA': 'RSA', 'SUDÁFRICA': 'RSA',
-            'NIGERIA': 'NGR',
-            'INDONESIA': 'INA',
-            'MALAYSIA': 'MAS', 'MALASIA': 'MAS',
-            'THAILAND': 'THA', 'TAILANDIA': 'THA',
-            'VIETNAM': 'VIE',
-            'PHILIPPINES': 'PHI', 'FILIPINAS': 'PHI',
-            'SINGAPORE': 'SGP', 'SINGAPUR': 'SGP',
-            'TAIWAN': 'TPE',
-            'HONG KONG': 'HKG',
-            'PAKISTAN': 'PAK', 'PAKISTÁN': 'PAK',
-            'BANGLADESH': 'BAN',
-            'SRI LANKA': 'SRI',
-            'NEPAL': 'NEP',
-            'IRAN': 'IRI', 'IRÁN': 'IRI',
-            'IRAQ': 'IRQ',
-            'ISRAEL': 'ISR',
-            'LEBANON': 'LBN', 'LIBANO': 'LBN', 'LÍBANO': 'LBN',
-            'SAUDI ARABIA': 'KSA', 'ARABIA SAUDITA': 'KSA', 'ARABIA SAUDÍ': 'KSA',
-            'UNITED ARAB EMIRATES': 'UAE', 'EAU': 'UAE', 'EMIRATOS ARABES': 'UAE',
-            'BULGARIA': 'BUL',
-            'CROATIA': 'CRO', 'CROACIA': 'CRO',
-            'SERBIA': 'SRB',
-            'SLOVENIA': 'SLO', 'ESLOVENIA': 'SLO',
-            'SLOVAKIA': 'SVK', 'ESLOVAQUIA': 'SVK',
-            'LITHUANIA': 'LTU', 'LITUANIA': 'LTU',
-            'LATVIA': 'LAT', 'LETONIA': 'LAT',
-            'ESTONIA': 'EST',
-            'ANDORRA': 'AND',
-            'LUXEMBOURG': 'LUX', 'LUXEMBURGO': 'LUX',
-            'ICELAND': 'ISL', 'ISLANDIA': 'ISL',
-            'CYPRUS': 'CYP', 'CHIPRE': 'CYP',
-            'MALTA': 'MLT',
-            'MONACO': 'MON', 'MÓNACO': 'MON',
-            'LIECHTENSTEIN': 'LIE',
-            'BOLIVIA': 'BOL',
-            'PARAGUAY': 'PAR',
-            'URUGUAY': 'URU',
-            'COSTA RICA': 'CRC',
-            'PANAMA': 'PAN', 'PANAMÁ': 'PAN',
-            'GUATEMALA': 'GUA',
-            'HONDURAS': 'HON',
-            'EL SALVADOR': 'ESA',
-            'NICARAGUA': 'NCA',
-            'PUERTO RICO': 'PUR',
-        }
-        
-        # Check if already a 3-letter code
-        if len(country_str) == 3:
-            return country_str
-        
-        # Look up in mapping
-        if country_str in ioc_mapping:
-            return ioc_mapping[country_str]
-        
-        # If not found, return first 3 chars as fallback
-        return country_str[:3] if len(country_str) >= 3 else country_str
-    
-    export_df['country'] = valid_df['País'].apply(country_to_ioc_code)
+    # Convert country names to IOC codes: 3 letras se dejan tal cual, si no mapping o las 3 primeras
+    country = valid_df['País'].astype(str).str.strip().str.upper()
+    ioc = country.map(_IOC_MAPPING).fillna(country.str[:3]).where(country.str.len() != 3, country)
+    export_df['country'] = ioc.where(valid_df['País'].notna(), "")
     
     return export_df.to_csv(index=False, encoding='utf-8-sig', sep=';')
 
 def generate_team_players_csv(df):
-    valid_df = df[df['Datos_Validos']].copy()
+    valid_df = _export_rows(df, TEAM_PLAYERS_EXPORT_COLS)
     
     export_df = pd.DataFrame()
     export_df['Team'] = valid_df['Pruebas'].astype(str).str.strip()
-    export_df['Lidnummer'] = valid_df['Nº.ID'].astype(str).str.replace(r'\.0$', '', regex=True)
+    export_df['Lidnummer'] = valid_df['Nº.ID'].astype(str).str.replace(_TRAILING_DOT_ZERO_RE, '', regex=True)
     export_df['Positie'] = 0
     return export_df.to_csv(index=False, encoding='utf-8-sig', sep=';')
 
@@ -1037,15 +1461,16 @@ def generate_tournament_planner_xlsx(df):
     """
     import io
     
-    # Filter valid data or use all if no filter column
-    if 'Datos_Validos' in df.columns:
-        valid_df = df[df['Datos_Validos']].copy()
-    else:
-        valid_df = df.copy()
+    # Filter valid data (or use all if no filter column), only the exported columns
+    valid_df = _export_rows(df, TP_EXPORT_COLS)
     
     # Load Club-ID mappings (same as CSV exports)
     club_ids_mapping = load_club_ids_mapping()
     team_overrides = load_team_clubid_overrides()
+    overrides_ci = {}
+    for override_team, override_id in team_overrides.items():
+        overrides_ci.setdefault(override_team.upper(), override_id) # Como en el recorrido: gana la primera
+    club_index = club_id_index(club_ids_mapping)
     
     def get_final_clubid(team_name):
         """Get ClubID: first check manual override, then auto-detect."""
@@ -1058,48 +1483,48 @@ def generate_tournament_planner_xlsx(df):
             return team_overrides[team_str]
         
         # 2. Case-insensitive override check
-        for override_team, override_id in team_overrides.items():
-            if override_team.upper() == team_str.upper():
-                return override_id
+        if team_str.upper() in overrides_ci:
+            return overrides_ci[team_str.upper()]
         
         # 3. Fall back to auto-detection
-        return get_clubid_for_team(team_str, club_ids_mapping)
-    
-    def format_date_for_tp(date_val):
-        """Format date as DD/MM/YYYY for Tournament Planner."""
-        if pd.isna(date_val):
-            return ""
-        date_str = str(date_val).strip()
-        if not date_str or date_str.lower() in ['nan', 'none', 'nat']:
-            return ""
-        
-        # Handle ISO datetime format (e.g., 1982-04-22T00:00:00.000)
-        if 'T' in date_str:
-            date_str = date_str.split('T')[0]
-        
-        # Remove time component if present (space separator)
-        if ' ' in date_str:
-            date_str = date_str.split(' ')[0]
+        return get_clubid_for_team(team_str, club_ids_mapping, club_index)
+    
+    def format_date_for_tp(dates):
+        """Format dates as DD/MM/YYYY for Tournament Planner (toda la columna de una vez)."""
+        date_str = dates.astype(str).str.strip()
+        # Handle ISO datetime format (e.g., 1982-04-22T00:00:00.000) and time component (space separator)
+        date_str = date_str.str.split('T', n=1).str[0].str.split(' ', n=1).str[0]
+        
+        # Try parsing different formats, en orden: cada formato solo rellena lo que sigue sin fecha
+        formats = ['%Y-%m-%d', '%d/%m/%Y', '%d-%m-%Y', '%d.%m.%Y']
+        parsed = pd.Series(pd.NaT, index=dates.index, dtype='datetime64[ns]')
+        for fmt in formats:
+            pending = parsed.isna()
+            if not pending.any():
+                break
+            parsed[pending] = pd.to_datetime(date_str[pending], format=fmt, errors='coerce')
         
-        # Try parsing different formats
-        for fmt in ['%Y-%m-%d', '%d/%m/%Y', '%d-%m-%Y', '%d.%m.%Y']:
-            try:
-                dt = datetime.strptime(date_str, fmt)
-                return dt.strftime('%d/%m/%Y')
-            except:
-                continue
-        return date_str
-    
-    def format_gender_tp(gender_val):
-        """Format gender as M/F for Tournament Planner."""
-        if pd.isna(gender_val):
-            return ""
-        g = str(gender_val).upper().strip()
-        if g in ['M', 'MASCULINO', 'MALE', 'H', 'HOMBRE']:
-            return "M"
-        elif g in ['F', 'FEMENINO', 'FEMALE', 'MUJER']:
-            return "F"
-        return g[:1] if g else ""
+        def strptime_any(date_val):
+            # Resto (p.ej. años fuera del rango de datetime64[ns]): strptime valor a valor
+            for fmt in formats:
+                try:
+                    return datetime.strptime(date_val, fmt).strftime('%d/%m/%Y')
+                except:
+                    continue
+            return date_val
+        
+        out = parsed.dt.strftime('%d/%m/%Y').astype(object)
+        unparsed = parsed.isna()
+        out[unparsed] = date_str[unparsed].map(strptime_any)
+        empty = dates.isna() | dates.astype(str).str.strip().str.lower().isin(['', 'nan', 'none', 'nat'])
+        out[empty] = ""
+        return out
+    
+    def format_gender_tp(genders):
+        """Format gender as M/F for Tournament Planner (columna entera)."""
+        g = genders.astype(str).str.upper().str.strip()
+        out = g.map(_GENDER_TP_MAP).fillna(g.str[:1])
+        return out.where(genders.notna(), "")
     
     def get_club_name(row):
         """Get club name - use origin club for non-loaned, current team for loaned."""
@@ -1108,29 +1533,13 @@ def generate_tournament_planner_xlsx(df):
             club = str(row.get('Pruebas', '')).strip()
         return club
     
-    def clean_val(val):
-        """Clean value for export."""
-        if pd.isna(val):
-            return ""
-        s = str(val).strip()
-        return "" if s.lower() in ['nan', 'none'] else s
+    def clean_val(values):
+        """Clean values for export (columna entera): nulos, 'nan' y 'none' -> ''."""
+        s = values.astype(str).str.strip()
+        return s.where(values.notna() & ~s.str.lower().isin(['nan', 'none']), "")
     
     # Load Teams/Clubs mapping from Excel file
-    teams_mapping = {}
-    teams_file = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'Teams y clubs Liga Nacional de Clubes edición 2025-2026.XLSX')
-    if os.path.exists(teams_file):
-        try:
-            teams_df = pd.read_excel(teams_file)
-            for _, row in teams_df.iterrows():
-                team_name = str(row.get('Team', '')).strip()
-                if team_name and team_name.lower() not in ['nan', 'none', '']:
-                    teams_mapping[team_name.upper()] = {
-                        'team_id': str(row.get('Team-ID', '')).strip(),
-                        'club_id': str(row.get('Club-ID', '')).strip(),
-                        'club_name': str(row.get('Club', '')).strip()
-                    }
-        except Exception as e:
-            print(f"Warning: Could not load teams mapping: {e}")
+    teams_mapping = load_teams_mapping()
     
     def get_team_info(team_name, field):
         """Get Team-ID, Club-ID or Club name from mapping."""
@@ -1158,92 +1567,94 @@ def generate_tournament_planner_xlsx(df):
     export_df = pd.DataFrame()
     
     # Member ID
-    export_df['Member ID'] = valid_df['Nº.ID'].astype(str).str.replace(r'\.0$', '', regex=True)
+    export_df['Member ID'] = valid_df['Nº.ID'].astype(str).str.replace(_TRAILING_DOT_ZERO_RE, '', regex=True)
     
     # Name (Last Name - Apellido 1) - Add (C) marker for loaned players
-    def build_name_with_cedido(row):
-        name = clean_val(row.get('Nombre', ''))
-        if row.get('Es_Cedido', False) == True:
-            name = f"{name} (C)"
-        return name
-    
-    export_df['Name'] = valid_df.apply(build_name_with_cedido, axis=1)
+    if 'Nombre' in valid_df.columns:
+        name = clean_val(valid_df['Nombre'])
+    else:
+        name = pd.Series("", index=valid_df.index)
+    if 'Es_Cedido' in valid_df.columns:
+        name = name.mask(valid_df['Es_Cedido'] == True, name + " (C)")
+    export_df['Name'] = name
     
     # First name (Nombre.1)
-    export_df['First name'] = valid_df['Nombre.1'].apply(clean_val)
+    export_df['First name'] = clean_val(valid_df['Nombre.1'])
     
     # Middle name (2ºNombre / Apellido 2)
     if '2ºNombre' in valid_df.columns:
-        export_df['Middle name'] = valid_df['2ºNombre'].apply(clean_val)
+        export_df['Middle name'] = clean_val(valid_df['2ºNombre'])
     else:
         export_df['Middle name'] = ""
     
     # Gender
-    export_df['Gender'] = valid_df['Género'].apply(format_gender_tp)
-    
-    # Club (from mapping if available, else from data)
-    def get_club_for_export(row):
-        team = str(row.get('Pruebas', '')).strip()
-        mapped_club = get_team_info(team, 'club_name')
-        if mapped_club:
-            return mapped_club
-        # Fallback
-        club = str(row.get('Club', '')).strip()
-        if pd.isna(club) or club.lower() == 'nan':
-            club = team
-        return club
-    
-    export_df['Club'] = valid_df.apply(get_club_for_export, axis=1)
+    export_df['Gender'] = format_gender_tp(valid_df['Género'])
+    
+    # Club (from mapping if available, else from data); el mapping se consulta una vez por equipo
+    team = valid_df['Pruebas'].astype(str).str.strip()
+    mapped_club = _map_per_value(team, lambda t: get_team_info(t, 'club_name'))
+    if 'Club' in valid_df.columns:
+        club = valid_df['Club'].astype(str).str.strip()
+        club = club.where(club.str.lower() != 'nan', team) # Fallback
+    else:
+        club = pd.Series("", index=valid_df.index)
+    export_df['Club'] = mapped_club.where(mapped_club != "", club)
     
     # Club-ID (from mapping)
-    export_df['Club-ID'] = valid_df['Pruebas'].apply(lambda x: get_team_info(x, 'club_id') or get_final_clubid(x))
+    export_df['Club-ID'] = _map_per_value(valid_df['Pruebas'], lambda x: get_team_info(x, 'club_id') or get_final_clubid(x))
     
     # Country
-    export_df['Country'] = valid_df['País'].apply(clean_val)
+    export_df['Country'] = clean_val(valid_df['País'])
     
     # Date of birth
-    export_df['Date of birth'] = valid_df['F.Nac'].apply(format_date_for_tp)
+    export_df['Date of birth'] = format_date_for_tp(valid_df['F.Nac'])
     
     # Mobile (if available)
     if 'Telefono' in valid_df.columns:
-        export_df['Mobile'] = valid_df['Telefono'].apply(clean_val)
+        export_df['Mobile'] = clean_val(valid_df['Telefono'])
     elif 'Móvil' in valid_df.columns:
-        export_df['Mobile'] = valid_df['Móvil'].apply(clean_val)
+        export_df['Mobile'] = clean_val(valid_df['Móvil'])
     else:
         export_df['Mobile'] = ""
     
     # Email (if available)
     if 'Email' in valid_df.columns:
-        export_df['Email'] = valid_df['Email'].apply(clean_val)
+        export_df['Email'] = clean_val(valid_df['Email'])
     elif 'Correo' in valid_df.columns:
-        export_df['Email'] = valid_df['Correo'].apply(clean_val)
+        export_df['Email'] = clean_val(valid_df['Correo'])
     else:
         export_df['Email'] = ""
     
     # Team ID (from mapping)
-    export_df['Team ID'] = valid_df['Pruebas'].apply(lambda x: get_team_info(x, 'team_id'))
+    export_df['Team ID'] = _map_per_value(valid_df['Pruebas'], lambda x: get_team_info(x, 'team_id'))
     
     # Team (Current team)
-    export_df['Team'] = valid_df['Pruebas'].apply(clean_val)
+    export_df['Team'] = clean_val(valid_df['Pruebas'])
     
     # Position
     export_df['Position'] = ""
     
     # Level Singles / Level Doubles (if available)
     if 'Nivel_Singles' in valid_df.columns:
-        export_df['Level Singles'] = valid_df['Nivel_Singles'].apply(clean_val)
+        export_df['Level Singles'] = clean_val(valid_df['Nivel_Singles'])
     else:
         export_df['Level Singles'] = ""
     
     if 'Nivel_Dobles' in valid_df.columns:
-        export_df['Level Doubles'] = valid_df['Nivel_Dobles'].apply(clean_val)
+        export_df['Level Doubles'] = clean_val(valid_df['Nivel_Dobles'])
     else:
         export_df['Level Doubles'] = ""
     
-    # Write to Excel bytes
+    # Write to Excel bytes: openpyxl en modo write_only vuelca las filas en streaming
+    # (sin mantener el libro entero en memoria); nulos -> celda vacía como en to_excel
+    import openpyxl
+    wb = openpyxl.Workbook(write_only=True)
+    ws = wb.create_sheet('Players')
+    ws.append(list(export_df.columns))
+    for row in export_df.astype(object).where(export_df.notna(), None).itertuples(index=False, name=None):
+        ws.append(row)
     output = io.BytesIO()
-    with pd.ExcelWriter(output, engine='openpyxl') as writer:
-        export_df.to_excel(writer, index=False, sheet_name='Players')
+    wb.save(output)
     
     return output.getvalue()
 
@@ -1266,8 +1677,10 @@ def merge_dataframes_with_log(df_current, df_new):
     df_new_players = df_new[~df_new['Nº.ID'].isin(existing_ids)].copy()
     if not df_new_players.empty:
         logs.append(f"➕ **AÑADIDOS {len(df_new_players)} JUGADORES NUEVOS:**")
-        for _, row in df_new_players.iterrows():
-            logs.append(f"- {row['Nombre']} ({row['Nº.ID']}) -> {row['Pruebas']}")
+        logs.extend((
+            "- " + df_new_players['Nombre'].astype(str) + " (" + df_new_players['Nº.ID'] + ") -> "
+            + df_new_players['Pruebas'].astype(str)
+        ).tolist())
     
     # 2. Procesar Actualizaciones
     df_updates = df_new[df_new['Nº.ID'].isin(existing_ids)].copy()
@@ -1275,21 +1688,33 @@ def merge_dataframes_with_log(df_current, df_new):
     
     if not df_updates.empty:
         logs.append(f"🔄 **REVISANDO {len(df_updates)} JUGADORES EXISTENTES...**")
-        
-    for _, row in df_updates.iterrows():
-        pid = row['Nº.ID']
-        # Buscar índice en original
-        mask = df_current['Nº.ID'] == pid
-        if not mask.any(): continue
-        
-        idx = df_current[mask].index[0]
-        
+    
+    # Índice en original: primera fila de cada ID (antes, un escaneo de la columna por jugador)
+    current_ids = df_current['Nº.ID']
+    first_seen = ~current_ids.duplicated().to_numpy()
+    id_to_idx = dict(zip(current_ids[first_seen], df_current.index[first_seen]))
+    
+    # Solo se revisan fila a fila los que pueden cambiar: equipo o club distintos, equipo con
+    # coma (transferencia) o IDs repetidos en la importación (cada fila ve el cambio de la anterior)
+    upd_idx = df_updates['Nº.ID'].map(id_to_idx)
+    new_team_s = df_updates['Pruebas'].astype(str).str.strip()
+    new_club_s = df_updates['Club'].astype(str).str.strip()
+    old_team_s = df_current.loc[upd_idx, 'Pruebas'].astype(str).str.strip().to_numpy()
+    old_club_s = df_current.loc[upd_idx, 'Club'].astype(str).str.strip().to_numpy()
+    to_review = (
+        df_updates['Nº.ID'].duplicated(keep=False)
+        | new_team_s.str.contains(',', regex=False)
+        | (new_team_s != old_team_s)
+        | (new_club_s != old_club_s)
+    ).to_numpy()
+        
+    for pid, idx, new_team_raw, new_club_raw, nombre in zip(
+        df_updates['Nº.ID'][to_review], upd_idx[to_review], new_team_s[to_review],
+        new_club_s[to_review], df_updates['Nombre'][to_review]
+    ):
         # Comparar Campos Clave
         old_team = str(df_current.at[idx, 'Pruebas']).strip()
-        new_team_raw = str(row['Pruebas']).strip()
-        
         old_club = str(df_current.at[idx, 'Club']).strip()
-        new_club_raw = str(row['Club']).strip()
         
         changes = []
         
@@ -1325,7 +1750,7 @@ def merge_dataframes_with_log(df_current, df_new):
             pass 
         elif old_team != final_team:
             # Caso especial: Si antes era "Astures" y ahora es "RSL Tenerife" (por la lógica de arriba)
-            df_current.at[idx, 'Pruebas'] = final_team
+            set_cell(df_current, idx, 'Pruebas', final_team)
             changes.append(f"Equipo: '{old_team}' ➡️ '{final_team}'{transfer_note}")
 
         # --- LÓGICA CLUB (Similar o directa) ---
@@ -1334,7 +1759,7 @@ def merge_dataframes_with_log(df_current, df_new):
         if new_club_raw.lower() == 'nan' or not new_club_raw:
             pass
         elif old_club != new_club_raw:
-            df_current.at[idx, 'Club'] = new_club_raw
+            set_cell(df_current, idx, 'Club', new_club_raw)
             changes.append(f"Club: '{old_club}' ➡️ '{new_club_raw}'")
             
         if changes:
@@ -1349,11 +1774,11 @@ def merge_dataframes_with_log(df_current, df_new):
                  if current_note.lower() == 'nan': current_note = ""
                  df_current.at[idx, 'Notas_Revision'] = (current_note + change_note).strip()
                 
-            logs.append(f"✏️ **ACTUALIZADO {transfer_note}:** {row['Nombre']} ({pid}): {', '.join(changes)}")
+            logs.append(f"✏️ **ACTUALIZADO {transfer_note}:** {nombre} ({pid}): {', '.join(changes)}")
 
     # 3. Concatenar
     if not df_new_players.empty:
-        df_merged = pd.concat([df_current, df_new_players], ignore_index=True)
+        df_merged = concat_rows(df_current, df_new_players)
     else:
         df_merged = df_current
         
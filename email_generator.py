@@ -216,7 +216,7 @@ def _generate_player_table(team_df):
         # Create a copy to avoid SettingWithCopy warnings if team_df is a slice
         team_df = team_df.copy()
         # Ensure strings for sorting
-        team_df['Género'] = team_df['Género'].fillna('').astype(str)
+        team_df['Género'] = team_df['Género'].astype(object).fillna('').astype(str)
         team_df['Nombre'] = team_df['Nombre'].fillna('').astype(str)
         # Sort: Gender (F < M ideally), then Name
         team_df = team_df.sort_values(by=['Género', 'Nombre'])
@@ -543,7 +543,7 @@ def generate_all_emails(df: pd.DataFrame, rules_config: dict, team_categories: d
     tech_status_map = tech_status_map or {}
     
     # Group by team (Pruebas column)
-    teams = df.groupby('Pruebas')
+    teams = df.groupby('Pruebas', observed=True)
     
     for team_name, team_df in teams:
         if not team_name or team_name == 'Sin Asignar':
@@ -16,7 +16,8 @@ def inspect():
         print(f"✅ Loaded JSON. Keys found: {list(data.keys())}")
         
         for k, v in data.items():
-            count = len(v.get('data', []))
+            # Sessions stored as Parquet (session_data/) only keep metadata here
+            count = v.get('count', len(v.get('data', [])))
             ts = v.get('timestamp', 'No TS')
             print(f" - '{k}': {count} records ({ts})")
             
@@ -11,6 +11,7 @@ import logging
 import io
 import csv
 import streamlit as st
+from data_processing import set_cell
 
 logger = logging.getLogger(__name__)
 
@@ -43,6 +44,8 @@ class LicenseValidator:
         self.licenses_db = {}
         self.last_update_timestamp = None
         self._cloud_mode = False
+        self._key_index = None
+        self._key_index_sig = None
     
     def load_full_db(self, force_refresh=False):
         """
@@ -463,77 +466,98 @@ class LicenseValidator:
     
     def validate_dataframe(self, df, search_mode=False):
         """Validate licenses in DataFrame against database."""
-        results = []
-        
         if not self.licenses_db:
             return ["⚠️ DB no cargada"] * len(df)
         
-        for _, row in df.iterrows():
-            pid = row.get('Nº.ID')
-            try:
-                pid_str = str(pid).strip()
+        # Muchas filas comparten licencia (mismo jugador en varias pruebas): cada ID
+        # distinto se busca una sola vez, sobre todo por los fallbacks que recorren la DB.
+        pids = df['Nº.ID'].tolist() if 'Nº.ID' in df.columns else [None] * len(df)
+        memo = {}
+        results = []
+        for pid in pids:
+            if pid not in memo:
+                memo[pid] = self._validate_license_id(pid)
+            results.append(memo[pid])
+        
+        return results
+
+    def _get_key_index(self):
+        """
+        Índices normalizado -> clave y dígitos -> clave de licenses_db para los fallbacks
+        de _validate_license_id (antes, un recorrido completo de la DB por cada ID sin
+        coincidencia exacta). Se reconstruyen si cambia el conjunto de claves.
+        """
+        sig = (id(self.licenses_db), len(self.licenses_db))
+        if self._key_index is None or self._key_index_sig != sig:
+            normalized = {}
+            numeric = {}
+            for db_key in self.licenses_db:
+                # setdefault: gana la primera clave, igual que el recorrido con break
+                normalized.setdefault(str(db_key).replace(' ', '').replace('.', '').upper(), db_key)
+                db_numeric = ''.join(c for c in str(db_key) if c.isdigit())
+                if db_numeric:
+                    numeric.setdefault(db_numeric, db_key)
+            self._key_index = (normalized, numeric)
+            self._key_index_sig = sig
+        return self._key_index
+
+    def _validate_license_id(self, pid):
+        """Estado de validación (texto) para un único Nº.ID."""
+        try:
+            pid_str = str(pid).strip()
+            
+            # Try multiple matching strategies for alphanumeric IDs
+            info = None
+            matched_key = None
+            
+            # 1. Exact match
+            if pid_str in self.licenses_db:
+                info = self.licenses_db[pid_str]
+                matched_key = pid_str
+            else:
+                # 2. Normalized match (remove spaces, dots, lowercase)
+                normalized_index, numeric_index = self._get_key_index()
+                pid_normalized = pid_str.replace(' ', '').replace('.', '').upper()
+                if pid_normalized in normalized_index:
+                    matched_key = normalized_index[pid_normalized]
+                    info = self.licenses_db[matched_key]
                 
-                # Try multiple matching strategies for alphanumeric IDs
-                info = None
-                matched_key = None
+                # 3. For IDs like "CLM+5", try extracting just the numeric part
+                if not info and any(c.isdigit() for c in pid_str):
+                    # Extract only digits
+                    numeric_only = ''.join(c for c in pid_str if c.isdigit())
+                    if numeric_only and numeric_only in self.licenses_db:
+                        info = self.licenses_db[numeric_only]
+                        matched_key = numeric_only
+                    else:
+                        # Also check if DB has alphanumeric key containing same digits
+                        if numeric_only in numeric_index:
+                            matched_key = numeric_index[numeric_only]
+                            info = self.licenses_db[matched_key]
+            
+            if info:
+                tipo = info.get('type', '')
+                activa = info.get('valid', False)
+                fecha_inicio = info.get('start_date', '')
+                club_licencia = info.get('club', 'Desconocido')
                 
-                # 1. Exact match
-                if pid_str in self.licenses_db:
-                    info = self.licenses_db[pid_str]
-                    matched_key = pid_str
+                # Format Dates Info (Only Start Date requested)
+                fechas_str = ""
+                if fecha_inicio and fecha_inicio.lower() not in ['nan', 'none', '?']:
+                    fechas_str = f"Ini: {fecha_inicio}"
                 else:
-                    # 2. Normalized match (remove spaces, dots, lowercase)
-                    pid_normalized = pid_str.replace(' ', '').replace('.', '').upper()
-                    for db_key in self.licenses_db:
-                        db_normalized = str(db_key).replace(' ', '').replace('.', '').upper()
-                        if pid_normalized == db_normalized:
-                            info = self.licenses_db[db_key]
-                            matched_key = db_key
-                            break
-                    
-                    # 3. For IDs like "CLM+5", try extracting just the numeric part
-                    if not info and any(c.isdigit() for c in pid_str):
-                        # Extract only digits
-                        numeric_only = ''.join(c for c in pid_str if c.isdigit())
-                        if numeric_only and numeric_only in self.licenses_db:
-                            info = self.licenses_db[numeric_only]
-                            matched_key = numeric_only
-                        else:
-                            # Also check if DB has alphanumeric key containing same digits
-                            for db_key in self.licenses_db:
-                                db_numeric = ''.join(c for c in str(db_key) if c.isdigit())
-                                if numeric_only == db_numeric and numeric_only:
-                                    info = self.licenses_db[db_key]
-                                    matched_key = db_key
-                                    break
+                    fechas_str = "Ini: ?"
                 
-                if info:
-                    tipo = info.get('type', '')
-                    activa = info.get('valid', False)
-                    fecha_inicio = info.get('start_date', '')
-                    club_licencia = info.get('club', 'Desconocido')
-                    
-                    # Format Dates Info (Only Start Date requested)
-                    fechas_str = ""
-                    if fecha_inicio and fecha_inicio.lower() not in ['nan', 'none', '?']:
-                        fechas_str = f"Ini: {fecha_inicio}"
-                    else:
-                        fechas_str = "Ini: ?"
-                    
-                    if (("Nacional" in tipo) or ("Homologada" in tipo) or ("HN" in tipo)) and activa:
-                        results.append(f"✅ {tipo} ({fechas_str}) - {club_licencia}")
-                    elif not activa:
-                        results.append(f"❌ Caducada ({fechas_str})")
-                    else:
-                        results.append(f"⚠️ {tipo} (No Nac.)")
+                if (("Nacional" in tipo) or ("Homologada" in tipo) or ("HN" in tipo)) and activa:
+                    return f"✅ {tipo} ({fechas_str}) - {club_licencia}"
+                elif not activa:
+                    return f"❌ Caducada ({fechas_str})"
                 else:
-                    results.append("❌ NO ENCONTRADO")
-            except:
-                results.append("⚠️ ID Inválido")
-        
-        return results
-    
-        return results
+                    return f"⚠️ {tipo} (No Nac.)"
+            else:
+                return "❌ NO ENCONTRADO"
+        except:
+            return "⚠️ ID Inválido"
 
     def get_license_start_dates(self, df):
         """Returns a list of start dates for the dataframe rows using same matching logic."""
@@ -615,7 +639,7 @@ class LicenseValidator:
                         new_genero = info.get('gender', old_genero)
                         if old_genero != new_genero and new_genero:
                             changes.append(f"Género: {old_genero} → {new_genero}")
-                        df.at[idx, 'Género'] = new_genero
+                        set_cell(df, idx, 'Género', new_genero)
                         
                         old_fnac = row.get('F.Nac', '')
                         new_fnac = info.get('dob', old_fnac)
@@ -627,13 +651,13 @@ class LicenseValidator:
                         new_club = info.get('club', old_club)
                         if old_club != new_club and new_club:
                             changes.append(f"Club: {old_club} → {new_club}")
-                        df.at[idx, 'Club'] = new_club
+                        set_cell(df, idx, 'Club', new_club)
                         
                         old_pais = row.get('País', '')
                         new_pais = info.get('country', 'España')
                         if old_pais != new_pais and new_pais:
                             changes.append(f"País: {old_pais} → {new_pais}")
-                        df.at[idx, 'País'] = new_pais
+                        set_cell(df, idx, 'País', new_pais)
                         
                         # Rebuild Jugador field
                         df.at[idx, 'Jugador'] = f"{apellido1} {apellido2}, {nombre_db}".strip()
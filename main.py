@@ -1,10 +1,13 @@
 import streamlit as st
 import pandas as pd
+import numpy as np
 import io
 import os
 import json
 import plotly.express as px
 from datetime import datetime
+from collections import defaultdict
+from functools import partial
 from st_aggrid import AgGrid, GridOptionsBuilder, GridUpdateMode, DataReturnMode
 import time
 import importlib
@@ -13,9 +16,11 @@ import license_validator
 import rules_manager
 
 # FORCE RELOAD to avoid stale code on network drive (since fileWatcher is disabled)
-importlib.reload(data_processing)
-importlib.reload(license_validator)
-importlib.reload(rules_manager)
+# Only when LNC_FORCE_RELOAD=1: otherwise every rerun re-executes the three modules.
+if os.environ.get('LNC_FORCE_RELOAD') == '1':
+    importlib.reload(data_processing)
+    importlib.reload(license_validator)
+    importlib.reload(rules_manager)
 
 from data_processing import (
     load_data, 
@@ -23,9 +28,14 @@ from data_processing import (
     generate_players_csv, 
     generate_team_players_csv,
     generate_tournament_planner_xlsx,
-    calculate_team_compliance,
-    apply_comprehensive_check,
-    merge_dataframes_with_log
+    calculate_team_compliance_cached,
+    apply_comprehensive_check_cached,
+    audit_fingerprint,
+    merge_dataframes_with_log,
+    concat_rows,
+    set_cell,
+    decategorize_columns,
+    GENDER_DTYPE
 )
 from license_validator import validator, FESBA_LOGIN_URL
 from rules_manager import RulesManager
@@ -55,6 +65,9 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Plantilla vacía del editor de añadidos manuales (se copia, no se reconstruye en cada rerun)
+_EMPTY_MANUAL = pd.DataFrame({"Nº.ID": [""], "Equipo": [""]})
+
 # Inicializar Gestor de Reglas
 rules_manager = RulesManager()
 LIGA_CATEGORIES = rules_manager.get_categories_list()
@@ -155,6 +168,7 @@ from modules.state import (
     load_history,
     save_history,
     save_current_session,
+    save_session_changes,
     delete_session,
     rename_session,
     rename_session,
@@ -201,8 +215,7 @@ if 'data' not in st.session_state or st.session_state['data'] is None:
                     # Load rules & calc compliance
                     rules_config = rules_manager.load_rules()
                     team_categories = rules_manager.load_team_categories()
-                    calculate_team_compliance(df, rules_config, team_categories) 
-                    df = apply_comprehensive_check(df, rules_config, team_categories)
+                    df = apply_comprehensive_check_cached(df, rules_config, team_categories)
                     
                     st.session_state['data'] = df
                     st.session_state['current_file_key'] = latest_name
@@ -232,8 +245,7 @@ if 'data' not in st.session_state or st.session_state['data'] is None:
                     # Logic
                     rules_config = rules_manager.load_rules()
                     team_categories = rules_manager.load_team_categories()
-                    calculate_team_compliance(df, rules_config, team_categories)
-                    df = apply_comprehensive_check(df, rules_config, team_categories)
+                    df = apply_comprehensive_check_cached(df, rules_config, team_categories)
                     
                     st.session_state['data'] = df
                     st.session_state['current_file_key'] = "Respaldo_Local"
@@ -243,10 +255,14 @@ if 'data' not in st.session_state or st.session_state['data'] is None:
 
 def to_excel(df):
     output = io.BytesIO()
-    with pd.ExcelWriter(output, engine='openpyxl') as writer:
+    # xlsxwriter: bastante más rápido y ligero que openpyxl para exportaciones grandes.
+    # (Sin constant_memory: pandas escribe por columnas y ese modo descarta las filas ya volcadas)
+    with pd.ExcelWriter(output, engine='xlsxwriter') as writer:
         df_export = df.copy()
         if 'Errores_Datos' in df_export.columns:
-             df_export['Errores_Datos'] = df_export['Errores_Datos'].apply(lambda x: ", ".join(x) if isinstance(x, list) else x)
+            errs = df_export['Errores_Datos']
+            is_list = errs.map(type).eq(list)
+            df_export['Errores_Datos'] = errs.where(~is_list, errs[is_list].str.join(", "))
         df_export.to_excel(writer, index=False, sheet_name='Revision')
     processed_data = output.getvalue()
     return processed_data
@@ -291,8 +307,7 @@ with st.sidebar:
                         # Renombrar en historial
                         if rename_session(selected_file, new_name):
                             st.session_state['current_file_key'] = new_name
-                            st.success("Renombrado correctamente.")
-                            time.sleep(0.5)
+                            st.toast("Renombrado correctamente.", icon="✅")
                             st.rerun()
                         else:
                             st.error("Error al guardar cambios.")
@@ -306,7 +321,6 @@ with st.sidebar:
             if df_loaded is not None and not df_loaded.empty:
                 st.session_state['data'] = df_loaded
                 st.toast(f"✅ Archivo '{selected_file}' cargado", icon="📂")
-                time.sleep(0.5)
                 st.rerun()
             else:
                 if df_loaded is None:
@@ -353,8 +367,7 @@ with st.sidebar:
         # Cache
         if st.button("🧹 Limpiar Caché", help="Si notas datos antiguos, pulsa aquí"):
             st.cache_data.clear()
-            st.success("Caché limpiado")
-            time.sleep(1)
+            st.toast("Caché limpiado", icon="✅")
             st.rerun()
         
         # Versión
@@ -372,7 +385,7 @@ with st.sidebar:
         
         # Formulario dinámico (Data Editor)
         if 'manual_add_data' not in st.session_state:
-            st.session_state['manual_add_data'] = pd.DataFrame([{"Nº.ID": "", "Equipo": ""}])
+            st.session_state['manual_add_data'] = _EMPTY_MANUAL.copy()
             
         manual_df = st.data_editor(
             st.session_state['manual_add_data'],
@@ -398,6 +411,11 @@ with st.sidebar:
                 count_added = 0
                 new_rows = []
                 
+                # ID -> índice de su primera fila, calculado una vez (O(1) por jugador en el bucle)
+                existing_ids = current_df['Nº.ID'].astype(str).str.strip()
+                first = ~existing_ids.duplicated().to_numpy()
+                existing_idx = dict(zip(existing_ids[first], current_df.index[first]))
+                
                 for _, row in manual_df.iterrows():
                     raw_id = str(row.get("Nº.ID", "")).strip()
                     team = str(row.get("Equipo", "")).strip()
@@ -446,9 +464,8 @@ with st.sidebar:
                         if not info: st.warning(f"⚠️ ID {raw_id} no encontrado en BBDD FESBA. Se usarán datos vacíos.")
 
                     # 1. VERIFICAR SI YA EXISTE (UPDATE)
-                    existing_mask = current_df['Nº.ID'].astype(str) == raw_id
-                    if existing_mask.any():
-                        idx = current_df[existing_mask].index[0]
+                    if raw_id in existing_idx:
+                        idx = existing_idx[raw_id]
                         
                         # Update Personal Info (Always refresh from DB)
                         if info:
@@ -456,9 +473,9 @@ with st.sidebar:
                             current_df.at[idx, '2ºNombre'] = apellido2
                             current_df.at[idx, 'Nombre.1'] = nombre
                             current_df.at[idx, 'F.Nac'] = dob
-                            current_df.at[idx, 'Género'] = sexo
-                            current_df.at[idx, 'País'] = pais
-                            current_df.at[idx, 'Club'] = club_origen
+                            set_cell(current_df, idx, 'Género', sexo)
+                            set_cell(current_df, idx, 'País', pais)
+                            set_cell(current_df, idx, 'Club', club_origen)
 
                         current_team = str(current_df.at[idx, 'Pruebas']).strip()
                         current_notes = str(current_df.at[idx, 'Notas_Revision'] if 'Notas_Revision' in current_df.columns else "")
@@ -466,7 +483,7 @@ with st.sidebar:
                         # Update Team
                         note_parts = []
                         if current_team != team:
-                            current_df.at[idx, 'Pruebas'] = team
+                            set_cell(current_df, idx, 'Pruebas', team)
                             note_parts.append(f"Cambio Equipo: {current_team}->{team}")
                             st.toast(f"✅ Jugador {raw_id}: Equipo actualizado a {team}")
                         
@@ -516,7 +533,7 @@ with st.sidebar:
                     # Convertir a DF y procesar
                     df_new_manual = pd.DataFrame(new_rows)
                     # Fusionar
-                    current_df = pd.concat([current_df, df_new_manual], ignore_index=True)
+                    current_df = concat_rows(current_df, df_new_manual)
                 
                 # RECALCULAR SIEMPRE si hubo cambios (insert o update)
                 if count_added > 0:
@@ -535,13 +552,12 @@ with st.sidebar:
                     current_key = st.session_state.get('current_file_key', 'manual')
                     success, msg = save_current_session(current_key, current_df)
                     if success:
-                        st.session_state['manual_add_data'] = pd.DataFrame([{"Nº.ID": "", "Equipo": ""}])
+                        st.session_state['manual_add_data'] = _EMPTY_MANUAL.copy()
                         # Force widget reset
                         if 'manual_editor' in st.session_state:
                             del st.session_state['manual_editor']
                         
                         st.toast(f"✅ {count_added} jugador(es) añadido(s)/actualizado(s)")
-                        time.sleep(1)
                         st.rerun()
                     else:
                         st.error(f"Error al guardar: {msg}")
@@ -732,8 +748,7 @@ with st.sidebar:
                                 st.session_state['import_new_players'] = None
                                 
                                 status.update(label="¡Importación Completada!", state="complete")
-                                st.success(f"✅ Importados: {len(new_players_df) if new_players_df is not None else 0} nuevos + {len(included_dup_ids)} actualizados")
-                                time.sleep(1)
+                                st.toast(f"Importados: {len(new_players_df) if new_players_df is not None else 0} nuevos + {len(included_dup_ids)} actualizados", icon="✅")
                                 st.rerun()
                             else:
                                 status.update(label="Error", state="error")
@@ -856,12 +871,23 @@ if 'data' in st.session_state and st.session_state['data'] is not None:
     if new_teams:
         rules_manager.save_team_categories(team_categories)
 
+    # Índice inverso categoría -> equipos presentes (para el filtro por categoría)
+    all_teams_set = frozenset(all_teams)
+    category_to_teams = defaultdict(list)
+    for t, c in team_categories.items():
+        if t in all_teams_set:
+            category_to_teams[c].append(t)
+
     # Calcular Cumplimiento (Auditoría Dinámica)
-    compliance_df = calculate_team_compliance(df, rules_config, team_categories)
+    # Versiones cacheadas: en reruns por filtros no se repite la auditoría
+    audit_fp = audit_fingerprint(df)
+    compliance_df = calculate_team_compliance_cached(df, rules_config, team_categories, fingerprint=audit_fp)
 
     # Aplicar Chequeo Individual Exhaustivo (Para poblar columna 'Errores_Normativos')
     # Esto asegura que el sombreado/error aparezca
-    df = apply_comprehensive_check(df, rules_config, team_categories)
+    df = apply_comprehensive_check_cached(df, rules_config, team_categories, fingerprint=audit_fp)
+    # Filas con incidencias: una sola comparación por rerun, reutilizada en métricas, filtros e Incidencias
+    has_error = df['Errores_Normativos'].to_numpy() != ""
 
     st.caption(f"Editando: **{current_name}**")
 
@@ -872,7 +898,7 @@ if 'data' in st.session_state and st.session_state['data'] is not None:
     m3.metric("Cedidos", int(float(df['Es_Cedido'].sum())), "Alertas", delta_color="off")
     
     # Errores Normativos Totales (Cualquier fila con texto en Errores_Normativos)
-    normative_errors = int((df['Errores_Normativos'] != "").sum())
+    normative_errors = int(has_error.sum())
     m4.metric("Incidencias Normativas", normative_errors, "Jugadores Afectados", delta_color="inverse" if normative_errors > 0 else "normal")
     
     data_errors = int((~df['Datos_Validos']).sum())
@@ -903,7 +929,7 @@ if 'data' in st.session_state and st.session_state['data'] is not None:
             sel_cat = c_f1.selectbox("Filtrar por Categoría:", cats_avail)
             
             if sel_cat != "Todas":
-                teams_in_cat = [t for t, c in team_categories.items() if c == sel_cat and t in all_teams]
+                teams_in_cat = category_to_teams.get(sel_cat, [])
             else:
                 teams_in_cat = all_teams
             sel_team = c_f2.selectbox("Filtrar por Equipo:", ["Todos"] + teams_in_cat)
@@ -939,39 +965,40 @@ if 'data' in st.session_state and st.session_state['data'] is not None:
                         """, unsafe_allow_html=True)
 
             # MÁSCARA DE FILTRADO
-            mask = pd.Series([True] * len(df))
+            # Se acumulan los predicados y se combinan de una sola vez
+            preds = []
             if sel_team != "Todos":
-                mask = mask & (df['Pruebas'] == sel_team)
+                preds.append(df['Pruebas'] == sel_team)
             elif sel_cat != "Todas":
-                mask = mask & (df['Pruebas'].isin(teams_in_cat))
+                preds.append(df['Pruebas'].isin(teams_in_cat))
                 
             if sel_lic_status == "⛔ Con Incidencias":
-                mask = mask & (df['Errores_Normativos'] != "")
+                preds.append(has_error)
             elif 'Validacion_FESBA' in df.columns and sel_lic_status != "Todos":
                 if sel_lic_status == "✅ Licencia OK":
-                    mask = mask & (df['Validacion_FESBA'].str.contains("✅", na=False))
+                    preds.append(df['Validacion_FESBA'].str.startswith("✅", na=False))
                 elif sel_lic_status == "❌ Licencia Incorrecta":
-                    mask = mask & (df['Validacion_FESBA'].str.contains("❌", na=False))
+                    preds.append(df['Validacion_FESBA'].str.startswith("❌", na=False))
                 elif sel_lic_status == "Pendiente de Revisión":
-                    mask = mask & (df['Validacion_FESBA'].isna())
+                    preds.append(df['Validacion_FESBA'].isna())
 
             # Aplicar Filtro Cedidos
             if sel_cedido == "Sí":
-                mask = mask & (df['Es_Cedido'] == True)
+                preds.append(df['Es_Cedido'] == True)
             elif sel_cedido == "No":
-                mask = mask & (df['Es_Cedido'] == False)
+                preds.append(df['Es_Cedido'] == False)
 
             # Aplicar Filtro No Seleccionables
             if sel_no_sel == "Sí":
-                mask = mask & (df['No_Seleccionable'] == True)
+                preds.append(df['No_Seleccionable'] == True)
             elif sel_no_sel == "No":
-                mask = mask & (df['No_Seleccionable'] == False)
+                preds.append(df['No_Seleccionable'] == False)
 
             # Aplicar Filtro Excluidos
             if sel_excluido == "Ocultar Excluidos":
-                mask = mask & (df['Es_Excluido'] == False)
+                preds.append(df['Es_Excluido'] == False)
             elif sel_excluido == "Solo Excluidos":
-                mask = mask & (df['Es_Excluido'] == True)
+                preds.append(df['Es_Excluido'] == True)
             
             # Aplicar Buscador de Texto (General)
             if search_query:
@@ -982,7 +1009,9 @@ if 'data' in st.session_state and st.session_state['data'] is not None:
                     df['Pruebas'].astype(str).str.lower().str.contains(q, na=False) |
                     df['Nº.ID'].astype(str).str.contains(q, na=False)
                 )
-                mask = mask & text_mask
+                preds.append(text_mask)
+
+            mask = np.logical_and.reduce([np.asarray(p, dtype=bool) for p in preds]) if preds else np.ones(len(df), dtype=bool)
 
             # DATA EDITOR
             # Create status indicator column for visual row highlighting
@@ -1007,12 +1036,12 @@ if 'data' in st.session_state and st.session_state['data'] is not None:
         
         # --- COLUMNA IZQUIERDA: TABLA Y EDICIÓN ---
         with col_main_left:
-            st.subheader(f"📋 Listado de Jugadores ({len(df[mask])})")
+            st.subheader(f"📋 Listado de Jugadores ({int(mask.sum())})")
             
             # FORMULARIO DE EDICIÓN
             with st.form("editor_batch_form", border=False):
                 # Convert ID to string for editing (supports alphanumeric IDs)
-                display_df = df.loc[mask, cols_to_show].copy()
+                display_df = decategorize_columns(df.loc[mask, cols_to_show])
                 display_df['Nº.ID'] = display_df['Nº.ID'].astype(str)
                 
                 edited_df = st.data_editor(
@@ -1069,7 +1098,7 @@ if 'data' in st.session_state and st.session_state['data'] is not None:
                 # but df.update() needs the ORIGINAL indices to match rows correctly.
                 # UPDATED: Added 'Nombre', 'Nombre.1' to editable columns
                 editable_cols = ['Nº.ID', 'Nombre', 'Nombre.1', 'Declaración_Jurada', 'Documento_Cesión', 'Es_Excluido', 'Notas_Revision', 'Pruebas', 'Género', 'País']
-                original_indices = df.loc[mask].index  # Preserve original indices
+                original_indices = df.index[mask]  # Preserve original indices
                 original_slice = df.loc[mask, editable_cols].copy()
                 
                 # Restore original index to edited_df so we can match rows correctly
@@ -1077,12 +1106,14 @@ if 'data' in st.session_state and st.session_state['data'] is not None:
                 edited_df_indexed.index = original_indices
                 edited_slice = edited_df_indexed[editable_cols].copy()
                 
-                # DIRECT UPDATE: Update each editable column cell-by-cell to avoid type issues
-                # This is more reliable than df.update() for mixed types like ID (int/str)
-                for idx in original_indices:
-                    for col in editable_cols:
-                        new_val = edited_slice.at[idx, col]
-                        df.at[idx, col] = new_val
+                # DIRECT UPDATE: cell-by-cell to avoid type issues (mixed ID int/str, categoricals),
+                # but only for the cells that actually changed (detected column-wise, same
+                # str comparison as the change log below)
+                for col in editable_cols:
+                    old_col, new_col = original_slice[col], edited_slice[col]
+                    changed = old_col.astype(str).ne(new_col.astype(str)) & ~(old_col.isna() & new_col.isna())
+                    for idx in changed.index[changed.to_numpy()]:
+                        set_cell(df, idx, col, new_col.at[idx])
             
                 # --- RECALCULAR CAMPOS DERIVADOS ---
                 # 1. Nombre Completo
@@ -1093,17 +1124,14 @@ if 'data' in st.session_state and st.session_state['data'] is not None:
                 # Esto es vital si cambian Género, Equipo (Pruebas), o Excluido
                 try:
                     # Recalcular género normativo y otros básicos
-                    df['Género_Norm'] = df['Género'].astype(str).str.upper().str.strip().str[0:1] # M o F
+                    df['Género_Norm'] = df['Género'].astype(str).str.upper().str.strip().str[0:1].astype(GENDER_DTYPE) # M o F
                     
                     # Cargar configuración actual
                     rules_config = rules_manager.load_rules()
                     team_categories = rules_manager.load_team_categories()
                     
-                    # Ejecutar validaciones de equipo (totales, mínimos, etc.)
-                    calculate_team_compliance(df, rules_config, team_categories) 
-                    
                     # Ejecutar validaciones individuales y actualizar 'Estado'
-                    df = apply_comprehensive_check(df, rules_config, team_categories)
+                    df = apply_comprehensive_check_cached(df, rules_config, team_categories)
                     
                     # Actualizar columna visual 'Estado'
                     mask_normative = df['Errores_Normativos'].notna() & (df['Errores_Normativos'].astype(str).str.strip() != '')
@@ -1116,7 +1144,7 @@ if 'data' in st.session_state and st.session_state['data'] is not None:
                 
                 # 3. Guardar
                 st.session_state['data'] = df
-                success, msg = save_current_session(st.session_state.get('current_file_key', 'sesion_actual'), df)
+                success, msg = save_session_changes(st.session_state.get('current_file_key', 'sesion_actual'), df)
                 
                 if success:
                     st.success("✅ Cambios guardados correctamente!")
@@ -1211,7 +1239,7 @@ if 'data' in st.session_state and st.session_state['data'] is not None:
                             df, updated_count = val_instance.update_player_data_from_db(df)
                             if updated_count > 0: st.write(f"🔄 {updated_count} actualizados")
                             st.session_state['data'] = df
-                            success, msg = save_current_session(current_name, df)
+                            success, msg = save_session_changes(current_name, df)
                             if success:
                                 st.success("Validado!")
                                 st.rerun()
@@ -1228,8 +1256,7 @@ if 'data' in st.session_state and st.session_state['data'] is not None:
                         with st.spinner("Importando licencias..."):
                             success, msg = val_instance.import_from_csv(csv_file)
                             if success:
-                                st.success(msg)
-                                time.sleep(1)
+                                st.toast(msg, icon="✅")
                                 st.rerun()
                             else:
                                 st.error(msg)
@@ -1274,15 +1301,13 @@ if 'data' in st.session_state and st.session_state['data'] is not None:
                                 # Re-run Validation
                                 rules_config = rules_manager.load_rules()
                                 team_categories = rules_manager.load_team_categories()
-                                calculate_team_compliance(df, rules_config, team_categories) 
-                                df = apply_comprehensive_check(df, rules_config, team_categories)
+                                df = apply_comprehensive_check_cached(df, rules_config, team_categories)
                                 
                                 st.session_state['data'] = df
                                 success, msg = save_current_session(current_name, df)
                                 
                                 if success:
                                     st.toast(f"🗑️ Eliminados {removed} jugadores", icon="✅")
-                                    time.sleep(1)
                                     st.rerun()
                                 else:
                                     st.error(f"Error al guardar: {msg}")
@@ -1299,7 +1324,7 @@ if 'data' in st.session_state and st.session_state['data'] is not None:
         with c_conf1:
             st.subheader("1. Asignación de Equipos")
             st.info("Asocia cada equipo del Excel a una categoría de competición.")
-            cat_df = pd.DataFrame(list(team_categories.items()), columns=['Equipo', 'Categoría'])
+            cat_df = pd.DataFrame({'Equipo': list(team_categories), 'Categoría': list(team_categories.values())})
             edited_cat_df = st.data_editor(
                 cat_df,
                 column_config={
@@ -1353,24 +1378,22 @@ if 'data' in st.session_state and st.session_state['data'] is not None:
                         
                         if updates_count > 0:
                             rules_manager.save_team_categories(team_categories)
-                            st.success(f"✅ Actualizados {updates_count} equipos.")
-                            time.sleep(1)
+                            st.toast(f"Actualizados {updates_count} equipos.", icon="✅")
                             st.rerun()
                         else:
                             st.warning("No se encontraron coincidencias de equipos o categorías válidas.")
 
             if st.button("Guardar Asignaciones"):
                 new_cats = dict(zip(edited_cat_df['Equipo'], edited_cat_df['Categoría']))
-                rules_manager.save_team_categories(new_cats)
+                # Sin cambios no se escribe (ni se invalida la caché de configuración)
+                if new_cats != team_categories:
+                    rules_manager.save_team_categories(new_cats)
                 
-                # Recargar y recalcular todo automáticamente
-                team_categories = rules_manager.load_team_categories()
-                
-                # Compliance check usa categorías, así que se actualiza solo con st.rerun()
+                # El rerun recarga las categorías (la caché se limpió al guardar):
+                # compliance check usa categorías, así que se actualiza solo con st.rerun()
                 # Pero apply_comprehensive_check también se llama en main loop
                 
-                st.success("Asignaciones guardadas y aplicadas.")
-                time.sleep(0.5)
+                st.toast("Asignaciones guardadas y aplicadas.", icon="✅")
                 st.rerun()
 
         # B) GESTIÓN DE EQUIVALENCIAS (FILIALES)
@@ -1379,11 +1402,10 @@ if 'data' in st.session_state and st.session_state['data'] is not None:
             st.info("Define qué clubes son filiales para no contarlos como cedidos.")
             
             # Convertir dict a DF plano para editar: Club Madre | Filial
-            eq_rows = []
-            for madre, filiales in equivalences.items():
-                for f in filiales:
-                    eq_rows.append({"Club Principal": madre, "Club Filial": f})
-            eq_df = pd.DataFrame(eq_rows)
+            eq_df = pd.DataFrame(
+                [(madre, f) for madre, filiales in equivalences.items() for f in filiales],
+                columns=["Club Principal", "Club Filial"]
+            )
             
             edited_eq_df = st.data_editor(
                 eq_df,
@@ -1395,21 +1417,16 @@ if 'data' in st.session_state and st.session_state['data'] is not None:
             
             if st.button("Guardar Equivalencias"):
                 # Reconstruir diccionario
-                new_eq_dict = {}
-                for idx, row in edited_eq_df.iterrows():
-                    madre = row['Club Principal']
-                    filial = row['Club Filial']
-                    if madre and filial:
-                        if madre not in new_eq_dict: new_eq_dict[madre] = []
-                        new_eq_dict[madre].append(filial)
+                valid_eq = edited_eq_df.dropna(subset=['Club Principal', 'Club Filial'])
+                valid_eq = valid_eq[(valid_eq['Club Principal'] != '') & (valid_eq['Club Filial'] != '')]
+                new_eq_dict = valid_eq.groupby('Club Principal', sort=False)['Club Filial'].agg(list).to_dict()
                 rules_manager.save_equivalences(new_eq_dict)
                 
                 # Recalcular Es_Cedido inmediatamente
                 fuzzy_th = settings_manager.get("fuzzy_threshold", 0.80)
                 df = process_dataframe(df, equivalences=new_eq_dict, fuzzy_threshold=fuzzy_th)
                 
-                st.success("Equivalencias guardadas.")
-                time.sleep(0.5)
+                st.toast("Equivalencias guardadas.", icon="✅")
                 st.rerun()
 
         st.divider()
@@ -1472,8 +1489,7 @@ if 'data' in st.session_state and st.session_state['data'] is not None:
                     new_rules_config[cat]['require_declaration'] = bool(row['require_declaration'])
                     
             rules_manager.save_rules(new_rules_config)
-            st.success("Reglas actualizadas correctamente.")
-            time.sleep(0.5)
+            st.toast("Reglas actualizadas correctamente.", icon="✅")
             st.rerun()
 
 
@@ -1488,9 +1504,12 @@ if 'data' in st.session_state and st.session_state['data'] is not None:
         saved_fuzzy = settings_manager.get("fuzzy_threshold", 0.80)
         current_fuzzy = st.session_state.get('fuzzy_threshold', saved_fuzzy)
         
-        new_fuzzy = st.slider("Umbral de Similitud (0.0 = Todo es igual, 1.0 = Exacto)", 0.0, 1.0, current_fuzzy, 0.05)
+        # En un form: el reprocesado completo solo se lanza al pulsar "Aplicar", no en cada cambio del slider
+        with st.form("fuzzy_form", border=False):
+            new_fuzzy = st.slider("Umbral de Similitud (0.0 = Todo es igual, 1.0 = Exacto)", 0.0, 1.0, current_fuzzy, 0.05)
+            fuzzy_submitted = st.form_submit_button("Aplicar")
         
-        if new_fuzzy != current_fuzzy:
+        if fuzzy_submitted and new_fuzzy != current_fuzzy:
             st.session_state['fuzzy_threshold'] = new_fuzzy
             settings_manager.set("fuzzy_threshold", new_fuzzy)
             # Recalcular
@@ -1501,11 +1520,10 @@ if 'data' in st.session_state and st.session_state['data'] is not None:
                 df = process_dataframe(df, equivalences=current_eq, fuzzy_threshold=new_fuzzy)
                 
                 # Recalcular Auditoría
-                compliance_df = calculate_team_compliance(df, rules_config, team_categories)
-                df = apply_comprehensive_check(df, rules_config, team_categories)
+                df = apply_comprehensive_check_cached(df, rules_config, team_categories)
                 
                 st.session_state['data'] = df
-                save_current_session(current_name, df)
+                save_session_changes(current_name, df)
                 st.rerun()
 
         st.divider()
@@ -1581,8 +1599,7 @@ if 'data' in st.session_state and st.session_state['data'] is not None:
                         rules_config[sel_rule_cat]['ratio_table'] = edited_ratio_df.to_dict(orient='records')
                         
                         rules_manager.save_rules(rules_config)
-                        st.success(f"Reglas actualizadas para {sel_rule_cat}")
-                        time.sleep(1)
+                        st.toast(f"Reglas actualizadas para {sel_rule_cat}", icon="✅")
                         st.rerun()
 
         st.divider()
@@ -1641,222 +1658,213 @@ if 'data' in st.session_state and st.session_state['data'] is not None:
         st.divider()
 
         # E) TÉCNICOS Y DELEGADOS (NUEVO)
-        st.subheader("7. Control de Técnicos y Delegados")
-        st.info("Marca qué equipos han entregado correctamente el 'Impreso de Técnicos y Delegados'.")
+        # Las secciones 7 y 8 son fragments: solo leen y escriben sus propios JSON, así que
+        # filtrar o guardar en ellas no necesita re-ejecutar toda la app (ni la auditoría).
+        @st.fragment
+        def render_technicians_section(team_categories):
+            st.subheader("7. Control de Técnicos y Delegados")
+            st.info("Marca qué equipos han entregado correctamente el 'Impreso de Técnicos y Delegados'.")
         
-        tech_status_path = os.path.join(BASE_DIR, "data", "technicians_status.json")
-        os.makedirs(os.path.dirname(tech_status_path), exist_ok=True)
+            tech_status_path = os.path.join(BASE_DIR, "data", "technicians_status.json")
+            os.makedirs(os.path.dirname(tech_status_path), exist_ok=True)
         
-        # Cargar estado actual
-        tech_status = {}
-        if os.path.exists(tech_status_path):
-            with open(tech_status_path, 'r', encoding='utf-8') as f:
-                try: tab_status = json.load(f)
-                except: tab_status = {}
-        else:
-            tab_status = {}
-
-        # Preparar datos para tabla
-        tech_rows = []
-        # Usar team_categories como fuente de verdad de equipos
-        for team, cat in team_categories.items():
-            if team == "Sin Asignar": continue
-            is_delivered = tab_status.get(team, False)
-            tech_rows.append({
-                "Equipo": team,
-                "Categoría": cat,
-                "Entregado": is_delivered
-            })
+            # Cargar estado actual
+            tech_status = {}
+            if os.path.exists(tech_status_path):
+                with open(tech_status_path, 'r', encoding='utf-8') as f:
+                    try: tab_status = json.load(f)
+                    except: tab_status = {}
+            else:
+                tab_status = {}
+
+            # Preparar datos para tabla
+            tech_rows = []
+            # Usar team_categories como fuente de verdad de equipos
+            for team, cat in team_categories.items():
+                if team == "Sin Asignar": continue
+                is_delivered = tab_status.get(team, False)
+                tech_rows.append({
+                    "Equipo": team,
+                    "Categoría": cat,
+                    "Entregado": is_delivered
+                })
             
-        tech_df = pd.DataFrame(tech_rows)
+            tech_df = pd.DataFrame(tech_rows)
         
-        # Filtros
-        col_tf1, col_tf2 = st.columns([1, 2])
-        filter_cat_tech = col_tf1.selectbox("Filtrar Categoría:", ["Todas"] + LIGA_CATEGORIES, key="tech_cat_filter")
-        search_tech = col_tf2.text_input("Buscar Equipo:", key="tech_search")
+            # Filtros
+            col_tf1, col_tf2 = st.columns([1, 2])
+            filter_cat_tech = col_tf1.selectbox("Filtrar Categoría:", ["Todas"] + LIGA_CATEGORIES, key="tech_cat_filter")
+            search_tech = col_tf2.text_input("Buscar Equipo:", key="tech_search")
         
-        # Aplicar filtros
-        filtered_tech_df = tech_df.copy()
-        if filter_cat_tech != "Todas":
-            filtered_tech_df = filtered_tech_df[filtered_tech_df['Categoría'] == filter_cat_tech]
-        if search_tech:
-            filtered_tech_df = filtered_tech_df[filtered_tech_df['Equipo'].str.contains(search_tech, case=False, na=False)]
+            # Aplicar filtros
+            filtered_tech_df = tech_df.copy()
+            if filter_cat_tech != "Todas":
+                filtered_tech_df = filtered_tech_df[filtered_tech_df['Categoría'] == filter_cat_tech]
+            if search_tech:
+                filtered_tech_df = filtered_tech_df[filtered_tech_df['Equipo'].str.contains(search_tech, case=False, na=False)]
             
-        # Editor
-        edited_tech_df = st.data_editor(
-            filtered_tech_df,
-            column_config={
-                "Equipo": st.column_config.TextColumn("Equipo", disabled=True),
-                "Categoría": st.column_config.TextColumn("Categoría", disabled=True),
-                "Entregado": st.column_config.CheckboxColumn("Impreso Entregado", help="Marcar si han entregado el documento oficial")
-            },
-            use_container_width=True,
-            hide_index=True,
-            key="tech_editor"
-        )
+            # Editor
+            edited_tech_df = st.data_editor(
+                filtered_tech_df,
+                column_config={
+                    "Equipo": st.column_config.TextColumn("Equipo", disabled=True),
+                    "Categoría": st.column_config.TextColumn("Categoría", disabled=True),
+                    "Entregado": st.column_config.CheckboxColumn("Impreso Entregado", help="Marcar si han entregado el documento oficial")
+                },
+                use_container_width=True,
+                hide_index=True,
+                key="tech_editor"
+            )
         
-        if st.button("💾 Guardar Estado Técnicos"):
-            # Actualizar dict principal con los cambios filtrados
-            # OJO: data_editor solo devuelve lo que se ve si se filtra? NO, devuelve el DF editado pero si filtramos antes?
-            # Si filtramos, edited_tech_df solo tiene los filtrados.
-            # Necesitamos mergear con el estado global.
+            if st.button("💾 Guardar Estado Técnicos"):
+                # Actualizar dict principal con los cambios filtrados
+                # OJO: data_editor solo devuelve lo que se ve si se filtra? NO, devuelve el DF editado pero si filtramos antes?
+                # Si filtramos, edited_tech_df solo tiene los filtrados.
+                # Necesitamos mergear con el estado global.
             
-            updates = 0
-            for _, row in edited_tech_df.iterrows():
-                team_name = row['Equipo']
-                new_status = row['Entregado']
+                updates = 0
+                for _, row in edited_tech_df.iterrows():
+                    team_name = row['Equipo']
+                    new_status = row['Entregado']
                 
-                # Check if changed
-                if tab_status.get(team_name) != new_status:
-                    tab_status[team_name] = new_status
-                    updates += 1
+                    # Check if changed
+                    if tab_status.get(team_name) != new_status:
+                        tab_status[team_name] = new_status
+                        updates += 1
             
-            # Guardar
-            with open(tech_status_path, 'w', encoding='utf-8') as f:
-                json.dump(tab_status, f, indent=4)
+                # Guardar
+                with open(tech_status_path, 'w', encoding='utf-8') as f:
+                    json.dump(tab_status, f, indent=4)
                 
-            st.success(f"Estado actualizado ({updates} cambios).")
-            time.sleep(1)
-            st.rerun()
+                st.toast(f"Estado actualizado ({updates} cambios).", icon="✅")
+                st.rerun(scope="fragment")
+
+        render_technicians_section(team_categories)
 
         st.divider()
 
         # F) MAPEO DE CLUB IDs (NUEVO)
-        st.subheader("8. Mapeo de Club IDs para Exportación")
-        st.info("Asigna el código ClubID (ej: MAD-7784) a cada equipo. Este ID se usa al exportar jugadores.")
+        @st.fragment
+        def render_clubid_section(team_categories):
+            st.subheader("8. Mapeo de Club IDs para Exportación")
+            st.info("Asigna el código ClubID (ej: MAD-7784) a cada equipo. Este ID se usa al exportar jugadores.")
         
-        # Cargar mapeo actual de club_ids
-        club_ids_path = os.path.join(BASE_DIR, "config", "club_ids.json")
-        os.makedirs(os.path.dirname(club_ids_path), exist_ok=True)
+            # Cargar mapeo actual de club_ids
+            club_ids_path = os.path.join(BASE_DIR, "config", "club_ids.json")
+            os.makedirs(os.path.dirname(club_ids_path), exist_ok=True)
         
-        club_ids_mapping = {}
-        if os.path.exists(club_ids_path):
-            with open(club_ids_path, 'r', encoding='utf-8') as f:
-                try: club_ids_mapping = json.load(f)
-                except: club_ids_mapping = {}
+            club_ids_mapping = {}
+            if os.path.exists(club_ids_path):
+                with open(club_ids_path, 'r', encoding='utf-8') as f:
+                    try: club_ids_mapping = json.load(f)
+                    except: club_ids_mapping = {}
         
-        # Cargar mapeo manual de Equipo -> ClubID (override)
-        team_clubid_override_path = os.path.join(BASE_DIR, "config", "team_clubid_override.json")
-        team_clubid_override = {}
-        if os.path.exists(team_clubid_override_path):
-            with open(team_clubid_override_path, 'r', encoding='utf-8') as f:
-                try: team_clubid_override = json.load(f)
-                except: team_clubid_override = {}
+            # Cargar mapeo manual de Equipo -> ClubID (override)
+            team_clubid_override_path = os.path.join(BASE_DIR, "config", "team_clubid_override.json")
+            team_clubid_override = {}
+            if os.path.exists(team_clubid_override_path):
+                with open(team_clubid_override_path, 'r', encoding='utf-8') as f:
+                    try: team_clubid_override = json.load(f)
+                    except: team_clubid_override = {}
         
-        # Función para obtener ClubID (auto + override)
-        from data_processing import normalize_name, calculate_similarity
+            # Función para obtener ClubID (auto + override)
+            from data_processing import club_id_index, get_clubid_for_team
+            club_index = club_id_index(club_ids_mapping) # Una vez para todos los equipos
         
-        def get_clubid_auto(team_name):
-            """Auto-detect ClubID using fuzzy matching."""
-            if not team_name: return ""
-            team_str = str(team_name).strip()
-            
-            # Exact match
-            if team_str in club_ids_mapping:
-                return club_ids_mapping[team_str]
-            
-            # Case-insensitive
-            for club_name, club_id in club_ids_mapping.items():
-                if club_name.upper() == team_str.upper():
-                    return club_id
-            
-            # Normalized/fuzzy
-            norm_team = normalize_name(team_str)
-            for club_name, club_id in club_ids_mapping.items():
-                norm_club = normalize_name(club_name)
-                if norm_team in norm_club or norm_club in norm_team:
-                    return club_id
-                if calculate_similarity(team_str, club_name) >= 0.80:
-                    return club_id
-            
-            return ""
+            def get_clubid_auto(team_name):
+                """Auto-detect ClubID using fuzzy matching."""
+                return get_clubid_for_team(team_name, club_ids_mapping, club_index, threshold=0.80)
         
-        # Preparar datos para tabla
-        clubid_rows = []
-        for team in sorted(team_categories.keys()):
-            if team == "Sin Asignar": continue
-            auto_id = get_clubid_auto(team)
-            override_id = team_clubid_override.get(team, "")
-            final_id = override_id if override_id else auto_id
-            clubid_rows.append({
-                "Equipo": team,
-                "ClubID (Auto)": auto_id,
-                "ClubID (Manual)": override_id,
-                "ClubID Final": final_id,
-                "Estado": "✅" if final_id else "⚠️ Sin ID"
-            })
+            # Preparar datos para tabla
+            clubid_rows = []
+            for team in sorted(team_categories.keys()):
+                if team == "Sin Asignar": continue
+                auto_id = get_clubid_auto(team)
+                override_id = team_clubid_override.get(team, "")
+                final_id = override_id if override_id else auto_id
+                clubid_rows.append({
+                    "Equipo": team,
+                    "ClubID (Auto)": auto_id,
+                    "ClubID (Manual)": override_id,
+                    "ClubID Final": final_id,
+                    "Estado": "✅" if final_id else "⚠️ Sin ID"
+                })
         
-        clubid_df = pd.DataFrame(clubid_rows)
+            clubid_df = pd.DataFrame(clubid_rows)
         
-        # Filtros
-        col_cid_f1, col_cid_f2 = st.columns([1, 2])
-        with col_cid_f1:
-            filter_cid_status = st.selectbox("Filtrar:", ["Todos", "⚠️ Sin ID", "✅ Con ID"], key="filter_cid_status")
-        with col_cid_f2:
-            search_cid = st.text_input("Buscar equipo:", key="search_cid")
+            # Filtros
+            col_cid_f1, col_cid_f2 = st.columns([1, 2])
+            with col_cid_f1:
+                filter_cid_status = st.selectbox("Filtrar:", ["Todos", "⚠️ Sin ID", "✅ Con ID"], key="filter_cid_status")
+            with col_cid_f2:
+                search_cid = st.text_input("Buscar equipo:", key="search_cid")
         
-        filtered_cid_df = clubid_df.copy()
-        if filter_cid_status == "⚠️ Sin ID":
-            filtered_cid_df = filtered_cid_df[filtered_cid_df['Estado'] == "⚠️ Sin ID"]
-        elif filter_cid_status == "✅ Con ID":
-            filtered_cid_df = filtered_cid_df[filtered_cid_df['Estado'] == "✅"]
-        if search_cid:
-            filtered_cid_df = filtered_cid_df[filtered_cid_df['Equipo'].str.contains(search_cid, case=False, na=False)]
+            filtered_cid_df = clubid_df.copy()
+            if filter_cid_status == "⚠️ Sin ID":
+                filtered_cid_df = filtered_cid_df[filtered_cid_df['Estado'] == "⚠️ Sin ID"]
+            elif filter_cid_status == "✅ Con ID":
+                filtered_cid_df = filtered_cid_df[filtered_cid_df['Estado'] == "✅"]
+            if search_cid:
+                filtered_cid_df = filtered_cid_df[filtered_cid_df['Equipo'].str.contains(search_cid, case=False, na=False)]
         
-        # Mostrar resumen
-        n_with_id = len(clubid_df[clubid_df['Estado'] == "✅"])
-        n_without_id = len(clubid_df[clubid_df['Estado'] == "⚠️ Sin ID"])
-        st.markdown(f"**Equipos con ClubID:** {n_with_id} | **Sin asignar:** {n_without_id}")
+            # Mostrar resumen
+            n_with_id = len(clubid_df[clubid_df['Estado'] == "✅"])
+            n_without_id = len(clubid_df[clubid_df['Estado'] == "⚠️ Sin ID"])
+            st.markdown(f"**Equipos con ClubID:** {n_with_id} | **Sin asignar:** {n_without_id}")
         
-        # Editor - solo editable la columna Manual
-        edited_cid_df = st.data_editor(
-            filtered_cid_df,
-            column_config={
-                "Equipo": st.column_config.TextColumn("Equipo", disabled=True),
-                "ClubID (Auto)": st.column_config.TextColumn("Auto-detectado", disabled=True, help="ID detectado automáticamente por similitud de nombre"),
-                "ClubID (Manual)": st.column_config.TextColumn("Override Manual", help="Escribe aquí para sobrescribir el ID auto-detectado"),
-                "ClubID Final": st.column_config.TextColumn("ID Final", disabled=True),
-                "Estado": st.column_config.TextColumn("Estado", disabled=True, width="small")
-            },
-            use_container_width=True,
-            hide_index=True,
-            key="clubid_editor"
-        )
+            # Editor - solo editable la columna Manual
+            edited_cid_df = st.data_editor(
+                filtered_cid_df,
+                column_config={
+                    "Equipo": st.column_config.TextColumn("Equipo", disabled=True),
+                    "ClubID (Auto)": st.column_config.TextColumn("Auto-detectado", disabled=True, help="ID detectado automáticamente por similitud de nombre"),
+                    "ClubID (Manual)": st.column_config.TextColumn("Override Manual", help="Escribe aquí para sobrescribir el ID auto-detectado"),
+                    "ClubID Final": st.column_config.TextColumn("ID Final", disabled=True),
+                    "Estado": st.column_config.TextColumn("Estado", disabled=True, width="small")
+                },
+                use_container_width=True,
+                hide_index=True,
+                key="clubid_editor"
+            )
         
-        if st.button("💾 Guardar Mapeo de Club IDs"):
-            # Extraer overrides del editor
-            new_overrides = {}
-            for _, row in edited_cid_df.iterrows():
-                team_name = row['Equipo']
-                manual_id = str(row['ClubID (Manual)']).strip()
-                if manual_id and manual_id.lower() != 'nan':
-                    new_overrides[team_name] = manual_id
+            if st.button("💾 Guardar Mapeo de Club IDs"):
+                # Extraer overrides del editor
+                new_overrides = {}
+                for _, row in edited_cid_df.iterrows():
+                    team_name = row['Equipo']
+                    manual_id = str(row['ClubID (Manual)']).strip()
+                    if manual_id and manual_id.lower() != 'nan':
+                        new_overrides[team_name] = manual_id
             
-            # Mergear con overrides existentes (incluir equipos no filtrados)
-            for team, cid in team_clubid_override.items():
-                if team not in [r['Equipo'] for _, r in edited_cid_df.iterrows()]:
-                    new_overrides[team] = cid
+                # Mergear con overrides existentes (incluir equipos no filtrados)
+                for team, cid in team_clubid_override.items():
+                    if team not in [r['Equipo'] for _, r in edited_cid_df.iterrows()]:
+                        new_overrides[team] = cid
             
-            # Guardar
-            with open(team_clubid_override_path, 'w', encoding='utf-8') as f:
-                json.dump(new_overrides, f, indent=2, ensure_ascii=False)
+                # Guardar
+                with open(team_clubid_override_path, 'w', encoding='utf-8') as f:
+                    json.dump(new_overrides, f, indent=2, ensure_ascii=False)
             
-            st.success(f"Mapeo guardado ({len(new_overrides)} overrides manuales).")
-            time.sleep(1)
-            st.rerun()
+                st.toast(f"Mapeo guardado ({len(new_overrides)} overrides manuales).", icon="✅")
+                st.rerun(scope="fragment")
+
+        render_clubid_section(team_categories)
 
     # 3. INCIDENCIAS (Cambio de Nombre)
     with tab_incidencias:
         st.subheader("⚠️ Listado de Incidencias Normativas")
         
-        incidencias_df = df[df['Errores_Normativos'] != ""]
+        # Solo las columnas que se muestran: evita copiar (y serializar) todo el DF
+        if len(has_error) != len(df): # df reasignado en este rerun (p.ej. borrado sin guardar)
+            has_error = df['Errores_Normativos'].to_numpy() != ""
+        incidencias_df = df.loc[has_error, ['Pruebas', 'Jugador', 'Errores_Normativos']]
         
         if incidencias_df.empty:
              st.success("✅ **¡Felicidades! No se detectan infracciones normativas.**")
         else:
              st.error(f"❌ **Se han detectado {len(incidencias_df)} irregularidades.**")
              st.dataframe(
-                 incidencias_df[['Pruebas', 'Jugador', 'Errores_Normativos']], 
+                 incidencias_df, 
                  use_container_width=True,
                  hide_index=True
              )
@@ -1895,32 +1903,34 @@ if 'data' in st.session_state and st.session_state['data'] is not None:
             export_excluidos = st.checkbox("Incluir Excluidos", value=False, key="export_include_excluded")
         
         # --- APLICAR FILTROS AL DF PARA EXPORTAR ---
-        export_mask = pd.Series([True] * len(df))
+        export_preds = []
         
         # Filtro por equipo
         if export_sel_team != "Todos":
-            export_mask = export_mask & (df['Pruebas'] == export_sel_team)
+            export_preds.append(df['Pruebas'] == export_sel_team)
         elif export_sel_cat != "Todas":
-            export_mask = export_mask & (df['Pruebas'].isin(export_teams_in_cat))
+            export_preds.append(df['Pruebas'].isin(export_teams_in_cat))
         
         # Filtro por estado FESBA
         if export_sel_status == "✅ Licencia OK":
-            export_mask = export_mask & (df['Validacion_FESBA'].astype(str).str.contains("✅", na=False))
+            export_preds.append(df['Validacion_FESBA'].fillna('').astype(str).str.startswith("✅"))
         elif export_sel_status == "❌ Licencia Incorrecta":
-            export_mask = export_mask & (df['Validacion_FESBA'].astype(str).str.contains("❌|NO ENCONTRADO", na=False))
+            export_preds.append(df['Validacion_FESBA'].fillna('').astype(str).str.startswith("❌"))
         elif export_sel_status == "⛔ Con Incidencias":
-            export_mask = export_mask & (df['Errores_Normativos'].astype(str).str.strip() != "")
+            export_preds.append(df['Errores_Normativos'].astype(str).str.strip() != "")
         
         # Filtro cedidos
         if export_cedidos == "Solo Cedidos":
-            export_mask = export_mask & (df['Es_Cedido'] == True)
+            export_preds.append(df['Es_Cedido'] == True)
         elif export_cedidos == "Sin Cedidos":
-            export_mask = export_mask & (df['Es_Cedido'] == False)
+            export_preds.append(df['Es_Cedido'] == False)
         
         # Filtro excluidos
-        if not export_excluidos:
-            export_mask = export_mask & (df.get('Es_Excluido', pd.Series([False]*len(df))) == False)
-        
+        if not export_excluidos and 'Es_Excluido' in df.columns:
+            export_preds.append(df['Es_Excluido'] == False)
+
+        export_mask = np.logical_and.reduce([np.asarray(p, dtype=bool) for p in export_preds]) if export_preds else np.ones(len(df), dtype=bool)
+
         # DataFrame filtrado
         df_export = df[export_mask].copy()
         
@@ -1939,10 +1949,11 @@ if 'data' in st.session_state and st.session_state['data'] is not None:
         if export_sel_team != "Todos":
             filter_suffix += f"_{export_sel_team.replace(' ', '_')}"
         
+        # Los ficheros se generan al pulsar el botón (data=callable), no en cada rerun
         with c_dl1:
             st.download_button(
                 "📥 Descargar Informe Excel", 
-                data=to_excel(df_export), 
+                data=partial(to_excel, df_export), 
                 file_name=f"Informe_{current_name}{filter_suffix}.xlsx", 
                 mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet", 
                 use_container_width=True
@@ -1951,7 +1962,7 @@ if 'data' in st.session_state and st.session_state['data'] is not None:
             export_csv_disabled = bool(len(df_export) == 0)
             st.download_button(
                 "📥 CSV Jugadores", 
-                data=generate_players_csv(df_export), 
+                data=partial(generate_players_csv, df_export), 
                 file_name=f"import_players{filter_suffix}.csv", 
                 mime="text/csv", 
                 use_container_width=True, 
@@ -1960,7 +1971,7 @@ if 'data' in st.session_state and st.session_state['data'] is not None:
         with c_dl3:
             st.download_button(
                 "📥 CSV Alineaciones", 
-                data=generate_team_players_csv(df_export), 
+                data=partial(generate_team_players_csv, df_export), 
                 file_name=f"import_team_players{filter_suffix}.csv", 
                 mime="text/csv", 
                 use_container_width=True, 
@@ -1976,7 +1987,7 @@ if 'data' in st.session_state and st.session_state['data'] is not None:
         with c_tp2:
             st.download_button(
                 "📥 Descargar para Tournament Planner (.xlsx)",
-                data=generate_tournament_planner_xlsx(df_export),
+                data=partial(generate_tournament_planner_xlsx, df_export),
                 file_name=f"tournament_planner_import{filter_suffix}.xlsx",
                 mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
                 use_container_width=True,
@@ -1993,7 +2004,7 @@ if 'data' in st.session_state and st.session_state['data'] is not None:
              timestamp_bk = datetime.now().strftime("%Y%m%d_%H%M")
              st.download_button(
                 "💾 Descargar Backup (.xlsx)", 
-                data=to_excel(df), # RAW DF (No filters)
+                data=partial(to_excel, df), # RAW DF (No filters)
                 file_name=f"BACKUP_LNC_{timestamp_bk}.xlsx", 
                 mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet", 
                 use_container_width=True,
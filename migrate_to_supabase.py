@@ -34,7 +34,13 @@ def migrate_data():
     for name, session in history.items():
         try:
             # Clean data - replace NaN with None
-            data = session.get("data", [])
+            if "data" in session:
+                data = session["data"]
+            else:
+                # Entrada solo con metadatos: los datos están en la copia Parquet local
+                from modules.state import load_session_data_local
+                df = load_session_data_local(name)
+                data = json.loads(df.to_json(orient='records', date_format='iso')) if df is not None else []
             for row in data:
                 for key_name, value in list(row.items()):
                     if isinstance(value, float) and str(value) == 'nan':
@@ -208,6 +208,22 @@ def load_config(config_name: str, default: dict = None) -> dict:
         logger.error(f"Error loading config: {e}")
         return default or {}
 
+def config_version(config_name: str):
+    """Update time of a config document (None if it doesn't exist). Unlike load_config, raises on errors."""
+    db = init_firebase()
+    if db is None:
+        raise RuntimeError("Firebase not initialized")
+    doc = db.collection("config").document(config_name).get(field_paths=[])
+    return str(doc.update_time) if doc.exists else None
+
+def fetch_config(config_name: str):
+    """Config data (None if it doesn't exist). Unlike load_config, raises on errors so callers don't cache a fallback."""
+    db = init_firebase()
+    if db is None:
+        raise RuntimeError("Firebase not initialized")
+    doc = db.collection("config").document(config_name).get()
+    return doc.to_dict() if doc.exists else None
+
 # ==================== LICENCIAS CACHE ====================
 
 def save_licenses_cache(licenses_db: dict, timestamp: datetime = None) -> bool:
@@ -7,7 +7,11 @@ import json
 import pandas as pd
 import streamlit as st
 from datetime import datetime
+import re
 import logging
+import threading
+from collections import OrderedDict
+from utils import fast_json_loads, arrow_table_to_df
 
 logger = logging.getLogger(__name__)
 
@@ -35,6 +39,15 @@ except ImportError:
 # Local fallback paths
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 PERSISTENCE_FILE = os.path.join(BASE_DIR, "historial_inscripciones.json")
+SCHEMA_DIR = os.path.join(BASE_DIR, "session_schemas")
+SESSION_DATA_DIR = os.path.join(BASE_DIR, "session_data")
+# Local mode: per-session journal of cell changes ({name}.jsonl), replayed and compacted on load
+JOURNAL_DIR = os.path.join(BASE_DIR, "session_journal")
+# Above these limits save_session_changes does a full save (which also compacts the journal)
+JOURNAL_MAX_CHANGES = 5000
+JOURNAL_COMPACT_BYTES = 5 * 1024 * 1024
+# Linux only: read local session Parquet files with O_DIRECT (bypasses the page cache)
+DIRECT_IO = os.environ.get("LNC_DIRECT_IO") == "1" and hasattr(os, "O_DIRECT")
 
 # Custom JSON Encoder for DateTime
 class DateTimeEncoder(json.JSONEncoder):
@@ -50,8 +63,8 @@ class DateTimeEncoder(json.JSONEncoder):
 def _load_history_local():
     if os.path.exists(PERSISTENCE_FILE):
         try:
-            with open(PERSISTENCE_FILE, 'r', encoding='utf-8') as f:
-                return json.load(f)
+            with open(PERSISTENCE_FILE, 'rb') as f:
+                return fast_json_loads(f.read())
         except:
             return {}
     return {}
@@ -65,6 +78,252 @@ def _save_history_local(history_dict):
         logger.error(f"Error saving local history: {e}")
         return False
 
+def _safe_file_name(file_name: str) -> str:
+    return re.sub(r'[^\w\-. ]', '_', str(file_name))
+
+def session_schema_path(file_name: str) -> str:
+    """Path of the '{name}.schema.parquet' file kept next to each saved session."""
+    return os.path.join(SCHEMA_DIR, f"{_safe_file_name(file_name)}.schema.parquet")
+
+def session_data_path(file_name: str) -> str:
+    """Path of the local Parquet copy of a session's data."""
+    return os.path.join(SESSION_DATA_DIR, f"{_safe_file_name(file_name)}.parquet")
+
+def session_journal_path(file_name: str) -> str:
+    """Path of the append-only change journal of a session (local mode)."""
+    return os.path.join(JOURNAL_DIR, f"{_safe_file_name(file_name)}.jsonl")
+
+# Last saved state per session (what base file + journal replay to); guarded by _journal_lock
+_saved_snapshots = OrderedDict()
+_SNAPSHOT_LIMIT = 4
+_journal_lock = threading.Lock()
+
+def _remember_saved(file_name: str, df: pd.DataFrame) -> None:
+    with _journal_lock:
+        _saved_snapshots[file_name] = df.copy()
+        _saved_snapshots.move_to_end(file_name)
+        while len(_saved_snapshots) > _SNAPSHOT_LIMIT:
+            _saved_snapshots.popitem(last=False)
+
+def _to_json_value(v):
+    if isinstance(v, list):
+        return v
+    if pd.api.types.is_scalar(v) and pd.isna(v):
+        return None
+    if isinstance(v, (pd.Timestamp, datetime)):
+        return v.strftime("%Y-%m-%d %H:%M:%S")
+    return v.item() if hasattr(v, 'item') else v
+
+def _changed_positions(old: pd.Series, new: pd.Series):
+    """Row positions where two aligned columns differ (NaN == NaN)."""
+    both_na = (old.isna() & new.isna()).to_numpy()
+    try:
+        if old.dtype != new.dtype or old.dtype == object:
+            raise TypeError
+        diff = old.to_numpy() != new.to_numpy()
+    except (TypeError, ValueError):
+        diff = old.astype(str).to_numpy() != new.astype(str).to_numpy()
+    return (diff & ~both_na).nonzero()[0]
+
+def compute_diff(prev_df: pd.DataFrame, df: pd.DataFrame):
+    """
+    Cell changes between two versions of a session as [[row_position, column, value], ...].
+    Returns None when rows or columns differ (added/removed players or fields): needs a full save.
+    """
+    if prev_df is None or not prev_df.columns.equals(df.columns) or not prev_df.index.equals(df.index):
+        return None
+    changes = []
+    for col in df.columns:
+        new_col = df[col]
+        for pos in _changed_positions(prev_df[col], new_col):
+            changes.append([int(pos), col, _to_json_value(new_col.iat[pos])])
+    return changes
+
+def _apply_journal(file_name: str, df: pd.DataFrame) -> pd.DataFrame:
+    """Replays the session's journal on top of the loaded base data."""
+    path = session_journal_path(file_name)
+    if df is None or not os.path.exists(path):
+        return df
+    by_col = {}
+    with open(path, 'rb') as f:
+        for line in f:
+            if line.strip():
+                pos, col, value = fast_json_loads(line)
+                if col in df.columns and pos < len(df):
+                    by_col.setdefault(col, {})[pos] = value
+    for col, cells in by_col.items():
+        dtype = df[col].dtype
+        values = df[col].astype(object).to_numpy(copy=True)
+        for pos, value in cells.items():
+            values[pos] = value
+        df[col] = _restore_dtype(values, dtype, list(cells), df.index)
+    return df
+
+def _restore_dtype(values, dtype, positions, index) -> pd.Series:
+    """
+    Column rebuilt from the replayed object values with the dtype it had in the base data
+    (Categorical, string, datetime); other dtypes (numbers, bools, object) are re-inferred.
+    """
+    if isinstance(dtype, pd.CategoricalDtype):
+        new = pd.Index(pd.unique(values[positions])).dropna().difference(dtype.categories)
+        categories = dtype.categories.append(new) if len(new) else dtype.categories
+        return pd.Series(pd.Categorical(values, categories=categories, ordered=dtype.ordered), index=index)
+    try:
+        if pd.api.types.is_datetime64_any_dtype(dtype):
+            # The journal stores dates as "%Y-%m-%d %H:%M:%S" strings (DateTimeEncoder, no tz)
+            tz = getattr(dtype, 'tz', None)
+            for pos in positions:
+                if values[pos] is not None:
+                    ts = pd.Timestamp(values[pos])
+                    values[pos] = ts.tz_localize(tz) if tz is not None and ts.tzinfo is None else ts
+            return pd.Series(values, index=index).astype(dtype)
+        if isinstance(dtype, pd.StringDtype):
+            return pd.Series(values, index=index).astype(dtype)
+    except (TypeError, ValueError) as e:
+        logger.warning(f"Journal values do not fit dtype {dtype}, re-inferring: {e}")
+    return pd.Series(values, index=index).infer_objects()
+
+def _save_session_parquet(file_name: str, df: pd.DataFrame) -> bool:
+    """
+    Local columnar copy of the session (what load_session_data reads). Returns False if the
+    frame can't be written as Parquet; the caller then keeps the records in the JSON history.
+    """
+    path = session_data_path(file_name)
+    try:
+        os.makedirs(SESSION_DATA_DIR, exist_ok=True)
+        df.to_parquet(path + ".tmp", engine='pyarrow', compression='zstd', index=False)
+        os.replace(path + ".tmp", path)
+        return True
+    except Exception as e:
+        # Mixed-type columns etc.: drop any stale copy, the JSON records are used instead
+        logger.warning(f"Could not write parquet copy for '{file_name}': {e}")
+        for stale in (path, path + ".tmp"):
+            if os.path.exists(stale):
+                os.remove(stale)
+        return False
+
+def _read_direct(path: str):
+    """Reads a whole file with O_DIRECT into a page-aligned buffer (zero-copy pyarrow Buffer)."""
+    import mmap
+    import pyarrow as pa
+    
+    size = os.path.getsize(path)
+    buf = mmap.mmap(-1, max(-(-size // mmap.PAGESIZE) * mmap.PAGESIZE, mmap.PAGESIZE))
+    fd = os.open(path, os.O_RDONLY | os.O_DIRECT)
+    try:
+        if os.readv(fd, [buf]) < size:
+            raise OSError(f"Short O_DIRECT read on {path}")
+    finally:
+        os.close(fd)
+    return pa.py_buffer(memoryview(buf)[:size])
+
+def _load_session_parquet(path: str) -> pd.DataFrame:
+    """Reads a local session Parquet file memory-mapped (or via O_DIRECT if LNC_DIRECT_IO=1)."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    
+    if DIRECT_IO:
+        try:
+            return arrow_table_to_df(pq.read_table(_read_direct(path)))
+        except OSError as e:
+            # e.g. filesystems without O_DIRECT support (tmpfs)
+            logger.info(f"O_DIRECT read failed, using mmap: {e}")
+    return arrow_table_to_df(pq.read_table(pa.memory_map(path, 'r')))
+
+def _has_unhashable(col: pd.Series) -> bool:
+    """True if an object column holds list/dict/set cells in any row (C-level hash of every cell)."""
+    if col.dtype != object:
+        return False
+    try:
+        pd.unique(col.to_numpy())
+        return False
+    except TypeError:
+        return True
+
+def _save_session_schema(file_name: str, df: pd.DataFrame) -> None:
+    """
+    Writes a tiny schema snapshot (col, dtype, sample_type, sample_repr, has_unhashable) of
+    the session, so diagnostics can check column types without loading the whole session.
+    has_unhashable covers every row, not just the first non-null sample.
+    """
+    try:
+        rows = []
+        for col in df.columns:
+            non_null = df[col].dropna()
+            sample = non_null.iloc[0] if not non_null.empty else None
+            rows.append({
+                "col": str(col),
+                "dtype": str(df[col].dtype),
+                "sample_type": type(sample).__name__,
+                "sample_repr": repr(sample)[:200],
+                "has_unhashable": _has_unhashable(df[col]),
+            })
+        os.makedirs(SCHEMA_DIR, exist_ok=True)
+        pd.DataFrame(rows, columns=["col", "dtype", "sample_type", "sample_repr", "has_unhashable"]).to_parquet(
+            session_schema_path(file_name), index=False
+        )
+    except Exception as e:
+        logger.warning(f"Could not write schema file for '{file_name}': {e}")
+
+def _save_session_local(file_name: str, df: pd.DataFrame, timestamp: str = None) -> tuple[bool, str]:
+    """
+    Full local save of a session: Parquet copy, JSON history entry and schema file.
+    The JSON entry only holds metadata (timestamp, columns, count) once the Parquet copy is
+    written; the records go into the JSON only when the frame can't be stored as Parquet.
+    It becomes the new base, so the session's journal is dropped.
+    timestamp: keep this history timestamp instead of 'now' (journal compaction on load).
+    """
+    try:
+        entry = {
+            "timestamp": timestamp or datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "columns": list(df.columns),
+            "count": len(df),
+            "mode": "mirror_backup" # Flag to indicate this is a mirror
+        }
+        if not _save_session_parquet(file_name, df):
+            # PANDAS TO JSON
+            entry["data"] = fast_json_loads(df.to_json(orient='records', date_format='iso'))
+        
+        history = _load_history_local()
+        history[file_name] = entry
+        if not _save_history_local(history):
+            return False, "Error writing local disk"
+        _save_session_schema(file_name, df)
+        # The full save is the new base: drop the journal
+        if os.path.exists(session_journal_path(file_name)):
+            os.remove(session_journal_path(file_name))
+        _remember_saved(file_name, df)
+        return True, "Saved to local mirror"
+    except Exception as e:
+        logger.error(f"Local mirror save failed: {e}")
+        return False, str(e)
+
+def _session_timestamp(file_name: str, entry: dict) -> str:
+    """
+    History timestamp of a local session, or the mtime of its journal if newer: journaled
+    saves only append to the journal, they don't rewrite historial_inscripciones.json.
+    """
+    timestamp = entry.get("timestamp", "") or ""
+    path = session_journal_path(file_name)
+    if os.path.exists(path):
+        edited = datetime.fromtimestamp(os.path.getmtime(path)).strftime("%Y-%m-%d %H:%M:%S")
+        timestamp = max(timestamp, edited)
+    return timestamp
+
+def _compact_journal(file_name: str, df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Compact on load: replays the session's journal and folds it into the Parquet copy and
+    the JSON entry (full local save keeping the last edit time), dropping the journal.
+    """
+    if df is None or not os.path.exists(session_journal_path(file_name)):
+        return df
+    timestamp = _session_timestamp(file_name, _load_history_local().get(file_name, {}))
+    df = _apply_journal(file_name, df)
+    ok, msg = _save_session_local(file_name, df, timestamp=timestamp)
+    if not ok:
+        logger.warning(f"Could not compact journal of '{file_name}': {msg}")
+    return df
+
 # ==================== PUBLIC API (Auto-selects Cloud or Local) ====================
 
 def load_history() -> dict:
@@ -80,7 +339,7 @@ def load_history() -> dict:
     # Local fallback
     local_data = _load_history_local()
     return {
-        name: {"timestamp": data.get("timestamp", ""), "count": len(data.get("data", []))}
+        name: {"timestamp": _session_timestamp(name, data), "count": data.get("count", len(data.get("data", [])))}
         for name, data in local_data.items()
     }
 
@@ -98,28 +357,7 @@ def save_current_session(file_name: str, df: pd.DataFrame) -> tuple[bool, str]:
     Returns (success, error_msg) based on the primary storage (Cloud if active, else Local).
     """
     # --- 1. LOCAL MIRROR SAVE ---
-    local_success = False
-    local_msg = ""
-    try:
-        history = _load_history_local()
-        
-        # PANDAS TO JSON
-        json_str = df.to_json(orient='records', date_format='iso')
-        data_records = json.loads(json_str)
-
-        history[file_name] = {
-            "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-            "data": data_records,
-            "mode": "mirror_backup" # Flag to indicate this is a mirror
-        }
-        if _save_history_local(history):
-            local_success = True
-            local_msg = "Saved to local mirror"
-        else:
-             local_msg = "Error writing local disk"
-    except Exception as e:
-        logger.error(f"Local mirror save failed: {e}")
-        local_msg = str(e)
+    local_success, local_msg = _save_session_local(file_name, df)
 
     # --- 2. CLOUD SAVE ---
     if DB_AVAILABLE:
@@ -140,6 +378,42 @@ def save_current_session(file_name: str, df: pd.DataFrame) -> tuple[bool, str]:
     else:
         return False, local_msg
 
+def save_session_changes(file_name: str, df: pd.DataFrame) -> tuple[bool, str]:
+    """
+    Like save_current_session, but in local mode only appends the cells changed since the
+    last save of this session to its journal instead of rewriting the whole history file.
+    Falls back to a full save in cloud mode, on structural changes (rows/columns) and when
+    the journal grows past JOURNAL_COMPACT_BYTES. load_history reports the journal's mtime as
+    the session timestamp; load_session_data folds the journal back into the JSON and Parquet.
+    """
+    if DB_AVAILABLE:
+        init_db()
+        if is_cloud_mode():
+            return save_current_session(file_name, df)
+    
+    path = session_journal_path(file_name)
+    with _journal_lock:
+        prev_df = _saved_snapshots.get(file_name)
+    changes = compute_diff(prev_df, df)
+    if changes is None or len(changes) > JOURNAL_MAX_CHANGES or \
+            (os.path.exists(path) and os.path.getsize(path) > JOURNAL_COMPACT_BYTES):
+        return save_current_session(file_name, df)
+    if not changes:
+        return True, "OK (Local, sin cambios)"
+    
+    try:
+        os.makedirs(JOURNAL_DIR, exist_ok=True)
+        lines = "".join(json.dumps(c, ensure_ascii=False, cls=DateTimeEncoder) + "\n" for c in changes)
+        with _journal_lock:
+            with open(path, 'a', encoding='utf-8') as f:
+                f.write(lines)
+    except Exception as e:
+        logger.error(f"Journal append failed for '{file_name}': {e}")
+        return save_current_session(file_name, df)
+    _remember_saved(file_name, df)
+    _save_session_schema(file_name, df)
+    return True, f"OK (Local, {len(changes)} cambios)"
+
 import unicodedata # Added for robust string matching
 
 # ... (existing imports)
@@ -154,6 +428,22 @@ def load_session_data(file_name: str) -> pd.DataFrame:
             return load_session(file_name)
     
     # Local fallback
+    return load_session_data_local(file_name)
+
+def load_session_data_local(file_name: str) -> pd.DataFrame:
+    """
+    Local copy of a session (Parquet copy + journal, or the JSON records of entries that
+    couldn't be stored as Parquet). Also used by the sync/migration scripts.
+    """
+    # 0. Parquet copy first: the JSON history (and any legacy records in it) is only parsed
+    #    when there is no readable copy under this exact name
+    parquet_path = session_data_path(file_name)
+    if os.path.exists(parquet_path):
+        try:
+            return _compact_journal(file_name, _load_session_parquet(parquet_path))
+        except Exception as e:
+            logger.warning(f"Parquet copy of '{file_name}' unreadable, using JSON: {e}")
+    
     history = _load_history_local()
     
     # 1. Exact Match
@@ -175,6 +465,13 @@ def load_session_data(file_name: str) -> pd.DataFrame:
             
     if target_key:
         print(f"DEBUG: Found target key '{target_key}' in history.")
+        parquet_path = session_data_path(target_key)
+        if target_key != file_name and os.path.exists(parquet_path):
+            try:
+                return _compact_journal(target_key, _load_session_parquet(parquet_path))
+            except Exception as e:
+                logger.warning(f"Parquet copy of '{target_key}' unreadable, using JSON: {e}")
+        
         data = history[target_key].get("data", [])
         print(f"DEBUG: Data records count: {len(data)}")
         
@@ -182,7 +479,9 @@ def load_session_data(file_name: str) -> pd.DataFrame:
             # print("DEBUG: Data list is empty.")
             return pd.DataFrame() 
             
-        df = pd.DataFrame(data)
+        # Column order from the saved metadata (older entries have none)
+        df = pd.DataFrame.from_records(data, columns=history[target_key].get("columns") or None)
+        df = _compact_journal(target_key, df)
         # print(f"DEBUG: Initial DF Shape: {df.shape}")
         
         # LEGACY: 'Restore list columns' block removed. 
@@ -206,6 +505,13 @@ def delete_session(file_name: str) -> bool:
     history = _load_history_local()
     if file_name in history:
         del history[file_name]
+        if os.path.exists(session_data_path(file_name)):
+            os.remove(session_data_path(file_name))
+        for path in (session_journal_path(file_name), session_schema_path(file_name)):
+            if os.path.exists(path):
+                os.remove(path)
+        with _journal_lock:
+            _saved_snapshots.pop(file_name, None)
         return _save_history_local(history)
     return False
 
@@ -220,6 +526,15 @@ def rename_session(old_name: str, new_name: str) -> bool:
     history = _load_history_local()
     if old_name in history and new_name not in history:
         history[new_name] = history.pop(old_name)
+        if os.path.exists(session_data_path(old_name)):
+            os.replace(session_data_path(old_name), session_data_path(new_name))
+        if os.path.exists(session_journal_path(old_name)):
+            os.replace(session_journal_path(old_name), session_journal_path(new_name))
+        if os.path.exists(session_schema_path(old_name)):
+            os.replace(session_schema_path(old_name), session_schema_path(new_name))
+        with _journal_lock:
+            if old_name in _saved_snapshots:
+                _saved_snapshots[new_name] = _saved_snapshots.pop(old_name)
         return _save_history_local(history)
     return False
 
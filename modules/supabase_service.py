@@ -4,10 +4,12 @@ Handles all Supabase operations for cloud persistence.
 Supabase provides PostgreSQL database with REST API.
 """
 import streamlit as st
+import io
 import json
 from datetime import datetime
 import pandas as pd
 import logging
+from utils import fast_json_loads, arrow_table_to_df
 
 logger = logging.getLogger(__name__)
 
@@ -56,13 +58,62 @@ def is_cloud_mode():
 
 # ==================== INSCRIPCIONES (Sessions) ====================
 
+def _df_to_parquet_bytes(df: pd.DataFrame) -> bytes:
+    """Serialize a DataFrame to a Parquet blob (pyarrow + zstd), keeping dtypes."""
+    buf = io.BytesIO()
+    df.to_parquet(buf, engine='pyarrow', compression='zstd', index=False)
+    return buf.getvalue()
+
+def _parquet_bytes_to_df(blob: bytes) -> pd.DataFrame:
+    """Inverse of _df_to_parquet_bytes. List cells come back as Python lists."""
+    import pyarrow.parquet as pq
+    return arrow_table_to_df(pq.read_table(io.BytesIO(blob)))
+
+def _encode_bytea(blob: bytes) -> str:
+    """PostgREST expects bytea values as a '\\x' prefixed hex string."""
+    return "\\x" + blob.hex()
+
+def _decode_bytea(value) -> bytes:
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return bytes(value)
+    if isinstance(value, str) and value.startswith("\\x"):
+        return bytes.fromhex(value[2:])
+    return None
+
 def save_session(session_name: str, df: pd.DataFrame) -> tuple[bool, str]:
-    """Save an inscription session to Supabase. Returns (success, error_msg)."""
+    """
+    Save an inscription session to Supabase. Returns (success, error_msg).
+    The payload is stored as a Parquet blob in 'data_parquet' (bytea); the legacy
+    JSON 'data' column is only written if Parquet is not possible (mixed-type
+    columns) or the table has not been migrated yet.
+    """
     client = init_supabase()
     if client is None:
         return False, "Cliente Supabase no inicializado"
     
     try:
+        record = {
+            "name": session_name,
+            "timestamp": datetime.now().isoformat(),
+            "columns": list(df.columns)
+        }
+        
+        try:
+            parquet_blob = _df_to_parquet_bytes(df)
+        except Exception as e:
+            logger.warning(f"Parquet serialization failed for '{session_name}', using JSON: {e}")
+            parquet_blob = None
+        
+        if parquet_blob is not None:
+            try:
+                parquet_record = dict(record, data_parquet=_encode_bytea(parquet_blob), data=None)
+                client.table("inscripciones").upsert(parquet_record, on_conflict="name").execute()
+                logger.info(f"Session '{session_name}' saved to Supabase (parquet, {len(parquet_blob)} bytes)")
+                return True, "OK"
+            except Exception as e:
+                # Schema without 'data_parquet' (or 'data' still NOT NULL): see supabase_schema.sql
+                logger.warning(f"Parquet upsert failed for '{session_name}', using JSON: {e}")
+        
         # PANDAS TO JSON (The "Nuclear Option" for compatibility)
         # This automatically handles:
         # - NaN -> null
@@ -70,17 +121,10 @@ def save_session(session_name: str, df: pd.DataFrame) -> tuple[bool, str]:
         # - Lists inside columns
         # - Int64/Float64 complexities
         json_str = df.to_json(orient='records', date_format='iso')
-        data_list = json.loads(json_str)
-
-        data = {
-            "name": session_name,
-            "timestamp": datetime.now().isoformat(),
-            "data": data_list,
-            "columns": list(df.columns)
-        }
+        record["data"] = json.loads(json_str)
         
         # Upsert (insert or update)
-        client.table("inscripciones").upsert(data, on_conflict="name").execute()
+        client.table("inscripciones").upsert(record, on_conflict="name").execute()
         logger.info(f"Session '{session_name}' saved to Supabase")
         return True, "OK"
     except Exception as e:
@@ -97,15 +141,25 @@ def load_session(session_name: str) -> pd.DataFrame:
         result = client.table("inscripciones").select("*").eq("name", session_name).execute()
         if result.data:
             record = result.data[0]
-            df = pd.DataFrame(record["data"])
+            
+            # Preferred format: Parquet blob (dtypes preserved, no JSON parsing)
+            parquet_blob = _decode_bytea(record.get("data_parquet"))
+            if parquet_blob:
+                return _parquet_bytes_to_df(parquet_blob)
+            
+            data = record["data"]
+            if isinstance(data, (str, bytes)):
+                # Payload stored as a JSON string inside the JSONB column
+                data = fast_json_loads(data)
+            df = pd.DataFrame.from_records(data, columns=record.get("columns") or None)
             
             # Restore list columns SAFELY
             # Some strings like "[MOD: ...]" start with '[' but aren't valid JSON
             def safe_json_parse(x):
                 if isinstance(x, str) and x.startswith('[') and x.endswith(']'):
                     try:
-                        return json.loads(x)
-                    except json.JSONDecodeError:
+                        return fast_json_loads(x)
+                    except ValueError:
                         return x  # Return original string if not valid JSON
                 return x
             
@@ -203,6 +257,22 @@ def load_config(config_name: str, default: dict = None) -> dict:
         logger.error(f"Error loading config: {e}")
         return default or {}
 
+def config_version(config_name: str):
+    """updated_at of a config row (None if it doesn't exist). Unlike load_config, raises on errors."""
+    client = init_supabase()
+    if client is None:
+        raise RuntimeError("Supabase not initialized")
+    result = client.table("config").select("updated_at").eq("name", config_name).execute()
+    return result.data[0].get("updated_at") if result.data else None
+
+def fetch_config(config_name: str):
+    """Config data (None if it doesn't exist). Unlike load_config, raises on errors so callers don't cache a fallback."""
+    client = init_supabase()
+    if client is None:
+        raise RuntimeError("Supabase not initialized")
+    result = client.table("config").select("data").eq("name", config_name).execute()
+    return result.data[0].get("data") if result.data else None
+
 # ==================== LICENCIAS CACHE ====================
 
 def save_licenses_cache(licenses_db: dict, timestamp: datetime = None) -> bool:
@@ -5,6 +5,7 @@ Handles configuration persistence with Firebase (cloud) or JSON fallback (local)
 import json
 import os
 import logging
+import streamlit as st
 
 logger = logging.getLogger(__name__)
 
@@ -12,14 +13,14 @@ logger = logging.getLogger(__name__)
 try:
     from modules.supabase_service import (
         init_supabase as init_db, is_cloud_mode,
-        save_config, load_config
+        save_config, config_version, fetch_config
     )
     DB_AVAILABLE = True
 except ImportError:
     try:
         from modules.firebase_service import (
             init_firebase as init_db, is_cloud_mode,
-            save_config, load_config
+            save_config, config_version, fetch_config
         )
         DB_AVAILABLE = True
     except ImportError:
@@ -123,6 +124,36 @@ def _safe_load_json(path, default=None):
         logger.error(f"Error loading {path}: {e}")
         return default if default is not None else {}
 
+@st.cache_data(show_spinner=False)
+def _load_json_cached(path, mtime, default=None):
+    """_safe_load_json memoized per (path, mtime): editing the file invalidates the entry."""
+    return _safe_load_json(path, default)
+
+def _load_json(path, default=None):
+    mtime = os.path.getmtime(path) if os.path.exists(path) else None
+    return _load_json_cached(path, mtime, default)
+
+@st.cache_data(show_spinner=False, max_entries=32)
+def _fetch_config_cached(config_name, version):
+    """
+    fetch_config memoized per (name, updated_at): edits from any instance change the key.
+    fetch_config raises on errors, so a failed read is never cached.
+    """
+    return fetch_config(config_name)
+
+def _load_config_cached(config_name, default=None):
+    """Cloud config: a tiny updated_at query per call, the full row only when it changed."""
+    try:
+        data = _fetch_config_cached(config_name, config_version(config_name))
+    except Exception as e:
+        logger.error(f"Error loading config '{config_name}': {e}")
+        return default or {}
+    return data if data is not None else (default or {})
+
+def _clear_config_cache():
+    _fetch_config_cached.clear()
+    _load_json_cached.clear()
+
 def _safe_save_json(path, data):
     try:
         dir_name = os.path.dirname(path)
@@ -163,52 +194,61 @@ class RulesManager:
     def load_rules(self) -> dict:
         self._init_db_if_needed()
         if DB_AVAILABLE and is_cloud_mode():
-            data = load_config("rules", DEFAULT_RULES_CONFIG)
+            data = _load_config_cached("rules", DEFAULT_RULES_CONFIG)
             if "rules" in data:
                 return data["rules"]
             return data if data else DEFAULT_RULES_CONFIG
-        return _safe_load_json(RULES_FILE, DEFAULT_RULES_CONFIG)
+        return _load_json(RULES_FILE, DEFAULT_RULES_CONFIG)
     
     def save_rules(self, rules: dict) -> bool:
         self._init_db_if_needed()
         logger.info(f"Saving rules configuration... Keys: {list(rules.keys())}")
         if DB_AVAILABLE and is_cloud_mode():
-            return save_config("rules", {"rules": rules})
-        return _safe_save_json(RULES_FILE, rules)
+            ok = save_config("rules", {"rules": rules})
+        else:
+            ok = _safe_save_json(RULES_FILE, rules)
+        _clear_config_cache()
+        return ok
     
     # ==================== EQUIVALENCES ====================
     
     def load_equivalences(self) -> dict:
         self._init_db_if_needed()
         if DB_AVAILABLE and is_cloud_mode():
-            data = load_config("equivalences", DEFAULT_EQUIVALENCES)
+            data = _load_config_cached("equivalences", DEFAULT_EQUIVALENCES)
             if "equivalences" in data:
                 return data["equivalences"]
             return data if data else DEFAULT_EQUIVALENCES
-        return _safe_load_json(EQUIVALENCES_FILE, DEFAULT_EQUIVALENCES)
+        return _load_json(EQUIVALENCES_FILE, DEFAULT_EQUIVALENCES)
     
     def save_equivalences(self, eq_data: dict) -> bool:
         self._init_db_if_needed()
         if DB_AVAILABLE and is_cloud_mode():
-            return save_config("equivalences", {"equivalences": eq_data})
-        return _safe_save_json(EQUIVALENCES_FILE, eq_data)
+            ok = save_config("equivalences", {"equivalences": eq_data})
+        else:
+            ok = _safe_save_json(EQUIVALENCES_FILE, eq_data)
+        _clear_config_cache()
+        return ok
     
     # ==================== TEAM CATEGORIES ====================
     
     def load_team_categories(self) -> dict:
         self._init_db_if_needed()
         if DB_AVAILABLE and is_cloud_mode():
-            data = load_config("team_categories", {})
+            data = _load_config_cached("team_categories", {})
             if "categories" in data:
                 return data["categories"]
             return data if data else {}
-        return _safe_load_json(CATEGORIES_FILE, {})
+        return _load_json(CATEGORIES_FILE, {})
     
     def save_team_categories(self, categories: dict) -> bool:
         self._init_db_if_needed()
         if DB_AVAILABLE and is_cloud_mode():
-            return save_config("team_categories", {"categories": categories})
-        return _safe_save_json(CATEGORIES_FILE, categories)
+            ok = save_config("team_categories", {"categories": categories})
+        else:
+            ok = _safe_save_json(CATEGORIES_FILE, categories)
+        _clear_config_cache()
+        return ok
     
     # ==================== UTILITIES ====================
     
@@ -5,10 +5,68 @@
 CREATE TABLE IF NOT EXISTS inscripciones (
     name TEXT PRIMARY KEY,
     timestamp TIMESTAMPTZ DEFAULT NOW(),
-    data JSONB NOT NULL,
+    data JSONB,              -- Legacy JSON payload (read-only fallback)
+    data_parquet BYTEA,      -- Parquet (zstd) payload written by the app
     columns JSONB
 );
 
+-- Migration for existing databases (Parquet payload)
+ALTER TABLE inscripciones ADD COLUMN IF NOT EXISTS data_parquet BYTEA;
+ALTER TABLE inscripciones ALTER COLUMN data DROP NOT NULL;
+
+-- Function: inspect_session (diagnostics, used by _debug_tools/inspect_session.py)
+-- Returns shape/preview of a session payload computed server-side, so the
+-- multi-MB 'data'/'data_parquet' values never travel over the network.
+DROP FUNCTION IF EXISTS inspect_session(TEXT);
+CREATE OR REPLACE FUNCTION inspect_session(session_name TEXT)
+RETURNS TABLE (
+    name TEXT,
+    dtype TEXT,
+    n INTEGER,
+    preview BYTEA,
+    first_keys TEXT[],
+    parquet_bytes INTEGER,
+    columns JSONB
+)
+LANGUAGE sql STABLE AS $$
+    SELECT
+        i.name,
+        jsonb_typeof(i.data),
+        CASE jsonb_typeof(i.data)
+            WHEN 'array' THEN jsonb_array_length(i.data)
+            WHEN 'string' THEN octet_length(i.data #>> '{}')
+        END,
+        -- Raw UTF-8 bytes: the client decodes them without a full string round-trip
+        CASE jsonb_typeof(i.data)
+            WHEN 'string' THEN substring(convert_to(i.data #>> '{}', 'UTF8') FROM 1 FOR 200)
+            ELSE substring(convert_to(i.data::text, 'UTF8') FROM 1 FOR 200)
+        END,
+        -- Only needed when the 'columns' metadata is missing (old rows)
+        CASE WHEN i.columns IS NULL AND jsonb_typeof(i.data) = 'array' AND jsonb_typeof(i.data -> 0) = 'object'
+            THEN ARRAY(SELECT jsonb_object_keys(i.data -> 0))
+        END,
+        octet_length(i.data_parquet),
+        i.columns
+    FROM inscripciones i
+    WHERE i.name = session_name;
+$$;
+
+-- Function: save_and_return_history (diagnostics, used by _debug_tools/trace_save.py)
+-- Upserts a parquet session and returns the stored row in the same call,
+-- so save + verify costs a single HTTP round-trip.
+CREATE OR REPLACE FUNCTION save_and_return_history(session_name TEXT, session_columns JSONB, payload BYTEA)
+RETURNS SETOF inscripciones
+LANGUAGE sql VOLATILE AS $$
+    INSERT INTO inscripciones (name, timestamp, columns, data_parquet, data)
+    VALUES (session_name, NOW(), session_columns, payload, NULL)
+    ON CONFLICT (name) DO UPDATE
+        SET timestamp = EXCLUDED.timestamp,
+            columns = EXCLUDED.columns,
+            data_parquet = EXCLUDED.data_parquet,
+            data = NULL
+    RETURNING *;
+$$;
+
 -- Table: config (Rules, equivalences, categories)
 CREATE TABLE IF NOT EXISTS config (
     name TEXT PRIMARY KEY,
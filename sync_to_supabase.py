@@ -20,6 +20,7 @@ sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 # Intentar importar servicios
 try:
     from modules.supabase_service import init_supabase, save_session
+    from modules.state import load_session_data_local
 except ImportError:
     print("❌ Error: No se pudieron importar los módulos. Ejecuta desde la raíz del proyecto.")
     sys.exit(1)
@@ -75,14 +76,16 @@ def main():
         print(f"\n📤 Procesando sesión: '{session_name}'")
         session_data = local_data[session_name]
         
-        if 'data' not in session_data:
-            print(f"   ⚠️ Saltando (formato inválido)")
-            continue
-            
-        records = session_data['data']
         # Convert to DataFrame to re-use save_session logic logic (which handles formatting)
         try:
-            df = pd.DataFrame(records)
+            if 'data' in session_data:
+                df = pd.DataFrame(session_data['data'])
+            else:
+                # Entrada solo con metadatos: los datos están en la copia Parquet local
+                df = load_session_data_local(session_name)
+                if df is None:
+                    print(f"   ⚠️ Saltando (sin datos locales)")
+                    continue
             print(f"   Records: {len(df)}")
             
             # Subida
@@ -4,8 +4,35 @@ import shutil
 import tempfile
 import logging
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 logger = logging.getLogger(__name__)
 
+def fast_json_loads(data):
+    """
+    Parses JSON text (str or bytes). Uses orjson (C extension) when installed,
+    falling back to the stdlib. Both raise a ValueError subclass on bad input.
+    """
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+def arrow_table_to_df(table):
+    """
+    Converts a pyarrow Table (e.g. read from Parquet) to a DataFrame.
+    Arrow list columns (e.g. 'Errores_Datos') come back as Python lists, not numpy arrays.
+    """
+    import pyarrow as pa
+    
+    list_cols = [f.name for f in table.schema if pa.types.is_list(f.type) or pa.types.is_large_list(f.type)]
+    df = table.to_pandas(split_blocks=True, self_destruct=True)
+    for col in list_cols:
+        df[col] = df[col].map(lambda x: list(x) if x is not None else [])
+    return df
+
 def safe_save_json(path, data):
     """
     Saves a dictionary to a JSON file atomically.